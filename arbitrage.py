@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Cross-server arbitrage for Wurm Online Market Tracker
+Estatísticas de preço por (item, servidor) atualizadas a cada lote salvo e top-k dos maiores spreads
+"""
+
+import heapq
+import json
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from models import MarketItem
+from storage import listing_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARBITRAGE_CONFIG = {
+    "enabled": True,
+    "top_k": 50,
+    "window": 32,        # Anúncios vivos mais recentes considerados por (item, servidor)
+    "min_listings": 2,   # Anúncios mínimos de cada lado para entrar no ranking
+    "min_price": 0.01,
+}
+
+
+def ensure_arbitrage_schema(conn: sqlite3.Connection, config: Optional[Dict] = None):
+    """Cria as tabelas; config (o do scraper) define os servidores aceitos na limpeza"""
+    config = config or {}
+    fresh = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'arbitrage_listings'").fetchone()
+    # Preço atual de cada anúncio ativo: o mesmo anúncio revisto substitui o preço em vez de contar de novo
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arbitrage_listings (
+            listing_key INTEGER PRIMARY KEY,
+            item_key TEXT NOT NULL,
+            server TEXT NOT NULL,
+            price REAL NOT NULL,
+            seen INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_arbitrage_listings_group ON arbitrage_listings(item_key, server, seen)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arbitrage_stats (
+            item_key TEXT NOT NULL,
+            server TEXT NOT NULL,
+            name TEXT,
+            count INTEGER NOT NULL,
+            min_ask REAL,
+            median REAL,
+            recent_prices TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (item_key, server)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arbitrage_spreads (
+            item_key TEXT PRIMARY KEY,
+            name TEXT,
+            buy_server TEXT,
+            buy_price REAL,
+            sell_server TEXT,
+            sell_median REAL,
+            spread REAL,
+            ratio REAL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_arbitrage_spread ON arbitrage_spreads(spread)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arbitrage_top (
+            rank INTEGER PRIMARY KEY,
+            item_key TEXT,
+            name TEXT,
+            buy_server TEXT,
+            buy_price REAL,
+            sell_server TEXT,
+            sell_median REAL,
+            spread REAL,
+            ratio REAL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if fresh and conn.execute("SELECT 1 FROM arbitrage_stats LIMIT 1").fetchone():
+        # Estatísticas antigas contavam cada revisita como observação nova: descarta e deixa reconstruir
+        for table in ("arbitrage_stats", "arbitrage_spreads", "arbitrage_top"):
+            conn.execute(f"DELETE FROM {table}")
+        logger.warning("Arbitrage stats reset to per-listing tracking; run 'arbitrage --rebuild' to refill now")
+    ArbitrageEngine(config.get("arbitrage"), config.get("servers")).purge_servers(conn)
+    conn.commit()
+
+
+def item_key(name: str) -> str:
+    """Chave do item para comparação entre servidores"""
+    return " ".join(name.lower().split())
+
+
+class ServerStats:
+    """Anúncios vivos de um (item, servidor): total, menor preço e mediana da janela recente"""
+
+    __slots__ = ("count", "min_ask", "median")
+
+    def __init__(self, count: int, min_ask: float, median: float):
+        self.count = count
+        self.min_ask = min_ask
+        self.median = median
+
+    @classmethod
+    def from_prices(cls, count: int, recent: List[float]) -> "ServerStats":
+        values, mid = sorted(recent), len(recent) // 2
+        return cls(count, values[0], values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2)
+
+
+class ArbitrageEngine:
+    """Mantém estatísticas por (item, servidor) e o top-k de spreads entre servidores
+
+    Cada anúncio ativo entra uma vez, pela listing_key, em arbitrage_listings:
+    revisto com outro preço, só troca o preço; expirado ou sumido da página
+    (retract, via listeners de retirada), sai. As estatísticas de um (item,
+    servidor) são os preços dos `window` anúncios que receberam preço mais
+    recentemente (lidos com LIMIT pelo índice) e o total de anúncios vivos,
+    mantido por deltas na ingestão e recontado só na retirada.
+
+    O spread de um item é a mediana mais alta entre os servidores menos o
+    menor preço pedido em outro servidor (compra barato num, vende no outro).
+    A cada lote só os grupos cujos anúncios mudaram são recalculados; o
+    top-k é refeito com heapq.nlargest sobre (top atual + itens alterados),
+    e só volta à tabela inteira de spreads quando um item do top piora. O
+    resultado fica materializado em arbitrage_top, lido pela API em O(k).
+    """
+
+    def __init__(self, config: Optional[Dict] = None, servers: Optional[Iterable[str]] = None):
+        self.config = dict(DEFAULT_ARBITRAGE_CONFIG, **(config or {}))
+        # Só servidores conhecidos; sem lista, ao menos descarta "unknown"/vazio (não é um mercado)
+        self.servers = set(servers) if servers else None
+
+    def accepts(self, server: Optional[str]) -> bool:
+        if self.servers is not None:
+            return server in self.servers
+        return bool(server) and server.lower() != "unknown"
+
+    def purge_servers(self, conn: sqlite3.Connection) -> int:
+        """Remove anúncios e estatísticas de servidores não aceitos (gravados antes do filtro)"""
+        groups = {
+            group for group in conn.execute(
+                "SELECT DISTINCT item_key, server FROM arbitrage_listings "
+                "UNION SELECT item_key, server FROM arbitrage_stats")
+            if not self.accepts(group[1])
+        }
+        if not groups:
+            return 0
+        conn.executemany("DELETE FROM arbitrage_listings WHERE item_key = ? AND server = ?", list(groups))
+        # Sem anúncios, refresh apaga as estatísticas do grupo e recalcula o spread do item
+        self.refresh(conn, groups, {})
+        logger.info(f"Dropped arbitrage stats for {len(groups)} (item, server) groups on unlisted servers")
+        return len(groups)
+
+    def observe(self, conn: sqlite3.Connection, items: Iterable[MarketItem]):
+        """Listener de ingestão: grava o preço atual de cada anúncio e atualiza o ranking"""
+        min_price = self.config["min_price"]
+        listings: Dict[int, Tuple[str, str, float]] = {}
+        names: Dict[str, str] = {}
+        for item in items:
+            if item.status == 'active' and item.price and item.price >= min_price and self.accepts(item.server):
+                key = item_key(item.name)
+                listings[listing_key(item.name, item.seller, item.url)] = (key, item.server, float(item.price))
+                names[key] = item.name
+        if not listings:
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = self.load_listings(conn, list(listings))
+            # Revisita com o mesmo preço não muda nada; só anúncios novos ou alterados são gravados
+            changed = {key: listing for key, listing in listings.items() if previous.get(key) != listing}
+            # Grupos a recalcular e variação do total de anúncios de cada um (preço novo no mesmo grupo: 0)
+            deltas: Dict[Tuple[str, str], int] = defaultdict(int)
+            for key, listing in changed.items():
+                old = previous.get(key)
+                if old is not None:
+                    deltas[old[:2]] -= 1
+                deltas[listing[:2]] += 1
+            if changed:
+                seen = int(time.time())
+                conn.executemany('''
+                    INSERT INTO arbitrage_listings (listing_key, item_key, server, price, seen) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(listing_key) DO UPDATE SET
+                        item_key = excluded.item_key, server = excluded.server,
+                        price = excluded.price, seen = excluded.seen
+                ''', [(key, *listing, seen) for key, listing in changed.items()])
+                self.refresh(conn, set(deltas), names, deltas)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def retract(self, conn: sqlite3.Connection, keys: List[int]):
+        """Listener de retirada: anúncios expirados/vendidos saem das estatísticas"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = self.load_listings(conn, keys)
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                conn.execute(f"DELETE FROM arbitrage_listings WHERE listing_key IN ({', '.join('?' * len(chunk))})",
+                             chunk)
+            if previous:
+                self.refresh(conn, {listing[:2] for listing in previous.values()}, {})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def load_listings(self, conn: sqlite3.Connection, keys: List[int]) -> Dict[int, Tuple[str, str, float]]:
+        listings = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for key, group, server, price in conn.execute(f'''
+                SELECT listing_key, item_key, server, price FROM arbitrage_listings
+                WHERE listing_key IN ({", ".join("?" * len(chunk))})
+            ''', chunk):
+                listings[key] = (group, server, price)
+        return listings
+
+    def load_stats(self, conn: sqlite3.Connection, keys: List[str]) -> Tuple[Dict[str, Dict[str, ServerStats]], Dict]:
+        stats: Dict[str, Dict[str, ServerStats]] = defaultdict(dict)
+        names = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(f'''
+                SELECT item_key, server, name, count, min_ask, median FROM arbitrage_stats
+                WHERE item_key IN ({", ".join("?" * len(chunk))})
+            ''', chunk)
+            for key, server, name, count, min_ask, median in rows:
+                stats[key][server] = ServerStats(count, min_ask, median)
+                names[key] = name
+        return stats, names
+
+    def refresh(self, conn: sqlite3.Connection, groups: Set[Tuple[str, str]], names: Dict[str, str],
+                deltas: Optional[Dict[Tuple[str, str], int]] = None) -> Dict:
+        """Recalcula os (item, servidor) tocados a partir dos anúncios vivos; retorna {item_key: spread ou None}
+
+        Com deltas, o total de anúncios do grupo é o gravado mais o delta;
+        sem (retirada, limpeza), é recontado com COUNT pelo índice.
+        """
+        window = self.config["window"]
+        keys = sorted({key for key, _ in groups})
+        stats, stored_names = self.load_stats(conn, keys)
+        names = dict(stored_names, **names)
+        upserts, deletes = [], []
+        for key, server in groups:
+            # Ordem do índice (item_key, server, seen, listing_key): lê só a janela
+            prices = [row[0] for row in conn.execute('''
+                SELECT price FROM arbitrage_listings WHERE item_key = ? AND server = ?
+                ORDER BY seen DESC, listing_key DESC LIMIT ?
+            ''', (key, server, window))]
+            if not prices:
+                stats[key].pop(server, None)
+                deletes.append((key, server))
+                continue
+            if deltas is None:
+                count = conn.execute("SELECT COUNT(*) FROM arbitrage_listings WHERE item_key = ? AND server = ?",
+                                     (key, server)).fetchone()[0]
+            else:
+                stored = stats[key].get(server)
+                count = max(len(prices), (stored.count if stored else 0) + deltas.get((key, server), 0))
+            s = stats[key][server] = ServerStats.from_prices(count, prices)
+            upserts.append((key, server, names.get(key, key), s.count, s.min_ask, s.median, json.dumps(prices)))
+
+        conn.executemany("DELETE FROM arbitrage_stats WHERE item_key = ? AND server = ?", deletes)
+        conn.executemany('''
+            INSERT INTO arbitrage_stats (item_key, server, name, count, min_ask, median, recent_prices)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(item_key, server) DO UPDATE SET
+                name = excluded.name, count = excluded.count, min_ask = excluded.min_ask,
+                median = excluded.median, recent_prices = excluded.recent_prices, updated_at = CURRENT_TIMESTAMP
+        ''', upserts)
+
+        spreads = {key: self.best_spread(key, names.get(key, key), stats[key]) for key in keys}
+        conn.executemany("DELETE FROM arbitrage_spreads WHERE item_key = ?",
+                         [(key,) for key, row in spreads.items() if row is None])
+        conn.executemany('''
+            INSERT OR REPLACE INTO arbitrage_spreads (
+                item_key, name, buy_server, buy_price, sell_server, sell_median, spread, ratio
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row for row in spreads.values() if row is not None])
+        self.update_top(conn, spreads)
+        return spreads
+
+    def best_spread(self, key: str, name: str, servers: Dict[str, ServerStats]) -> Optional[tuple]:
+        """Melhor par (compra, venda) do item entre servidores diferentes"""
+        window, min_listings = self.config["window"], self.config["min_listings"]
+        eligible = [(server, s) for server, s in servers.items() if min(s.count, window) >= min_listings]
+        if len(eligible) < 2:
+            return None
+        by_ask = sorted(eligible, key=lambda pair: pair[1].min_ask)[:2]
+        by_median = sorted(eligible, key=lambda pair: pair[1].median, reverse=True)[:2]
+        best = None
+        for buy_server, buy in by_ask:
+            for sell_server, sell in by_median:
+                if buy_server == sell_server:
+                    continue
+                spread = sell.median - buy.min_ask
+                if best is None or spread > best[6]:
+                    best = (key, name, buy_server, buy.min_ask, sell_server, sell.median,
+                            round(spread, 4), round(spread / buy.min_ask, 4))
+        if best is None or best[6] <= 0:
+            return None
+        return best
+
+    def update_top(self, conn: sqlite3.Connection, spreads: Dict[str, Optional[tuple]]):
+        k = self.config["top_k"]
+        current = {row[1]: row[1:] for row in conn.execute('''
+            SELECT rank, item_key, name, buy_server, buy_price, sell_server, sell_median, spread, ratio
+            FROM arbitrage_top ORDER BY rank
+        ''')}
+        # Item do top que piorou ou sumiu: algum de fora pode ter passado à frente
+        worsened = any(
+            key in current and (row is None or row[6] < current[key][6])
+            for key, row in spreads.items()
+        )
+        if worsened or len(current) < k:
+            top = conn.execute('''
+                SELECT item_key, name, buy_server, buy_price, sell_server, sell_median, spread, ratio
+                FROM arbitrage_spreads ORDER BY spread DESC LIMIT ?
+            ''', (k,)).fetchall()
+        else:
+            candidates = dict(current)
+            candidates.update((key, row) for key, row in spreads.items() if row is not None)
+            top = heapq.nlargest(k, candidates.values(), key=lambda row: row[6])
+
+        conn.execute("DELETE FROM arbitrage_top")
+        conn.executemany('''
+            INSERT INTO arbitrage_top (
+                rank, item_key, name, buy_server, buy_price, sell_server, sell_median, spread, ratio
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(rank, *row) for rank, row in enumerate(top, 1)])
+
+    def rebuild(self, conn: sqlite3.Connection, batch_size: int = 5000) -> int:
+        """Recalcula tudo a partir dos anúncios ativos (ex.: depois de uma reextração)"""
+        for table in ("arbitrage_listings", "arbitrage_stats", "arbitrage_spreads", "arbitrage_top"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        rows = conn.execute('''
+            SELECT name, price, server, seller, url FROM market_items
+            WHERE status = 'active' ORDER BY updated_epoch, id
+        ''').fetchall()
+        for start in range(0, len(rows), batch_size):
+            self.observe(conn, [
+                MarketItem(name=name, category="", price=price, server=server, seller=seller, url=url)
+                for name, price, server, seller, url in rows[start:start + batch_size]
+            ])
+        return len(rows)
+
+
+def top_spreads(conn: sqlite3.Connection, limit: int = 50, server: Optional[str] = None,
+                min_ratio: float = 0.0) -> List[Dict]:
+    """Leitura do ranking materializado (O(k))"""
+    query = "SELECT * FROM arbitrage_top WHERE ratio >= ?"
+    params: list = [min_ratio]
+    if server:
+        query += " AND (buy_server = ? OR sell_server = ?)"
+        params.extend([server, server])
+    query += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    columns = ("rank", "item_key", "name", "buy_server", "buy_price", "sell_server",
+               "sell_median", "spread", "ratio", "updated_at")
+    return [dict(zip(columns, row)) for row in conn.execute(query, params)]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Archival for Wurm Online Market Tracker
+Move anúncios encerrados (expirados, vendidos) para tabelas mensais de arquivo e recupera espaço aos poucos
+"""
+
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "market_items_archive_"
+HISTORY_VIEW = "market_items_history"
+ARCHIVE_SCHEMA = "archive"
+# Status terminais: expiração ('expired') e diff de snapshot ('sold' ou o disappeared_status configurado)
+RETIRED_STATUSES = ("expired", "sold", "withdrawn")
+
+
+def retired_statuses(config: Dict) -> tuple:
+    """Status arquiváveis, incluindo o disappeared_status do crawl_diff"""
+    extra = (config.get("crawl_diff") or {}).get("disappeared_status")
+    return RETIRED_STATUSES + ((extra,) if extra and extra not in RETIRED_STATUSES and extra != "active" else ())
+
+
+class MarketArchiver:
+    """Move linhas encerradas (status em statuses) de market_items para market_items_archive_YYYYMM
+
+    As tabelas de arquivo ficam no próprio banco ou, se configurado, em um
+    arquivo SQLite separado anexado com ATTACH. A view market_items_history
+    une a tabela quente com todos os meses arquivados.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, config: Optional[Dict] = None,
+                 statuses: tuple = RETIRED_STATUSES):
+        config = config or {}
+        self.conn = conn
+        self.statuses = tuple(statuses)
+        self.batch_size = int(config.get("batch_size", 2000))
+        self.min_age_days = int(config.get("min_age_days", 7))
+        self.vacuum_pages = int(config.get("vacuum_pages", 2000))
+        self.archive_path = config.get("database_path") or ""
+        self.schema = attach_archive(conn, self.archive_path)
+
+    def ensure_incremental_vacuum(self):
+        """Habilita auto_vacuum=INCREMENTAL (exige um VACUUM completo uma única vez)"""
+        mode = self.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            logger.info("Converting database to incremental auto_vacuum (one-time VACUUM)")
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("VACUUM")
+
+    def archive_table_name(self, month: str) -> str:
+        """Nome qualificado da tabela de arquivo de um mês (YYYYMM)"""
+        return f"{self.schema}.{ARCHIVE_PREFIX}{month}"
+
+    def ensure_archive_table(self, month: str):
+        """Cria a tabela de arquivo do mês com as colunas atuais de market_items"""
+        columns = market_item_columns(self.conn)
+        column_defs = ", ".join(
+            f"{name} {col_type}".strip() for name, col_type in columns
+        )
+        self.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {self.archive_table_name(month)} (
+                {column_defs},
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Migrações posteriores de market_items adicionam colunas também no arquivo
+        existing = {row[1] for row in self.conn.execute(
+            f"PRAGMA {self.schema}.table_info({ARCHIVE_PREFIX}{month})")}
+        for name, col_type in columns:
+            if name not in existing:
+                self.conn.execute(
+                    f"ALTER TABLE {self.archive_table_name(month)} ADD COLUMN {name} {col_type}")
+
+    def archive_retired(self, max_batches: Optional[int] = None) -> int:
+        """Move linhas encerradas (expiradas, vendidas...) em lotes, com um commit por lote"""
+        cutoff = int(time.time()) - self.min_age_days * 86400
+        columns = ", ".join(name for name, _ in market_item_columns(self.conn))
+
+        self.conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS archive_batch (
+                id INTEGER PRIMARY KEY, month TEXT
+            )
+        ''')
+
+        placeholders = ", ".join("?" * len(self.statuses))
+        total = 0
+        batches = 0
+        created_tables = False
+        while max_batches is None or batches < max_batches:
+            self.conn.execute(f'''
+                INSERT INTO temp.archive_batch (id, month)
+                SELECT id, COALESCE(strftime('%Y%m', updated_at), '000000')
+                FROM market_items
+                WHERE status IN ({placeholders}) AND updated_epoch < ?
+                ORDER BY updated_epoch
+                LIMIT ?
+            ''', (*self.statuses, cutoff, self.batch_size))
+            months = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT month FROM temp.archive_batch")]
+            if not months:
+                self.conn.commit()
+                break
+
+            for month in months:
+                if not table_exists(self.conn, self.schema, f"{ARCHIVE_PREFIX}{month}"):
+                    created_tables = True
+                self.ensure_archive_table(month)
+                self.conn.execute(f'''
+                    INSERT INTO {self.archive_table_name(month)} ({columns})
+                    SELECT {columns} FROM market_items
+                    WHERE id IN (SELECT id FROM temp.archive_batch WHERE month = ?)
+                ''', (month,))
+
+            moved = self.conn.execute(
+                "DELETE FROM market_items WHERE id IN (SELECT id FROM temp.archive_batch)"
+            ).rowcount
+            self.conn.execute("DELETE FROM temp.archive_batch")
+            self.conn.commit()
+
+            total += moved
+            batches += 1
+            self.incremental_vacuum()
+
+        if created_tables or not view_exists(self.conn, HISTORY_VIEW):
+            self.create_history_view()
+
+        logger.info(f"Archived {total} retired items ({', '.join(self.statuses)}) in {batches} batches")
+        return total
+
+    def incremental_vacuum(self):
+        """Libera até vacuum_pages páginas livres, sem bloquear o banco inteiro"""
+        self.conn.execute(f"PRAGMA main.incremental_vacuum({self.vacuum_pages})")
+        if self.schema != "main":
+            self.conn.execute(f"PRAGMA {self.schema}.incremental_vacuum({self.vacuum_pages})")
+
+    def archive_months(self) -> List[str]:
+        """Meses (YYYYMM) com tabela de arquivo"""
+        rows = self.conn.execute(
+            f"SELECT name FROM {self.schema}.sqlite_master WHERE type = 'table' AND name LIKE ?",
+            (ARCHIVE_PREFIX + '%',)
+        ).fetchall()
+        return sorted(row[0][len(ARCHIVE_PREFIX):] for row in rows)
+
+    def create_history_view(self):
+        """(Re)cria a view market_items_history unindo tabela quente e arquivo"""
+        create_history_view(self.conn, self.schema)
+
+
+def attach_archive(conn: sqlite3.Connection, archive_path: str) -> str:
+    """Anexa o banco de arquivo, se houver, e retorna o schema a usar"""
+    if not archive_path:
+        return "main"
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    if ARCHIVE_SCHEMA not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path,))
+        mode = conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.auto_vacuum").fetchone()[0]
+        if mode != 2:
+            conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.auto_vacuum = INCREMENTAL")
+    return ARCHIVE_SCHEMA
+
+
+def create_history_view(conn: sqlite3.Connection, schema: str = "main"):
+    """Cria a view de histórico; com arquivo anexado ela precisa ser TEMP"""
+    columns = [name for name, _ in market_item_columns(conn)]
+    selects = [f"SELECT {', '.join(columns)}, NULL AS archived_at FROM main.market_items"]
+
+    tables = conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name",
+        (ARCHIVE_PREFIX + '%',)
+    ).fetchall()
+    for (table,) in tables:
+        if not re.fullmatch(ARCHIVE_PREFIX + r"\d{6}", table):
+            continue
+        existing = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+        projected = ", ".join(name if name in existing else f"NULL AS {name}" for name in columns)
+        selects.append(f"SELECT {projected}, archived_at FROM {schema}.{table}")
+
+    # Nome qualificado: a TEMP sombreia a view de main (que pode estar num snapshot somente-leitura) sem tocá-la
+    target = "temp" if schema != "main" else "main"
+    conn.execute(f"DROP VIEW IF EXISTS {target}.{HISTORY_VIEW}")
+    conn.execute(f"CREATE VIEW {target}.{HISTORY_VIEW} AS " + " UNION ALL ".join(selects))
+    conn.commit()
+
+
+def open_history(conn: sqlite3.Connection, archive_path: str = "") -> str:
+    """Prepara uma conexão para consultar market_items_history"""
+    schema = attach_archive(conn, archive_path)
+    if schema != "main" or not view_exists(conn, HISTORY_VIEW):
+        create_history_view(conn, schema)
+    return HISTORY_VIEW
+
+
+def market_item_columns(conn: sqlite3.Connection) -> List[tuple]:
+    """(nome, tipo) das colunas atuais de market_items"""
+    return [(row[1], row[2]) for row in conn.execute("PRAGMA main.table_info(market_items)")]
+
+
+def table_exists(conn: sqlite3.Connection, schema: str, name: str) -> bool:
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def view_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ? "
+        "UNION ALL SELECT 1 FROM sqlite_temp_master WHERE type = 'view' AND name = ?",
+        (name, name)
+    ).fetchone() is not None
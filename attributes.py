@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Item attributes for Wurm Online Market Tracker
+Extração tipada de QL, raridade e encantamentos, gravada em item_attributes com índices compostos
+"""
+
+import logging
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import MarketItem
+
+logger = logging.getLogger(__name__)
+
+ENCHANT_RE = re.compile(r"([a-z][a-z ]*?)\s*(\d{1,3})\b")
+
+# Nomes completos -> abreviações usadas nos anúncios
+ENCHANT_ALIASES = {
+    "wind of ages": "woa",
+    "circle of cunning": "coc",
+    "aura of shared pain": "aosp",
+    "blessings of the dark": "botd",
+    "bloodthirst": "bt",
+    "flaming aura": "fa",
+    "frostbrand": "fb",
+    "nimbleness": "nimb",
+    "mind stealer": "ms",
+    "life transfer": "lt",
+    "rotting touch": "rt",
+    "web armour": "wa",
+    "web armor": "wa",
+}
+
+# Raridade -> nível (busca por faixa: rarity_min=2 pega supreme e fantastic)
+RARITY_TIERS = {"rare": 1, "supreme": 2, "fantastic": 3}
+RARITY_RE = re.compile(r"\b(rare|supreme|fantastic)\b", re.IGNORECASE)
+
+DEFAULT_QUALITY_PATTERNS = ["ql ?([0-9]+)", "quality ?([0-9]+)", "q([0-9]+)"]
+
+# Uma linha por (anúncio, atributo, valor): ('ql', '', 87), ('enchant', 'woa', 90), ('rarity', 'rare', 1)
+AttributeRow = Tuple[str, str, float]
+
+
+def parse_enchantments(*texts: Optional[str]) -> Dict[str, int]:
+    """{abreviação: poder} a partir de textos como "woa 90, Circle of Cunning 45" """
+    found: Dict[str, int] = {}
+    for text in texts:
+        if not text:
+            continue
+        lowered = text.lower()
+        for full, short in ENCHANT_ALIASES.items():
+            lowered = lowered.replace(full, short)
+        for name, power in ENCHANT_RE.findall(lowered):
+            name = name.split()[-1]  # "pickaxe woa 90" -> "woa"
+            if name in ENCHANT_ALIASES.values():
+                found[name] = max(found.get(name, 0), int(power))
+    return found
+
+
+def format_enchantments(enchantments: Dict[str, int]) -> Optional[str]:
+    """Forma canônica gravada em market_items.enchantments ("woa 90, coc 80")"""
+    if not enchantments:
+        return None
+    return ", ".join(f"{name} {power}" for name, power in sorted(enchantments.items()))
+
+
+def rarity_of(*texts: Optional[str]) -> Optional[str]:
+    """Maior raridade mencionada nos textos"""
+    best = None
+    for text in texts:
+        for match in RARITY_RE.finditer(text or ""):
+            rarity = match.group(1).lower()
+            if best is None or RARITY_TIERS[rarity] > RARITY_TIERS[best]:
+                best = rarity
+    return best
+
+
+class AttributeExtractor:
+    """Extrai atributos de um trecho de anúncio com os padrões do config
+
+    config["quality_patterns"] dá a QL (primeiro grupo numérico, 0-100);
+    config["enchantment_patterns"] com grupo dão o poder do encantamento
+    nomeado pelo prefixo do padrão ("woa ?([0-9]+)" -> woa), e os nomes
+    completos de ENCHANT_ALIASES também são reconhecidos.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        # \b evita que "q([0-9]+)" case no meio de palavras ("aq5", "seq12")
+        self.quality_patterns = [
+            re.compile(rf"\b{pattern}\b", re.IGNORECASE)
+            for pattern in config.get("quality_patterns", DEFAULT_QUALITY_PATTERNS)
+        ]
+        self.enchant_patterns = []
+        for pattern in config.get("enchantment_patterns", []):
+            compiled = re.compile(rf"\b{pattern}\b", re.IGNORECASE)
+            if compiled.groups:
+                name = re.match(r"[a-z]+", pattern.lower())
+                if name:
+                    self.enchant_patterns.append((ENCHANT_ALIASES.get(name.group(0), name.group(0)), compiled))
+
+    def quality(self, text: str) -> Optional[float]:
+        for pattern in self.quality_patterns:
+            match = pattern.search(text)
+            if match:
+                value = float(match.group(1))
+                if 0 <= value <= 100:
+                    return value
+        return None
+
+    def enchantments(self, text: str) -> Dict[str, int]:
+        found = parse_enchantments(text)
+        for name, pattern in self.enchant_patterns:
+            for match in pattern.finditer(text):
+                power = int(match.group(1))
+                if power <= 120:
+                    found[name] = max(found.get(name, 0), power)
+        return found
+
+    def extract(self, text: str) -> Dict:
+        """{'quality', 'enchantments' (texto canônico), 'rarity'} de um trecho"""
+        quality = self.quality(text)
+        return {
+            'quality': int(quality) if quality is not None else None,
+            'enchantments': format_enchantments(self.enchantments(text)),
+            'rarity': rarity_of(text),
+        }
+
+
+def item_attributes(item: MarketItem) -> List[AttributeRow]:
+    """Linhas de item_attributes de um item a partir das colunas já normalizadas"""
+    rows: List[AttributeRow] = []
+    if item.quality is not None:
+        rows.append(('ql', '', float(item.quality)))
+    if item.enchantments:
+        for name, power in parse_enchantments(item.enchantments).items():
+            rows.append(('enchant', name, float(power)))
+    # Raridade extraída do anúncio; o nome só serve de reserva
+    rarity = (item.rarity or "").lower() or rarity_of(item.name)
+    if rarity in RARITY_TIERS:
+        rows.append(('rarity', rarity, float(RARITY_TIERS[rarity])))
+    return rows
+
+
+def ensure_attribute_schema(conn: sqlite3.Connection):
+    """Cria item_attributes (chaveada por listing_key) e preenche a partir dos ativos"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_attributes (
+            listing_key INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            value_text TEXT NOT NULL DEFAULT '',
+            value_num REAL,
+            PRIMARY KEY (listing_key, name, value_text)
+        ) WITHOUT ROWID
+    ''')
+    # (name, value_text, value_num) -> faixa contígua no índice; listing_key no fim o torna covering
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_item_attributes_range
+        ON item_attributes(name, value_text, value_num, listing_key)
+    ''')
+    if 'item_attributes' not in tables and 'market_items' in tables:
+        rows = conn.execute('''
+            SELECT name, quality, enchantments, listing_key FROM market_items
+            WHERE status = 'active' AND listing_key IS NOT NULL
+        ''').fetchall()
+        items = [(key, MarketItem(name=name, category="", price=0, quality=quality, enchantments=enchantments))
+                 for name, quality, enchantments, key in rows]
+        write_attributes(conn, items)
+        if items:
+            logger.info(f"Backfilled attributes for {len(items)} active listings")
+    conn.commit()
+
+
+def write_attributes(conn: sqlite3.Connection, keyed_items: Iterable[Tuple[int, MarketItem]]):
+    """Substitui os atributos de cada anúncio na transação corrente (sem commit)
+
+    Segue a semântica do upsert: a QL é sempre substituída, os encantamentos
+    e a raridade só quando o item novo os traz (senão o valor gravado continua).
+    Como a chave primária inclui (name, value_text), o INSERT OR REPLACE já
+    substitui QL e raridade; só se apaga o que pode ter sumido.
+    """
+    stale, rows = [], []
+    for key, item in keyed_items:
+        if item.quality is None:
+            stale.append((key, 'ql'))
+        if item.enchantments is not None:
+            stale.append((key, 'enchant'))
+        if item.rarity is not None:
+            stale.append((key, 'rarity'))
+        rows.extend((key, name, text, num) for name, text, num in item_attributes(item))
+    conn.executemany("DELETE FROM item_attributes WHERE listing_key = ? AND name = ?", stale)
+    conn.executemany(
+        "INSERT OR REPLACE INTO item_attributes (listing_key, name, value_text, value_num) VALUES (?, ?, ?, ?)",
+        rows
+    )
+
+
+def prune_attributes(conn: sqlite3.Connection) -> int:
+    """Remove atributos de anúncios que saíram de market_items (arquivados/apagados)"""
+    removed = conn.execute('''
+        DELETE FROM item_attributes WHERE listing_key NOT IN (
+            SELECT listing_key FROM market_items WHERE listing_key IS NOT NULL
+        )
+    ''').rowcount
+    conn.commit()
+    return removed
+
+
+def attribute_filters(ql_min: Optional[float] = None, ql_max: Optional[float] = None,
+                      enchant: Optional[str] = None, power_min: Optional[float] = None,
+                      rarity: Optional[str] = None, rarity_min: Optional[int] = None) -> Tuple[str, list]:
+    """Cláusulas "AND listing_key IN (...)" para a query de market_items
+
+    Cada filtro vira uma varredura de faixa em idx_item_attributes_range
+    (igualdade em name/value_text, faixa em value_num).
+    """
+    clauses, params = [], []
+
+    def add(condition: str, values: list):
+        clauses.append(f" AND listing_key IN (SELECT listing_key FROM item_attributes WHERE {condition})")
+        params.extend(values)
+
+    if ql_min is not None or ql_max is not None:
+        add("name = 'ql' AND value_text = '' AND value_num BETWEEN ? AND ?",
+            [ql_min if ql_min is not None else 0, ql_max if ql_max is not None else 100])
+    if enchant:
+        enchant = enchant.lower().strip()
+        enchant = ENCHANT_ALIASES.get(enchant, enchant)
+        if power_min is not None:
+            add("name = 'enchant' AND value_text = ? AND value_num >= ?", [enchant, power_min])
+        else:
+            add("name = 'enchant' AND value_text = ?", [enchant])
+    elif power_min is not None:
+        # Qualquer encantamento com o poder mínimo: faixa por value_text
+        add("name = 'enchant' AND value_text > '' AND value_num >= ?", [power_min])
+    if rarity:
+        add("name = 'rarity' AND value_text = ?", [rarity.lower()])
+    elif rarity_min is not None:
+        add("name = 'rarity' AND value_num >= ?", [rarity_min])
+    return "".join(clauses), params
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark de overhead das métricas
+Compara chamadas instrumentadas com a coleta ligada e desligada
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+def per_call(func, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n
+
+
+def bare():
+    pass
+
+
+def timed():
+    with metrics.EXTRACT_SECONDS.time():
+        pass
+
+
+def counted():
+    metrics.FETCH_BYTES.inc(1024, host="forum.wurmonline.com")
+
+
+def observed():
+    metrics.FETCH_SECONDS.observe(0.2, host="forum.wurmonline.com")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    baseline = per_call(bare, args.calls)
+    print(f"{'operation':<22} {'enabled ns':>11} {'disabled ns':>12}")
+    for label, func in (("histogram.time()", timed), ("counter.inc()", counted),
+                        ("histogram.observe()", observed)):
+        metrics.configure(True)
+        enabled = per_call(func, args.calls) - baseline
+        metrics.configure(False)
+        disabled = per_call(func, args.calls) - baseline
+        print(f"{label:<22} {enabled * 1e9:11.0f} {disabled * 1e9:12.0f}")
+    metrics.configure(True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialização JSON
+Compara o caminho antigo (dict(row) + json indentado) com o RowEncoder em 100k linhas
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import RowEncoder, backend_name  # noqa: E402
+
+NAMES = ["iron axe", "steel sword", "rope", "brick", "pickaxe", "leather boot", "bread", "lamp"]
+SERVERS = ["Independence", "Pristine", "Celebration", "Xanadu", "Cadence", "Harmony", "Melody"]
+
+
+def build_rows(n: int):
+    """Cria n linhas sintéticas em um banco em memória"""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE market_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, category TEXT,
+            price REAL, cost REAL, quality INTEGER, enchantments TEXT, server TEXT,
+            seller TEXT, location TEXT, quantity INTEGER DEFAULT 1, timestamp TEXT,
+            source TEXT, url TEXT, description TEXT, contact TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    rng = random.Random(42)
+    conn.executemany('''
+        INSERT INTO market_items (name, category, price, quality, server, seller,
+                                  timestamp, source, url, description, contact)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (rng.choice(NAMES), "tools", round(rng.uniform(0.1, 50), 2), rng.randint(1, 99),
+         rng.choice(SERVERS), f"seller{i % 500}", "2024-01-01T00:00:00", "forum",
+         f"https://forum.wurmonline.com/topic/{i}", "WTS tools", f"Forum: seller{i % 500}")
+        for i in range(n)
+    ))
+    return conn.execute("SELECT * FROM market_items").fetchall()
+
+
+def measure(label: str, func, repeat: int):
+    """Executa func repeat vezes e imprime bytes/s"""
+    best = None
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(func())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<28} {size / 1e6:8.2f} MB  {best * 1000:8.1f} ms  {size / best / 1e6:8.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows)
+    print(f"{args.rows} rows, backend={backend_name()}")
+
+    measure("old: json indent=2", lambda: json.dumps(
+        [dict(row) for row in rows], indent=2, ensure_ascii=False).encode('utf-8'), args.repeat)
+    measure("old: json compact", lambda: json.dumps(
+        [dict(row) for row in rows]).encode('utf-8'), args.repeat)
+
+    cold = RowEncoder(max_entries=args.rows)
+    measure("new: encoder (cold)", lambda: RowEncoder(max_entries=args.rows).encode_rows(rows), args.repeat)
+    cold.encode_rows(rows)
+    measure("new: encoder (cached)", lambda: cold.encode_rows(rows), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
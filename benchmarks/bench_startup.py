@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inicialização
+Mede tempo de import e memória (RSS máximo) de main.py em processos novos
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cenários: o import leve atual e o custo das dependências que deixaram de ser carregadas
+SCENARIOS = {
+    "import main": "import main",
+    "main + WurmMarketScraper()": (
+        "import os, tempfile, json\n"
+        "d = tempfile.mkdtemp()\n"
+        "cfg = os.path.join(d, 'config.json')\n"
+        "json.dump({'database_path': os.path.join(d, 'b.db')}, open(cfg, 'w'))\n"
+        "import main\n"
+        "main.WurmMarketScraper(cfg).close()"
+    ),
+    "heavy deps (old eager set)": (
+        "import requests, bs4\n"
+        "for name in ('selenium.webdriver', 'discord', 'discord.ext.tasks'):\n"
+        "    try:\n"
+        "        __import__(name)\n"
+        "    except ImportError:\n"
+        "        pass"
+    ),
+}
+
+
+def run_once(code: str):
+    """Executa o código em um interpretador novo; retorna (segundos, RSS máximo em MB)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(f"benchmark process failed: {code!r}")
+    return elapsed, rusage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline, _ = run_once("pass")
+    print(f"{'scenario':<30} {'median ms':>10} {'max RSS MB':>11}")
+    for label, code in SCENARIOS.items():
+        runs = [run_once(code) for _ in range(args.repeat)]
+        elapsed = statistics.median(run[0] for run in runs) - baseline
+        rss = max(run[1] for run in runs)
+        print(f"{label:<30} {elapsed * 1000:10.1f} {rss:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Wurm Online Market Tracker
+Mede parse, extração, categorização, upsert, stats, consulta de itens e exportação
+com fixtures gravadas e dados sintéticos; grava JSON e compara com um baseline salvo
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+FIXTURES = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import generate_items, load_config, populate  # noqa: E402
+from main import WurmMarketScraper  # noqa: E402
+from sources.base import RawPage  # noqa: E402
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class BenchContext:
+    """Diretório temporário com config e bancos usados pelos benchmarks"""
+
+    def __init__(self, rows: int, upsert_rows: int):
+        self.rows = rows
+        self.upsert_rows = upsert_rows
+        self.tmpdir = tempfile.mkdtemp(prefix="wurm_bench_")
+        self.config = load_config()
+        self._scrapers: List[WurmMarketScraper] = []
+
+    def scraper(self, name: str, rows: int = 0) -> WurmMarketScraper:
+        """Scraper com banco próprio, opcionalmente pré-populado com dados sintéticos"""
+        config = dict(self.config)
+        config["database_path"] = os.path.join(self.tmpdir, f"{name}.db")
+        config_path = os.path.join(self.tmpdir, f"{name}.json")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        scraper = WurmMarketScraper(config_path)
+        if rows:
+            populate(scraper.db_connection, rows, config)
+        self._scrapers.append(scraper)
+        return scraper
+
+    def close(self):
+        for scraper in self._scrapers:
+            scraper.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def bench_parse_forum(ctx: BenchContext):
+    scraper = ctx.scraper("parse_forum")
+    adapter = scraper.source_adapter("forum")
+    raw = RawPage(url="https://forum.wurmonline.com/index.php?/forum/9-selling/",
+                  kind="forum_listing", body=read_fixture("forum_selling.html"))
+    return lambda: len(list(adapter.parse(raw))), 1
+
+
+def bench_parse_steam(ctx: BenchContext):
+    scraper = ctx.scraper("parse_steam")
+    adapter = scraper.source_adapter("steam")
+    listing = read_fixture("steam_discussions.html")
+    raw = RawPage(url="https://steamcommunity.com/app/1179680/discussions/0/1/",
+                  kind="steam_topic", body=read_fixture("steam_topic.html"))
+
+    def run():
+        adapter.topic_links(listing)
+        return len(list(adapter.parse(raw)))
+    return run, 2
+
+
+def bench_discord_incremental(ctx: BenchContext):
+    from sources.discord_channels import DiscordAdapter, fixture_transport
+
+    path = os.path.join(FIXTURES, "discord_channel.json")
+    with open(path, 'r', encoding='utf-8') as f:
+        channels = json.load(f)
+    scraper = ctx.scraper("discord")
+    adapter = DiscordAdapter(scraper, {"channel_ids": list(channels)}, transport=fixture_transport(path))
+    # Marca d'água na mensagem mais antiga: after= pagina o resto de cada canal
+    oldest = {channel: min(int(m["id"]) for m in messages) for channel, messages in channels.items()}
+    newest = {channel: str(max(int(m["id"]) for m in messages)) for channel, messages in channels.items()}
+
+    def run():
+        adapter.watermarks = {channel: str(message_id) for channel, message_id in oldest.items()}
+        count = sum(len(list(adapter.parse(raw))) for raw in adapter.fetch())
+        assert adapter.pending_checkpoints == newest, adapter.pending_checkpoints
+        adapter.pending_checkpoints.clear()
+        return count
+    return run, sum(len(messages) - 1 for messages in channels.values())
+
+
+def bench_extract(ctx: BenchContext):
+    from bs4 import BeautifulSoup
+
+    scraper = ctx.scraper("extract")
+    soup = BeautifulSoup(read_fixture("steam_topic.html"), 'html.parser')
+    lines = [line for line in soup.get_text("\n").split("\n") if line.strip()]
+    text = "\n".join(lines)
+    return lambda: len(scraper.extract_items_from_text(text)), len(lines)
+
+
+def bench_categorize(ctx: BenchContext):
+    scraper = ctx.scraper("categorize")
+    names = [item.name for item in generate_items(10000, ctx.config)]
+
+    def run():
+        for name in names:
+            scraper.categorize_item(name)
+    return run, len(names)
+
+
+def bench_upsert(ctx: BenchContext):
+    scraper = ctx.scraper("upsert")
+    items = list(generate_items(ctx.upsert_rows, ctx.config, seed=7))
+
+    # Primeira chamada insere, as seguintes exercitam o caminho de atualização
+    def run():
+        scraper.save_items_to_database(items)
+    return run, len(items)
+
+
+def bench_bulk_ingest(ctx: BenchContext):
+    from dataclasses import asdict
+
+    from bulk_ingest import BulkIngester, parse_ndjson
+    from serialization import dumps
+
+    scraper = ctx.scraper("bulk_ingest")
+    lines = [dumps(asdict(item)) for item in generate_items(ctx.upsert_rows * 10, ctx.config, seed=11)]
+
+    # Mesmo corpo repetido: a partir da segunda rodada é só atualização
+    def run():
+        BulkIngester(scraper.db_connection).ingest(parse_ndjson(lines))
+    return run, len(lines)
+
+
+def bench_stats(ctx: BenchContext):
+    scraper = ctx.scraper("stats", rows=ctx.rows)
+    return lambda: scraper.get_market_stats(), 1
+
+
+def bench_items_query(ctx: BenchContext):
+    try:
+        from web_integration import WurmMarketAPI
+    except ImportError as e:
+        raise SkipBenchmark(f"web API dependencies missing: {e}")
+
+    scraper = ctx.scraper("items_query", rows=ctx.rows)
+    client = WurmMarketAPI(scraper.config["database_path"]).app.test_client()
+    servers = ctx.config["servers"]
+    categories = list(ctx.config["categories"])
+    urls = [f"/api/items?server={servers[i % len(servers)]}&category={categories[i % len(categories)]}&limit=100"
+            for i in range(10)] + ["/api/items?limit=100", "/api/items?search=pickaxe&limit=100"]
+
+    def run():
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+    return run, len(urls)
+
+
+def bench_export(ctx: BenchContext):
+    scraper = ctx.scraper("export", rows=ctx.rows)
+    target = os.path.join(ctx.tmpdir, "export.json")
+    return lambda: scraper.export_to_json(target), ctx.rows
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "parse_forum": bench_parse_forum,
+    "parse_steam": bench_parse_steam,
+    "discord": bench_discord_incremental,
+    "extract": bench_extract,
+    "categorize": bench_categorize,
+    "upsert": bench_upsert,
+    "bulk_ingest": bench_bulk_ingest,
+    "stats": bench_stats,
+    "items_query": bench_items_query,
+    "export": bench_export,
+}
+
+
+def measure(run: Callable, repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_suite(names: List[str], rows: int, repeat: int, upsert_rows: int) -> Dict:
+    import logging
+    logging.disable(logging.INFO)
+
+    ctx = BenchContext(rows, upsert_rows)
+    results = {}
+    try:
+        for name in names:
+            try:
+                run, ops = BENCHMARKS[name](ctx)
+            except SkipBenchmark as e:
+                print(f"{name:<14} skipped ({e})")
+                continue
+            timings = measure(run, repeat)
+            median = statistics.median(timings)
+            results[name] = {
+                "median_s": median,
+                "min_s": min(timings),
+                "max_s": max(timings),
+                "ops": ops,
+                "ops_per_s": ops / median if median else None,
+                "repeat": repeat,
+            }
+            print(f"{name:<14} {median * 1000:10.2f} ms  {ops / median:14.1f} ops/s")
+    finally:
+        ctx.close()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": rows,
+            "upsert_rows": upsert_rows,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Lista benchmarks cuja mediana piorou mais que threshold em relação ao baseline"""
+    regressions = []
+    print(f"\n{'benchmark':<14} {'baseline ms':>12} {'current ms':>12} {'change':>9}")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        change = result["median_s"] / base["median_s"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<14} {base['median_s'] * 1000:12.2f} {result['median_s'] * 1000:12.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000, help="Linhas sintéticas nos bancos")
+    parser.add_argument("--upsert-rows", type=int, default=2000, help="Itens por lote no benchmark de upsert")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Executa só estes")
+    parser.add_argument("--output", "-o", default=None, help="Grava resultados em JSON")
+    parser.add_argument("--compare", default=None, help="JSON de baseline para comparação")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora tolerada (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.only or list(BENCHMARKS), args.rows, args.repeat, args.upsert_rows)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Stub HTTP server for exercising the outbound request controller
+Servidor local que injeta latência, erros, 429 com Retry-After e sobrecarga por concorrência
+
+Comportamento global via argumentos (ou StubConfig), e por requisição via query string:
+    /page?latency=0.5&status=503&retry_after=2
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGE = b"<html><body><div class='ipsDataItem'><a>WTS pickaxe 5s</a></div></body></html>"
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05        # Latência base (s)
+    jitter: float = 0.02         # Variação uniforme somada à latência
+    error_rate: float = 0.0      # Fração de respostas 500
+    rate_limit_rate: float = 0.0  # Fração de respostas 429
+    retry_after: float = 1.0     # Retry-After enviado com 429/503
+    capacity: int = 0            # Requisições simultâneas antes de responder 503 (0 = sem limite)
+    slow_under_load: float = 0.0  # Latência extra por requisição simultânea
+
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def enter(self) -> int:
+        with self.lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.in_flight
+
+    def leave(self, status: int):
+        with self.lock:
+            self.in_flight -= 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cfg = self.state.config
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        concurrent = self.state.enter()
+        status = 200
+        try:
+            time.sleep(float(query.get("latency", cfg.latency)) + random.uniform(0, cfg.jitter)
+                       + cfg.slow_under_load * (concurrent - 1))
+
+            if "status" in query:
+                status = int(query["status"])
+            elif cfg.capacity and concurrent > cfg.capacity:
+                status = 503
+            elif random.random() < cfg.rate_limit_rate:
+                status = 429
+            elif random.random() < cfg.error_rate:
+                status = 500
+
+            body = PAGE if status == 200 else f"error {status}".encode()
+            self.send_response(status)
+            if status in (429, 503):
+                self.send_header("Retry-After", query.get("retry_after", f"{cfg.retry_after:g}"))
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            self.state.leave(status)
+
+
+def start_stub_server(config: Optional[StubConfig] = None, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Sobe o servidor numa thread; retorna (servidor, URL base). Pare com server.shutdown()"""
+    handler = type("Handler", (StubHandler,), {"state": StubState(config or StubConfig())})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_demo(base_url: str, requests_count: int, http_config: dict, min_interval: float):
+    """Dispara requisições pelo RequestController e mostra o resultado"""
+    import requests
+
+    from http_controller import RequestController
+
+    controller = RequestController(requests.Session(), http_config, min_interval=min_interval)
+    outcomes = {}
+
+    def one(i):
+        try:
+            controller.get(f"{base_url}/page/{i}", source="stub", timeout=5)
+            return "ok"
+        except Exception as e:
+            return type(e).__name__
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=http_config.get("max_concurrency", 8)) as executor:
+        for outcome in executor.map(one, range(requests_count)):
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print(f"{requests_count} requests in {time.perf_counter() - start:.2f}s: {outcomes}")
+    print(f"controller: {controller.status()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--capacity", type=int, default=0)
+    parser.add_argument("--slow-under-load", type=float, default=0.0)
+    parser.add_argument("--demo", type=int, default=0, metavar="N",
+                        help="Em vez de servir, envia N requisições pelo controlador e sai")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--min-interval", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                        retry_after=args.retry_after, capacity=args.capacity, slow_under_load=args.slow_under_load)
+    server, base_url = start_stub_server(config, 0 if args.demo else args.port)
+    try:
+        if args.demo:
+            run_demo(base_url, args.demo, {"max_concurrency": args.max_concurrency, "backoff_base": 0.05},
+                     args.min_interval)
+            state = server.RequestHandlerClass.state
+            print(f"server: {state.requests} requests, max in flight {state.max_in_flight}, statuses {state.statuses}")
+        else:
+            print(f"Stub server listening on {base_url}")
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
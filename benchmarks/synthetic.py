@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Synthetic market generator
+Preenche market_items com N linhas realistas distribuídas pelos servidores e categorias do config
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import MarketItem  # noqa: E402
+from storage import listing_key  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MATERIALS = ["iron", "steel", "copper", "bronze", "silver", "gold", "seryll", "glimmersteel", "adamantine", "oak", "birch"]
+ADJECTIVES = ["", "", "", "small", "large", "fine", "rare", "supreme"]
+SOURCES = ["forum", "forum", "forum", "steam", "discord", "manual"]
+
+
+def load_config(config_path: Optional[str] = None) -> Dict:
+    with open(config_path or os.path.join(ROOT, "config.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def generate_items(n: int, config: Optional[Dict] = None, seed: int = 42) -> Iterator[MarketItem]:
+    """Gera n MarketItems com nomes, preços e servidores plausíveis"""
+    config = config or load_config()
+    rng = random.Random(seed)
+    categories = list(config["categories"].items())
+    servers = config["servers"]
+    sellers = [f"trader{i}" for i in range(max(50, n // 200))]
+    topics = max(20, n // 25)
+
+    for i in range(n):
+        category, keywords = rng.choice(categories)
+        keyword = rng.choice(keywords)
+        material = rng.choice(MATERIALS) if category in ("tools", "weapons", "armor") else ""
+        name = " ".join(part for part in (rng.choice(ADJECTIVES), material, keyword) if part)
+        quality = rng.randint(1, 99)
+        # Preço log-normal em prata, com alguns outliers de parse ("1000s")
+        price = round(rng.lognormvariate(0.5 + quality / 60, 0.8), 2)
+        if rng.random() < 0.005:
+            price *= 1000
+        enchant = None
+        if rng.random() < 0.1:
+            enchant = f"{rng.choice(['woa', 'coc', 'aosp'])} {rng.randint(10, 100)}"
+        seller = rng.choice(sellers)
+        source = rng.choice(SOURCES)
+        topic = rng.randrange(topics)
+
+        yield MarketItem(
+            name=name,
+            category=category,
+            price=price,
+            cost=round(price * rng.uniform(0.3, 0.9), 2) if rng.random() < 0.3 else None,
+            quality=quality,
+            enchantments=enchant,
+            server=rng.choice(servers),
+            seller=seller,
+            quantity=rng.choice([1, 1, 1, 5, 10, 100]),
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() - rng.randint(0, 60 * 86400))),
+            source=source,
+            url=f"https://forum.wurmonline.com/index.php?/topic/{100000 + topic}-wts/",
+            description=f"WTS {name} ql{quality}",
+            contact=f"Forum: {seller}",
+        )
+
+
+def populate(conn: sqlite3.Connection, n: int, config: Optional[Dict] = None, seed: int = 42,
+             max_age_days: int = 60) -> int:
+    """Insere n linhas sintéticas direto em market_items (schema já criado)"""
+    rng = random.Random(seed + 1)
+    now = int(time.time())
+    rows = []
+    for item in generate_items(n, config, seed):
+        epoch = now - rng.randint(0, max_age_days * 86400)
+        updated_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+        rows.append((
+            item.name, item.category, item.price, item.cost, item.quality, item.enchantments,
+            item.server, item.seller, item.location, item.quantity, item.timestamp, item.source,
+            item.url, item.description, item.contact, item.status, updated_at, updated_at, epoch,
+            listing_key(item.name, item.seller, item.url)
+        ))
+        if len(rows) >= 10000:
+            insert_rows(conn, rows)
+            rows = []
+    if rows:
+        insert_rows(conn, rows)
+    conn.commit()
+    return n
+
+
+def insert_rows(conn: sqlite3.Connection, rows):
+    # Anúncios ativos repetidos (mesma listing_key) são descartados pelo índice único
+    conn.executemany('''
+        INSERT OR IGNORE INTO market_items (
+            name, category, price, cost, quality, enchantments,
+            server, seller, location, quantity, timestamp, source,
+            url, description, contact, status, created_at, updated_at, updated_epoch, listing_key
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("database", help="Banco SQLite de destino (criado se não existir)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--config", default=None)
+    args = parser.parse_args()
+
+    from main import WurmMarketScraper
+
+    config = load_config(args.config)
+    config["database_path"] = args.database
+    config_path = args.database + ".config.json"
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    scraper = WurmMarketScraper(config_path)
+    start = time.perf_counter()
+    populate(scraper.db_connection, args.rows, config, args.seed)
+    print(f"Inserted {args.rows} rows into {args.database} in {time.perf_counter() - start:.1f}s")
+    scraper.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Bulk ingest for Wurm Online Market Tracker
+Lê NDJSON ou CSV em streaming, valida linha a linha e grava em lotes pelo upsert compartilhado
+"""
+
+import csv
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from models import MarketItem
+from serialization import loads
+from storage import notify_ingest, upsert_items
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('name', 'category', 'price', 'server')
+STATUSES = ('active', 'sold', 'expired')
+TEXT_FIELDS = ('enchantments', 'seller', 'location', 'url', 'description', 'contact', 'source', 'timestamp')
+
+# Linha numerada (1 = primeira linha de dados) e o dict bruto, ou o erro de leitura
+ParsedRow = Tuple[int, Optional[Dict], Optional[str]]
+
+
+def iter_lines(stream, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    """Linhas de um stream binário lido em blocos (readline do WSGI lê byte a byte)"""
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def parse_ndjson(lines: Iterable[bytes]) -> Iterator[ParsedRow]:
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = loads(line)
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "expected a JSON object"
+            continue
+        yield number, row, None
+
+
+def parse_csv(lines: Iterable[bytes]) -> Iterator[ParsedRow]:
+    """CSV com cabeçalho; colunas vazias contam como ausentes"""
+    reader = csv.DictReader(line.decode('utf-8-sig') for line in lines)
+    try:
+        for number, row in enumerate(reader, 1):
+            yield number, {k: v for k, v in row.items() if k and v not in (None, '')}, None
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield reader.line_num, None, f"invalid CSV: {e}"
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+
+def validate_row(row: Dict, default_source: str = "manual") -> MarketItem:
+    """Converte um dict em MarketItem ou levanta ValueError com o motivo"""
+    get = row.get
+    name, category, price, server = get('name'), get('category'), get('price'), get('server')
+    if not name or not category or price in (None, '') or not server:
+        missing = [field for field in REQUIRED_FIELDS if get(field) in (None, '')]
+        raise ValueError(f"missing required fields: {', '.join(missing)}")
+
+    try:
+        price = float(price)
+        cost = get('cost')
+        cost = float(cost) if cost not in (None, '') else 0.0
+        quality = get('quality')
+        quality = int(float(quality)) if quality not in (None, '') else None
+        quantity = int(get('quantity') or 1)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid number: {e}")
+    if price < 0:
+        raise ValueError("price must be >= 0")
+    if quality is not None and not 0 <= quality <= 100:
+        raise ValueError("quality must be between 0 and 100")
+    if quantity < 1:
+        raise ValueError("quantity must be >= 1")
+
+    status = get('status', 'active')
+    if status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+
+    text = {field: str(row[field]) for field in TEXT_FIELDS if get(field) not in (None, '')}
+    return MarketItem(
+        name=str(name).strip(),
+        category=str(category),
+        price=price,
+        cost=cost,
+        quality=quality,
+        enchantments=text.get('enchantments'),
+        server=str(server),
+        seller=text.get('seller', 'manual'),
+        location=text.get('location', 'unknown'),
+        quantity=quantity,
+        timestamp=text.get('timestamp') or datetime.now().isoformat(),
+        source=text.get('source', default_source),
+        url=text.get('url', ''),
+        description=text.get('description', ''),
+        contact=text.get('contact', ''),
+        status=status,
+    )
+
+
+class BulkIngester:
+    """Valida e grava um stream de linhas em transações de batch_size itens
+
+    Linhas inválidas não interrompem a carga: entram no relatório de erros
+    (até max_errors detalhados) e as válidas seguem para o upsert.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = 5000, max_errors: int = 1000,
+                 default_source: str = "manual"):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.default_source = default_source
+        # WAL + NORMAL: commit sem fsync (o WAL é sincronizado nos checkpoints)
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+
+    def ingest(self, rows: Iterable[ParsedRow]) -> Dict:
+        report = {"received": 0, "accepted": 0, "inserted": 0, "updated": 0, "rejected": 0,
+                  "errors": [], "errors_truncated": False}
+        batch: List[MarketItem] = []
+
+        for number, row, error in rows:
+            report["received"] += 1
+            if error is None:
+                try:
+                    batch.append(validate_row(row, self.default_source))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                report["rejected"] += 1
+                if len(report["errors"]) < self.max_errors:
+                    report["errors"].append({"line": number, "error": error})
+                else:
+                    report["errors_truncated"] = True
+                continue
+            if len(batch) >= self.batch_size:
+                self.flush(batch, report)
+                batch = []
+
+        self.flush(batch, report)
+        return report
+
+    def flush(self, batch: List[MarketItem], report: Dict):
+        if not batch:
+            return
+        with metrics.DB_LOCK_WAIT_SECONDS.time():
+            self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            with metrics.DB_UPSERT_SECONDS.time():
+                inserted, updated = upsert_items(self.conn, batch)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        metrics.DB_ROWS_WRITTEN.inc(inserted, operation="insert")
+        metrics.DB_ROWS_WRITTEN.inc(updated, operation="update")
+        report["accepted"] += len(batch)
+        report["inserted"] += inserted
+        report["updated"] += updated
+        notify_ingest(self.conn, batch)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Columnar snapshots for Wurm Online Market Tracker
+Exporta anúncios ativos e histórico de preços para Parquet/Arrow IPC particionados por data e servidor
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from archival import open_history
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLUMNAR_CONFIG = {
+    "enabled": False,           # Exporta ao fim de cada `run` (o comando `snapshot` exporta sempre)
+    "path": "snapshots",
+    "format": "parquet",        # "parquet" (zstd, menor) ou "arrow" (IPC sem compressão, mmap sem cópia)
+    "compression": "zstd",
+    "row_group_size": 100000,
+}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Colunas gravadas (server e a data vão no caminho da partição, estilo Hive)
+COLUMNS_SQL = '''
+    listing_key, name, category, price, quality, enchantments, seller, source, url, status,
+    CAST(strftime('%s', created_at) AS INTEGER) AS created_at, updated_epoch AS updated_at
+'''
+DICTIONARY_COLUMNS = ("category", "source", "status")
+
+
+def require_pyarrow():
+    """Importa pyarrow sob demanda (dependência opcional, só para os snapshots)"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("columnar snapshots need pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def arrow_schema():
+    pa = require_pyarrow()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("listing_key", pa.int64()),
+        ("name", pa.string()),
+        ("category", dictionary),
+        ("price", pa.float64()),
+        ("quality", pa.float64()),
+        ("enchantments", pa.string()),
+        ("seller", pa.string()),
+        ("source", dictionary),
+        ("url", pa.string()),
+        ("status", dictionary),
+        ("created_at", pa.timestamp("s", tz="UTC")),
+        ("updated_at", pa.timestamp("s", tz="UTC")),
+    ])
+
+
+def rows_to_table(rows: List[tuple]):
+    """Linhas no formato de COLUMNS_SQL -> pyarrow.Table tipada, com colunas de dicionário"""
+    pa = require_pyarrow()
+    schema = arrow_schema()
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.name in DICTIONARY_COLUMNS:
+            arrays.append(pa.array(values, pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_table(table, path: str, config: Dict):
+    pa = require_pyarrow()
+    if config["format"] == "arrow":
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=config["row_group_size"])
+    else:
+        pa.parquet.write_table(table, path, compression=config["compression"],
+                               row_group_size=config["row_group_size"])
+
+
+def encode_table(table, fmt: str = "parquet", compression: str = "zstd") -> bytes:
+    """Tabela serializada em memória (download único pela API)"""
+    pa = require_pyarrow()
+    sink = pa.BufferOutputStream()
+    if fmt == "arrow":
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa.parquet.write_table(table, sink, compression=compression)
+    return sink.getvalue().to_pybytes()
+
+
+def utc_today() -> str:
+    # Partições por dia UTC, o mesmo relógio de updated_epoch
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def partition_name(key: str, value: str) -> str:
+    return f"{key}={quote(value or 'unknown', safe='')}"
+
+
+class ColumnarExporter:
+    """Escreve os datasets listings/ e history/ sob config["path"]
+
+    listings/date=D/server=S: foto diária dos anúncios ativos (uma por dia;
+    a série de fotos é o histórico de preço de quem continua anunciado).
+    history/date=D/server=S: anúncios encerrados (expirados, vendidos) de
+    market_items_history, pela data de encerramento; só dias já fechados.
+
+    Cada partição de data é escrita num diretório temporário e renomeada,
+    então uma partição existente está completa e não é reescrita.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, config: Optional[Dict] = None, archive_path: str = ""):
+        self.conn = conn
+        self.config = dict(DEFAULT_COLUMNAR_CONFIG, **(config or {}))
+        if self.config["format"] not in FORMATS:
+            raise ValueError(f"unknown snapshot format: {self.config['format']}")
+        self.archive_path = archive_path
+        self.root = self.config["path"]
+
+    def dataset_path(self, dataset: str) -> str:
+        return os.path.join(self.root, dataset)
+
+    def existing_dates(self, dataset: str) -> set:
+        path = self.dataset_path(dataset)
+        if not os.path.isdir(path):
+            return set()
+        return {name[len("date="):] for name in os.listdir(path) if name.startswith("date=")}
+
+    def write_partition(self, dataset: str, day: str, rows: Iterable[tuple]) -> int:
+        """Grava date=day/server=*/part-0.<ext> a partir de linhas (server, ...) ordenadas por server"""
+        final = os.path.join(self.dataset_path(dataset), partition_name("date", day))
+        staging = final + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        extension = FORMATS[self.config["format"]]
+        total = 0
+        for server, group in groupby(rows, key=itemgetter(0)):
+            directory = os.path.join(staging, partition_name("server", server))
+            os.makedirs(directory)
+            table = rows_to_table([row[1:] for row in group])
+            write_table(table, os.path.join(directory, f"part-0{extension}"), self.config)
+            total += table.num_rows
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(staging, final)
+        return total
+
+    def export_listings(self, day: Optional[str] = None, force: bool = False) -> Dict[str, int]:
+        """Foto dos anúncios ativos do dia (pulada se a partição já existe, salvo force)"""
+        day = day or utc_today()
+        if day in self.existing_dates("listings") and not force:
+            return {}
+        rows = self.conn.execute(f'''
+            SELECT server, {COLUMNS_SQL} FROM market_items
+            WHERE status = 'active' ORDER BY server, updated_epoch
+        ''')
+        return {day: self.write_partition("listings", day, rows)}
+
+    def export_history(self, force: bool = False) -> Dict[str, int]:
+        """Anúncios encerrados por dia de encerramento; grava só os dias fechados que faltam"""
+        history = open_history(self.conn, self.archive_path)
+        today = utc_today()
+        existing = set() if force else self.existing_dates("history")
+        # Uma varredura só, a partir do primeiro dia que falta
+        first_missing = self.conn.execute(f'''
+            SELECT MIN(updated_epoch) FROM {history}
+            WHERE status != 'active' AND updated_epoch IS NOT NULL
+            {"AND date(updated_epoch, 'unixepoch') NOT IN (%s)" % ", ".join("?" * len(existing)) if existing else ""}
+        ''', sorted(existing)).fetchone()[0]
+        if first_missing is None:
+            return {}
+        rows = self.conn.execute(f'''
+            SELECT date(updated_epoch, 'unixepoch') AS day, server, {COLUMNS_SQL} FROM {history}
+            WHERE status != 'active' AND updated_epoch >= ? AND updated_epoch < ?
+            ORDER BY day, server, updated_epoch
+        ''', (first_missing, int(datetime.fromisoformat(today).replace(tzinfo=timezone.utc).timestamp())))
+        written = {}
+        for day, group in groupby(rows, key=itemgetter(0)):
+            if day in existing:
+                continue
+            written[day] = self.write_partition("history", day, (row[1:] for row in group))
+        return written
+
+    def export(self, force: bool = False) -> Dict[str, Dict[str, int]]:
+        summary = {"listings": self.export_listings(force=force), "history": self.export_history(force=force)}
+        logger.info(f"Columnar snapshots written to {self.root}: {summary}")
+        return summary
+
+
+def active_listings_table(conn: sqlite3.Connection):
+    """Anúncios ativos numa única pyarrow.Table, com server como coluna de dicionário"""
+    pa = require_pyarrow()
+    rows = conn.execute(f'''
+        SELECT server, {COLUMNS_SQL} FROM market_items WHERE status = 'active' ORDER BY updated_epoch DESC
+    ''').fetchall()
+    table = rows_to_table([row[1:] for row in rows])
+    servers = pa.array([row[0] for row in rows], pa.string()).dictionary_encode()
+    return table.add_column(2, "server", servers)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Config service for Wurm Online Market Tracker
+Observa o config.json, valida, recompila os matchers e troca tudo de uma vez, sem reiniciar o processo
+"""
+
+import copy
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+
+from attributes import AttributeExtractor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_CONFIG = {
+    "enabled": True,
+    "poll_interval": 2.0,        # Segundos entre verificações do mtime do arquivo
+    "recategorize": True,        # Recategoriza os anúncios ativos quando "categories" muda
+    "recategorize_batch": 2000,
+    "recategorize_pause": 0.02,  # Pausa entre lotes, deixando o lock de escrita livre
+}
+
+# Chaves que só valem com o processo reiniciado (conexões já abertas)
+RESTART_KEYS = ("database_path",)
+
+# Substantivos que o extrator sempre reconhece; as palavras-chave de "categories" somam-se a eles
+ITEM_NOUNS = (
+    "axe", "sword", "hammer", "rope", "brick", "armor", "helmet", "shield", "bow", "arrow", "knife", "saw",
+    "pickaxe", "spear", "club", "meal", "bread", "wine", "beer", "lamp", "chest", "bed", "table", "chair",
+)
+
+DEFAULT_CATEGORY = "misc"
+
+
+class ConfigError(ValueError):
+    """Config inválido; o anterior continua em uso"""
+
+
+class Matchers:
+    """Tudo o que é compilado a partir do config, imutável depois de pronto
+
+    Quem extrai pega uma referência no início (scraper.matchers) e usa a
+    mesma até o fim, então uma troca no meio de um scrape nunca mistura
+    padrões de duas versões.
+    """
+
+    def __init__(self, config: Dict):
+        self.categories: List[Tuple[str, Pattern]] = [
+            (category, re.compile("|".join(re.escape(keyword.lower()) for keyword in keywords)))
+            for category, keywords in config["categories"].items() if keywords
+        ]
+        self.prices: List[Tuple[Pattern, float]] = []
+        for pattern in config["price_patterns"]:
+            # Conversão para prata decidida na compilação, pelo texto do padrão
+            if "c" in pattern or "copper" in pattern:
+                factor = 1 / 100  # 100 cobre = 1 prata
+            elif "iron" in pattern:
+                factor = 20.0     # 1 ferro = 20 prata (aproximado)
+            else:
+                factor = 1.0
+            self.prices.append((re.compile(pattern), factor))
+        self.servers: List[Tuple[str, str]] = [(server.lower(), server) for server in config["servers"]]
+        nouns = set(ITEM_NOUNS)
+        for keywords in config["categories"].values():
+            nouns.update(keyword.lower() for keyword in keywords)
+        self.item_pattern = re.compile(
+            r'([A-Za-z\s]+(?:' + "|".join(re.escape(noun) for noun in sorted(nouns, key=len, reverse=True))
+            + r'))\s*[:-]?\s*(\d+\.?\d*)\s*([sc]|silver|copper|iron)?',
+            re.IGNORECASE
+        )
+        self.attributes = AttributeExtractor(config)
+
+    def categorize(self, name: str) -> str:
+        lowered = name.lower()
+        for category, pattern in self.categories:
+            if pattern.search(lowered):
+                return category
+        return DEFAULT_CATEGORY
+
+    def price(self, text: str) -> Optional[float]:
+        lowered = text.lower()
+        for pattern, factor in self.prices:
+            match = pattern.search(lowered)
+            if match:
+                return float(match.group(1)) * factor
+        return None
+
+    def server(self, text: str) -> str:
+        lowered = text.lower()
+        for needle, server in self.servers:
+            if needle in lowered:
+                return server
+        return "unknown"
+
+
+def validate(config: Dict) -> Matchers:
+    """Confere os tipos das seções com matchers e compila; ConfigError com todos os problemas"""
+    errors = []
+    categories = config.get("categories")
+    if not isinstance(categories, dict) or not all(
+            isinstance(keywords, list) and all(isinstance(k, str) and k.strip() for k in keywords)
+            for keywords in categories.values()):
+        errors.append("categories must map category -> list of non-empty keywords")
+    servers = config.get("servers")
+    if not isinstance(servers, list) or not all(isinstance(s, str) and s.strip() for s in servers):
+        errors.append("servers must be a list of non-empty names")
+    for key in ("price_patterns", "quality_patterns", "enchantment_patterns"):
+        patterns = config.get(key, [])
+        if not isinstance(patterns, list):
+            errors.append(f"{key} must be a list of regular expressions")
+            continue
+        for pattern in patterns:
+            try:
+                if re.compile(pattern).groups < 1 and key != "enchantment_patterns":
+                    errors.append(f"{key}: {pattern!r} needs a capture group for the number")
+            except (re.error, TypeError) as e:
+                errors.append(f"{key}: {pattern!r} is not a valid regex ({e})")
+    if errors:
+        raise ConfigError("; ".join(errors))
+    return Matchers(config)
+
+
+class ConfigSnapshot:
+    """Par (config, matchers) de uma versão; trocado inteiro numa atribuição"""
+
+    __slots__ = ("config", "matchers", "version", "mtime")
+
+    def __init__(self, config: Dict, matchers: Matchers, version: int, mtime: Optional[float]):
+        self.config = config
+        self.matchers = matchers
+        self.version = version
+        self.mtime = mtime
+
+
+class ConfigService:
+    """Dono do config de um processo: carrega, valida, recompila e avisa quem assinou
+
+    loader(path) devolve o config já mesclado com os padrões. Um arquivo
+    inválido (JSON ou validação) é registrado e ignorado: o snapshot
+    anterior segue valendo. watch() verifica o mtime numa thread daemon.
+    """
+
+    def __init__(self, config_file: str, loader: Callable[[str], Dict], overrides: Optional[Dict] = None):
+        self.config_file = config_file
+        self.loader = loader
+        self.overrides = overrides or {}
+        self._subscribers: List[Callable[[ConfigSnapshot, ConfigSnapshot], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        config = self._load()
+        self.current = ConfigSnapshot(config, validate(config), 1, self._mtime())
+
+    @property
+    def config(self) -> Dict:
+        return self.current.config
+
+    @property
+    def matchers(self) -> Matchers:
+        return self.current.matchers
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.config_file).st_mtime
+        except OSError:
+            return None
+
+    def _load(self) -> Dict:
+        config = self.loader(self.config_file)
+        # Overrides em memória (ex.: banco :memory: da reextração) valem em toda versão
+        config.update(copy.deepcopy(self.overrides))
+        return config
+
+    def subscribe(self, callback: Callable[[ConfigSnapshot, ConfigSnapshot], None]):
+        """callback(anterior, novo) depois de cada troca"""
+        self._subscribers.append(callback)
+
+    def reload(self, force: bool = False) -> bool:
+        """Recarrega se o arquivo mudou; True se um config novo entrou em uso"""
+        with self._lock:
+            previous = self.current
+            mtime = self._mtime()
+            if mtime is None or (not force and mtime == previous.mtime):
+                # Arquivo sumiu (ou está sendo trocado): segue com o atual
+                return False
+            try:
+                config = self._load()
+                matchers = validate(config)
+            except (ConfigError, ValueError) as e:
+                logger.error(f"Config reload rejected, keeping version {previous.version}: {e}")
+                previous.mtime = mtime  # Não repete o erro até o arquivo mudar de novo
+                return False
+            for key in RESTART_KEYS:
+                if config.get(key) != previous.config.get(key):
+                    logger.warning(f"Config {key} changed; it only takes effect after a restart")
+                    config[key] = previous.config.get(key)
+            self.current = ConfigSnapshot(config, matchers, previous.version + 1, mtime)
+        logger.info(f"Config reloaded from {self.config_file} (version {self.current.version})")
+        for callback in self._subscribers:
+            try:
+                callback(previous, self.current)
+            except Exception as e:
+                logger.error(f"Config subscriber failed: {e}")
+        return True
+
+    def watch(self, interval: float = 2.0):
+        """Verifica o arquivo a cada `interval` segundos numa thread daemon"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.reload()
+
+        self._thread = threading.Thread(target=run, name="config-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class Recategorizer:
+    """Reaplica as categorias aos anúncios ativos em lotes por id, numa thread
+
+    Só linhas cuja categoria muda são escritas. updated_at é renovado (o
+    cache de JSON da API é por id + updated_at); updated_epoch, que conta
+    para a expiração, não. Uma nova troca de categorias reinicia a varredura.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], batch_size: int = 2000, pause: float = 0.02,
+                 on_done: Optional[Callable[[int], None]] = None):
+        self.connect = connect
+        self.batch_size = batch_size
+        self.pause = pause
+        self.on_done = on_done
+        self._restart = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._matchers: Optional[Matchers] = None
+
+    def run(self, matchers: Matchers) -> int:
+        """Varredura completa; retorna linhas alteradas"""
+        conn = self.connect()
+        changed, last_id = 0, 0
+        try:
+            while True:
+                if self._restart.is_set():
+                    return changed
+                rows = conn.execute('''
+                    SELECT id, name, category FROM market_items
+                    WHERE id > ? AND status = 'active' ORDER BY id LIMIT ?
+                ''', (last_id, self.batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = [(category, item_id) for item_id, name, current in rows
+                           for category in (matchers.categorize(name or ""),) if category != current]
+                if updates:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany('''
+                        UPDATE market_items SET category = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+                    ''', updates)
+                    conn.commit()
+                    changed += len(updates)
+                if self.pause:
+                    time.sleep(self.pause)
+        finally:
+            conn.close()
+        logger.info(f"Recategorized {changed} active listings")
+        return changed
+
+    def start(self, matchers: Matchers):
+        """Roda em segundo plano; se já estiver rodando, recomeça com os matchers novos"""
+        with self._lock:
+            self._matchers = matchers
+            if self._thread is not None and self._thread.is_alive():
+                self._restart.set()
+                return
+            self._thread = threading.Thread(target=self._loop, name="recategorize", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                matchers = self._matchers
+                self._restart.clear()
+            try:
+                changed = self.run(matchers)
+            except Exception as e:
+                logger.error(f"Recategorization failed: {e}")
+                return
+            with self._lock:
+                if not self._restart.is_set():
+                    self._thread = None
+                    break
+        if self.on_done and changed:
+            self.on_done(changed)
+
+    def join(self, timeout: Optional[float] = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def categories_changed(previous: ConfigSnapshot, current: ConfigSnapshot) -> bool:
+    return previous.config.get("categories") != current.config.get("categories")
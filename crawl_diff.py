@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Crawl snapshot diff for Wurm Online Market Tracker
+Compara as chaves de anúncio vistas por URL com a execução anterior e marca as que sumiram
+"""
+
+import logging
+import sqlite3
+import struct
+from typing import Dict, Iterable, List, Set, Tuple
+
+from expiry import EPOCH_NOW_SQL
+from storage import notify_retire
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIFF_CONFIG = {
+    "enabled": True,
+    "disappeared_status": "sold",  # Status dado aos anúncios que sumiram da página
+    "max_gone_ratio": 0.9,         # Página que perdeu mais que isso de uma vez é ignorada (layout quebrado?)
+    "guard_min_keys": 5,           # ...desde que tivesse pelo menos tantos anúncios
+}
+
+
+def ensure_diff_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_keysets (
+            source TEXT NOT NULL,
+            url TEXT NOT NULL,
+            keys BLOB NOT NULL,
+            key_count INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, url)
+        )
+    ''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(scrape_history)")}
+    if columns and "details" not in columns:
+        conn.execute("ALTER TABLE scrape_history ADD COLUMN details TEXT")
+    conn.commit()
+
+
+def pack_keys(keys: Iterable[int]) -> bytes:
+    """Conjunto de listing_keys como int64 ordenados (8 bytes por chave)"""
+    ordered = sorted(keys)
+    return struct.pack(f"<{len(ordered)}q", *ordered)
+
+
+def unpack_keys(blob: bytes) -> Tuple[int, ...]:
+    return struct.unpack(f"<{len(blob) // 8}q", blob)
+
+
+class SnapshotDiffer:
+    """Diff por URL entre esta execução e a anterior de uma fonte
+
+    Só URLs efetivamente rastreadas nesta execução (página obtida e
+    parseada) entram na comparação; páginas que falharam mantêm o conjunto
+    anterior. As chaves que sumiram mudam de status num único UPDATE sobre
+    uma tabela temporária, usando o índice parcial de anúncios ativos;
+    depois do commit as chaves marcadas vão para os listeners de retirada.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, config: Dict = None):
+        self.conn = conn
+        self.config = dict(DEFAULT_DIFF_CONFIG, **(config or {}))
+
+    def load(self, source: str, urls: List[str]) -> Dict[str, Tuple[int, ...]]:
+        previous = {}
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            for url, blob in self.conn.execute(f'''
+                SELECT url, keys FROM crawl_keysets
+                WHERE source = ? AND url IN ({", ".join("?" * len(chunk))})
+            ''', [source, *chunk]):
+                previous[url] = unpack_keys(blob)
+        return previous
+
+    def diff(self, source: str, crawled: Dict[str, Set[int]]) -> Dict:
+        """Aplica o diff da fonte e grava os conjuntos novos; retorna o resumo"""
+        summary = {"urls": len(crawled), "seen": 0, "new": 0, "gone": 0, "marked": 0, "skipped_urls": 0}
+        if not crawled:
+            return summary
+        previous = self.load(source, list(crawled))
+        gone: List[Tuple[int]] = []
+        keysets = []
+        for url, keys in crawled.items():
+            before = previous.get(url, ())
+            missing = [key for key in before if key not in keys]
+            summary["seen"] += len(keys)
+            summary["new"] += len(keys) - (len(before) - len(missing))
+            if (len(before) >= self.config["guard_min_keys"]
+                    and len(missing) > self.config["max_gone_ratio"] * len(before)):
+                # Sumiu quase tudo de uma página grande de uma vez: mais provável ser erro de parse
+                summary["skipped_urls"] += 1
+                continue
+            gone.extend((key,) for key in missing)
+            keysets.append((source, url, pack_keys(keys), len(keys)))
+        summary["gone"] = len(gone)
+
+        retired: List[int] = []
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if gone:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS diff_gone (listing_key INTEGER PRIMARY KEY)")
+                self.conn.execute("DELETE FROM temp.diff_gone")
+                self.conn.executemany("INSERT OR IGNORE INTO temp.diff_gone (listing_key) VALUES (?)", gone)
+                retired = [row[0] for row in self.conn.execute('''
+                    SELECT listing_key FROM market_items
+                    WHERE status = 'active' AND listing_key IN (SELECT listing_key FROM temp.diff_gone)
+                ''')]
+                summary["marked"] = self.conn.execute(f'''
+                    UPDATE market_items
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP, updated_epoch = {EPOCH_NOW_SQL}
+                    WHERE status = 'active' AND listing_key IN (SELECT listing_key FROM temp.diff_gone)
+                ''', (self.config["disappeared_status"],)).rowcount
+                self.conn.execute("DELETE FROM temp.diff_gone")
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO crawl_keysets (source, url, keys, key_count) VALUES (?, ?, ?, ?)
+            ''', keysets)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        notify_retire(self.conn, retired)
+        if summary["marked"]:
+            logger.info(f"{source}: marked {summary['marked']} vanished listings as "
+                        f"{self.config['disappeared_status']} {summary}")
+        return summary
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Distributed crawl queue for Wurm Online Market Tracker
+Fila de URLs com leases (visibility timeout) e slots de ritmo por host compartilhados entre workers
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CRAWL_QUEUE_CONFIG = {
+    "path": "",             # Arquivo SQLite da fila ("" = o próprio banco de mercado)
+    "lease_seconds": 120,   # Visibility timeout: lease vencida volta para a fila
+    "max_attempts": 3,
+    "poll_interval": 1.0,
+}
+
+LEASES_CLAIMED = metrics.registry.counter("wurm_crawl_leases_claimed_total", "Crawl leases claimed by source")
+LEASES_FAILED = metrics.registry.counter("wurm_crawl_leases_failed_total", "Crawl leases that failed by source")
+
+# Trabalho reservado: (id, source, url, kind, round)
+Lease = Tuple[int, str, str, str, int]
+
+
+def ensure_crawl_queue_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_leases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            url TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            round INTEGER NOT NULL DEFAULT 1,
+            state TEXT NOT NULL DEFAULT 'pending',
+            lease_owner TEXT,
+            lease_expires REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            items INTEGER,
+            enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            done_at TIMESTAMP,
+            UNIQUE (source, url)
+        )
+    ''')
+    # Busca de trabalho disponível: pendentes e leases vencidas, por ordem de chegada
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_crawl_leases_claim
+        ON crawl_leases(state, lease_expires, id)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_rate_slots (
+            host TEXT PRIMARY KEY,
+            next_allowed REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CrawlQueue:
+    """Fila de trabalho num SQLite compartilhado pelos workers
+
+    claim() reserva URLs com um UPDATE ... RETURNING atômico; a lease vence
+    depois de lease_seconds e a URL volta a ser reservável (worker que
+    morreu não trava a rodada). acquire_slot() dá a cada host um próximo
+    horário permitido global, então o intervalo entre requisições vale
+    para o conjunto de workers, não para cada um.
+    """
+
+    def __init__(self, path: str, config: Optional[Dict] = None):
+        self.config = dict(DEFAULT_CRAWL_QUEUE_CONFIG, **(config or {}))
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        ensure_crawl_queue_schema(self.conn)
+
+    def current_round(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(round), 0) FROM crawl_leases").fetchone()[0]
+
+    def enqueue(self, work: List[Tuple[str, str, str]], round_id: int) -> int:
+        """Enfileira (source, url, kind); URLs já vistas voltam a pendentes se forem de rodada anterior"""
+        before = self.conn.total_changes
+        self.conn.executemany('''
+            INSERT INTO crawl_leases (source, url, kind, round) VALUES (?, ?, ?, ?)
+            ON CONFLICT(source, url) DO UPDATE SET
+                kind = excluded.kind, round = excluded.round, state = 'pending', lease_owner = NULL,
+                lease_expires = 0, attempts = 0, last_error = NULL, items = NULL,
+                enqueued_at = CURRENT_TIMESTAMP, done_at = NULL
+            WHERE crawl_leases.round < excluded.round AND crawl_leases.state != 'leased'
+        ''', [(source, url, kind, round_id) for source, url, kind in work])
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def start_round(self, work: List[Tuple[str, str, str]]) -> Tuple[int, int]:
+        """Coordenador: abre uma rodada nova com as URLs semente; retorna (rodada, enfileiradas)"""
+        round_id = self.current_round() + 1
+        return round_id, self.enqueue(work, round_id)
+
+    def claim(self, owner: str, limit: int = 1) -> List[Lease]:
+        now = time.time()
+        # Lease vencida sem tentativas sobrando: o worker morreu nela vezes demais
+        self.conn.execute('''
+            UPDATE crawl_leases SET state = 'failed', last_error = COALESCE(last_error, 'lease expired')
+            WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+        ''', (now, self.config["max_attempts"]))
+        rows = self.conn.execute('''
+            UPDATE crawl_leases
+            SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM crawl_leases
+                WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, source, url, kind, round
+        ''', (owner, now + self.config["lease_seconds"], now, limit)).fetchall()
+        self.conn.commit()
+        for _, source, _, _, _ in rows:
+            LEASES_CLAIMED.inc(source=source)
+        return rows
+
+    def complete(self, lease_id: int, owner: str, items: int):
+        self.conn.execute('''
+            UPDATE crawl_leases SET state = 'done', items = ?, done_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ? AND lease_owner = ?
+        ''', (items, lease_id, owner))
+        self.conn.commit()
+
+    def fail(self, lease_id: int, owner: str, error: str):
+        """Devolve a URL para a fila, ou marca como falha depois de max_attempts"""
+        self.conn.execute('''
+            UPDATE crawl_leases
+            SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                lease_owner = NULL, lease_expires = 0, last_error = ?
+            WHERE id = ? AND lease_owner = ?
+        ''', (self.config["max_attempts"], error[:500], lease_id, owner))
+        self.conn.commit()
+
+    def acquire_slot(self, host: str, interval: float) -> float:
+        """Reserva o próximo horário de requisição do host e espera por ele; retorna a espera"""
+        if interval <= 0:
+            return 0.0
+        now = time.time()
+        start = self.conn.execute('''
+            INSERT INTO crawl_rate_slots (host, next_allowed) VALUES (?, ?)
+            ON CONFLICT(host) DO UPDATE SET next_allowed = MAX(next_allowed, ?) + ?
+            RETURNING next_allowed - ?
+        ''', (host, now + interval, now, interval, interval)).fetchone()[0]
+        self.conn.commit()
+        wait = max(0.0, start - now)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def outstanding(self) -> int:
+        return self.conn.execute('''
+            SELECT COUNT(*) FROM crawl_leases WHERE state IN ('pending', 'leased')
+        ''').fetchone()[0]
+
+    def status(self) -> Dict:
+        states = dict(self.conn.execute("SELECT state, COUNT(*) FROM crawl_leases GROUP BY state").fetchall())
+        return {"round": self.current_round(), "states": states,
+                "items": self.conn.execute("SELECT COALESCE(SUM(items), 0) FROM crawl_leases").fetchone()[0]}
+
+    def close(self):
+        self.conn.close()
+
+
+class CrawlWorker:
+    """Reserva URLs, baixa, extrai e grava pelo caminho normal de upsert do scraper"""
+
+    def __init__(self, scraper, queue: CrawlQueue, worker_id: Optional[str] = None, adapters: Optional[Dict] = None):
+        from sources.base import build_adapters
+        self.scraper = scraper
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.adapters = adapters if adapters is not None else build_adapters(scraper)
+        # O ritmo global por host é dos slots da fila; o controlador HTTP local só cuida de retries/AIMD
+        self.interval = scraper.config.get("delay_between_requests", 2)
+        scraper.http.min_interval = 0.0
+        self.processed = 0
+
+    def run(self, follow: bool = False, max_leases: Optional[int] = None) -> int:
+        """Processa até a fila esvaziar (ou para sempre com follow); retorna URLs processadas"""
+        poll = self.queue.config["poll_interval"]
+        while max_leases is None or self.processed < max_leases:
+            leases = self.queue.claim(self.worker_id)
+            if not leases:
+                # Outros workers ainda podem enfileirar tópicos a partir das listagens em andamento
+                if not follow and self.queue.outstanding() == 0:
+                    break
+                time.sleep(poll)
+                continue
+            for lease in leases:
+                self.process(lease)
+        return self.processed
+
+    def process(self, lease: Lease):
+        lease_id, source, url, kind, round_id = lease
+        adapter = self.adapters.get(source)
+        if adapter is None:
+            self.queue.fail(lease_id, self.worker_id, f"source {source} not enabled on this worker")
+            return
+        try:
+            self.queue.acquire_slot(urlparse(url).netloc, self.interval)
+            raw, follow_ups = adapter.process(url, kind)
+            if follow_ups:
+                self.queue.enqueue([(source, next_url, next_kind) for next_url, next_kind in follow_ups], round_id)
+            items = adapter.parse_page(raw) if raw is not None else []
+            if items is None:
+                raise ValueError("parse failed")
+            if items:
+                self.scraper.save_items_to_database(items)
+            if adapter.snapshot_diff and adapter.crawled:
+                # Diff por página, logo depois de gravá-la (cada URL é de um worker só por rodada)
+                self.scraper.diff_crawls({source: adapter})
+                adapter.crawled.clear()
+            self.queue.complete(lease_id, self.worker_id, len(items))
+        except Exception as e:
+            LEASES_FAILED.inc(source=source)
+            logger.error(f"Worker {self.worker_id} failed on {url}: {e}")
+            self.queue.fail(lease_id, self.worker_id, str(e))
+        self.processed += 1
+
+
+def run_worker_process(config_file: str, worker_id: str, follow: bool = False,
+                       log_file: str = 'wurm_scraper.log') -> int:
+    """Entrada de um processo worker (multiprocessing.Process ou `main.py crawl worker`)"""
+    from main import WurmMarketScraper, configure_logging
+
+    configure_logging(log_file)
+    scraper = WurmMarketScraper(config_file)
+    queue = scraper.crawl_queue()
+    worker = CrawlWorker(scraper, queue, worker_id)
+    try:
+        return worker.run(follow=follow)
+    finally:
+        queue.close()
+        scraper.close()
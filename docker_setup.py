@@ -34,6 +34,9 @@ COPY . .
 # Executa setup inicial
 RUN python3 setup_scraper.py
 
+# Build do frontend (CSS/JS com hash, .br/.gz) antes de subir a API
+RUN python3 main.py assets
+
 EXPOSE 5000
 
 CMD ["python3", "web_integration.py"]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Expiry engine for Wurm Online Market Tracker
+Expira anúncios antigos em lotes pequenos usando a coluna updated_epoch
+"""
+
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Expressão SQL do "agora" em epoch, consistente com CURRENT_TIMESTAMP (UTC)
+EPOCH_NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def ensure_expiry_schema(conn: sqlite3.Connection):
+    """Adiciona updated_epoch em bancos antigos, preenche e cria o índice"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(market_items)")}
+    if "updated_epoch" not in columns:
+        conn.execute("ALTER TABLE market_items ADD COLUMN updated_epoch INTEGER")
+        backfill_epochs(conn)
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_items_status_epoch
+        ON market_items(status, updated_epoch)
+    ''')
+    conn.commit()
+
+
+def backfill_epochs(conn: sqlite3.Connection, batch_size: int = 5000) -> int:
+    """Converte updated_at em epoch para linhas ainda sem updated_epoch"""
+    total = 0
+    while True:
+        updated = conn.execute(f'''
+            UPDATE market_items
+            SET updated_epoch = COALESCE(CAST(strftime('%s', updated_at) AS INTEGER), 0)
+            WHERE id IN (
+                SELECT id FROM market_items WHERE updated_epoch IS NULL LIMIT {int(batch_size)}
+            )
+        ''').rowcount
+        conn.commit()
+        total += updated
+        if updated < batch_size:
+            return total
+
+
+class ExpiryEngine:
+    """Marca anúncios como 'expired' por TTL, em lotes com commit entre eles
+
+    Cada regra percorre o índice (status, updated_epoch) com paginação por
+    chave (updated_epoch, id), então nenhuma linha é reexaminada e o lock de
+    escrita dura apenas um lote.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, config: Optional[Dict] = None):
+        config = config or {}
+        self.conn = conn
+        self.default_ttl_days = float(config.get("default_ttl_days", 30))
+        self.source_ttl_days = dict(config.get("source_ttl_days", {}))
+        self.category_ttl_days = dict(config.get("category_ttl_days", {}))
+        self.batch_size = int(config.get("batch_size", 500))
+        self.pause = float(config.get("pause_ms", 5)) / 1000
+
+    def rules(self) -> List[Tuple[str, str, list, float]]:
+        """Regras (nome, filtro SQL, parâmetros, ttl); categoria tem prioridade sobre fonte"""
+        rules = []
+        categories = list(self.category_ttl_days)
+        sources = list(self.source_ttl_days)
+        not_categories = ""
+        if categories:
+            not_categories = f" AND COALESCE(category, '') NOT IN ({', '.join('?' * len(categories))})"
+
+        for category, ttl in self.category_ttl_days.items():
+            rules.append((f"category:{category}", " AND category = ?", [category], float(ttl)))
+
+        for source, ttl in self.source_ttl_days.items():
+            rules.append((f"source:{source}", " AND source = ?" + not_categories,
+                          [source] + categories, float(ttl)))
+
+        not_sources = ""
+        if sources:
+            not_sources = f" AND COALESCE(source, '') NOT IN ({', '.join('?' * len(sources))})"
+        rules.append(("default", not_sources + not_categories, sources + categories,
+                      self.default_ttl_days))
+        return rules
+
+    def run(self, now: Optional[int] = None) -> Dict[str, int]:
+        """Executa todas as regras e retorna quantas linhas cada uma expirou"""
+        backfill_epochs(self.conn, self.batch_size)
+        now = int(now if now is not None else time.time())
+
+        results = {}
+        for name, where, params, ttl in self.rules():
+            cutoff = now - int(ttl * 86400)
+            results[name] = self.expire_before(cutoff, where, params)
+        return results
+
+    def expire_before(self, cutoff: int, where: str = "", params: Optional[list] = None) -> int:
+        """Expira linhas ativas com updated_epoch < cutoff que satisfaçam o filtro"""
+        from storage import notify_retire  # storage importa EPOCH_NOW_SQL daqui
+
+        params = params or []
+        last_epoch, last_id = -1, -1
+        total = 0
+
+        while True:
+            rows = self.conn.execute(f'''
+                SELECT id, updated_epoch, listing_key FROM market_items INDEXED BY idx_items_status_epoch
+                WHERE status = 'active' AND updated_epoch < ?
+                  AND (updated_epoch, id) > (?, ?){where}
+                ORDER BY updated_epoch, id
+                LIMIT ?
+            ''', [cutoff, last_epoch, last_id] + params + [self.batch_size]).fetchall()
+            if not rows:
+                break
+
+            ids = [row[0] for row in rows]
+            self.conn.execute(
+                f"UPDATE market_items SET status = 'expired' WHERE id IN ({', '.join('?' * len(ids))})",
+                ids
+            )
+            self.conn.commit()
+            notify_retire(self.conn, [row[2] for row in rows if row[2] is not None])
+
+            total += len(ids)
+            last_id, last_epoch = rows[-1][:2]
+            if len(rows) < self.batch_size:
+                break
+            if self.pause:
+                time.sleep(self.pause)
+
+        return total
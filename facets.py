@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Faceted search for Wurm Online Market Tracker
+Bitsets (int do Python) por valor de servidor, categoria e faixa de preço sobre os anúncios ativos
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACET_CONFIG = {
+    "enabled": True,
+    "price_bands": [1, 5, 10, 50, 100, 500],  # Limites das faixas de preço (prata)
+    "refresh_interval": 60.0,                 # Intervalo mínimo entre reconstruções (~8s de CPU por 1M anúncios)
+    "dense_token_ratio": 0.02,                # Tokens em mais que essa fração dos anúncios viram bitset
+}
+
+FACETS = ("server", "category", "price_band")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+UNPRICED = "unpriced"
+SKIP_CHUNK = 4096  # Bytes por bloco ao pular posições de um offset
+
+
+def band_labels(edges: Sequence[float]) -> List[str]:
+    def fmt(value):
+        return f"{value:g}"
+    labels = [f"<{fmt(edges[0])}"]
+    labels += [f"{fmt(low)}-{fmt(high)}" for low, high in zip(edges, edges[1:])]
+    labels.append(f"{fmt(edges[-1])}+")
+    return labels
+
+
+def positions_to_bits(positions: Iterable[int], size: int) -> int:
+    buf = bytearray((size + 7) // 8)
+    for position in positions:
+        buf[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buf, "little")
+
+
+def iter_positions(bits: int, size: int, skip: int = 0) -> Iterable[int]:
+    """Posições ligadas em ordem crescente, pulando as `skip` primeiras (varredura em C)"""
+    data = bits.to_bytes((size + 7) // 8, "little")
+    start = 0
+    # Pula blocos inteiros pelo popcount antes de descer aos bytes
+    while skip and start < len(data):
+        count = int.from_bytes(data[start:start + SKIP_CHUNK], "little").bit_count()
+        if count > skip:
+            break
+        skip -= count
+        start += SKIP_CHUNK
+    for match in NONZERO_BYTE_RE.finditer(data, start):
+        index = match.start()
+        byte = data[index]
+        base = index << 3
+        while byte:
+            low = byte & -byte
+            byte ^= low
+            if skip:
+                skip -= 1
+                continue
+            yield base + low.bit_length() - 1
+
+
+class FacetSnapshot:
+    """Índice imutável de uma leitura de market_items (posição = ordem por updated_epoch desc)"""
+
+    def __init__(self, rows: List[tuple], edges: Sequence[float], dense_ratio: float):
+        self.size = len(rows)
+        self.all = (1 << self.size) - 1
+        self.ids = array("q", (row[0] for row in rows))
+        self.prices = array("d", (row[3] or 0.0 for row in rows))
+        self.labels = band_labels(edges)
+        positions: Dict[str, Dict[str, List[int]]] = {facet: defaultdict(list) for facet in FACETS}
+        postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        for position, (_, server, category, price, name) in enumerate(rows):
+            positions["server"][server or "unknown"].append(position)
+            positions["category"][category or "other"].append(position)
+            band = self.labels[bisect_right(edges, price)] if price and price > 0 else UNPRICED
+            positions["price_band"][band].append(position)
+            for token in set(TOKEN_RE.findall((name or "").lower())):
+                postings[token].append(position)
+        self.values: Dict[str, Dict[str, int]] = {
+            facet: {value: positions_to_bits(found, self.size) for value, found in by_value.items()}
+            for facet, by_value in positions.items()
+        }
+        # Posições de cada faixa já ordenadas por preço (ordenação de página sem sort por requisição)
+        self.band_order: Dict[str, array] = {
+            band: array("I", sorted(found, key=self.prices.__getitem__))
+            for band, found in positions["price_band"].items()
+        }
+        # Tokens comuns ficam como bitset; os raros como lista de posições (int denso custaria size/8 bytes)
+        dense_min = max(1, int(self.size * dense_ratio))
+        self.vocabulary = sorted(postings)
+        self.tokens: Dict[str, object] = {
+            token: positions_to_bits(found, self.size) if len(found) >= dense_min else found
+            for token, found in postings.items()
+        }
+
+    def lookup(self, facet: str, wanted: Iterable[str]) -> int:
+        """OR dos bitsets dos valores pedidos (comparação sem diferenciar maiúsculas)"""
+        by_lower = {value.lower(): bits for value, bits in self.values[facet].items()}
+        bits = 0
+        for value in wanted:
+            bits |= by_lower.get(value.lower(), 0)
+        return bits
+
+    def text_bits(self, text: str) -> int:
+        """AND por termo da busca; cada termo casa como prefixo de uma palavra do nome"""
+        result = self.all
+        for term in TOKEN_RE.findall(text.lower()):
+            start = bisect_left(self.vocabulary, term)
+            end = bisect_left(self.vocabulary, term + "\uffff", start)
+            dense, sparse = 0, []
+            for token in self.vocabulary[start:end]:
+                found = self.tokens[token]
+                if isinstance(found, int):
+                    dense |= found
+                else:
+                    sparse.append(found)
+            if sparse:
+                dense |= positions_to_bits((p for found in sparse for p in found), self.size)
+            result &= dense
+            if not result:
+                break
+        return result
+
+
+class FacetIndex:
+    """Busca facetada sobre um FacetSnapshot mantido em memória pela API
+
+    Mudanças no banco são detectadas por PRAGMA data_version (muda quando
+    outra conexão faz commit); a reconstrução roda numa thread e as buscas
+    continuam no snapshot anterior até ela terminar. As contagens de cada
+    faceta aplicam os filtros das outras facetas, não o dela mesma.
+    """
+
+    def __init__(self, db_path: str, config: Optional[Dict] = None):
+        self.db_path = db_path
+        self.config = dict(DEFAULT_FACET_CONFIG, **(config or {}))
+        self.edges = sorted(self.config["price_bands"])
+        self._version_conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[FacetSnapshot] = None
+        self._version = None
+        self._built_at = 0.0
+        self._building = False
+
+    def read_version(self) -> int:
+        with self._lock:
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def build(self) -> FacetSnapshot:
+        version = self.read_version()
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # Varredura sequencial + sort: pelo índice de status seriam 1M leituras aleatórias de linha
+            rows = conn.execute('''
+                SELECT id, server, category, price, name FROM market_items
+                WHERE +status = 'active' ORDER BY updated_epoch DESC, id DESC
+            ''').fetchall()
+        finally:
+            conn.close()
+        snapshot = FacetSnapshot(rows, self.edges, self.config["dense_token_ratio"])
+        with self._lock:
+            self._snapshot, self._version, self._built_at = snapshot, version, time.monotonic()
+        logger.info(f"Facet index built: {snapshot.size} listings in {time.perf_counter() - started:.2f}s")
+        return snapshot
+
+    def snapshot(self) -> FacetSnapshot:
+        if self._snapshot is None:
+            return self.build()
+        version = self.read_version()
+        with self._lock:
+            stale = (version != self._version and not self._building
+                     and time.monotonic() - self._built_at >= self.config["refresh_interval"])
+            if stale:
+                self._building = True
+        if stale:
+            threading.Thread(target=self._rebuild, name="facet-index", daemon=True).start()
+        return self._snapshot
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.error(f"Facet index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def search(self, filters: Dict[str, List[str]], text: str = "", sort: str = "recent",
+               limit: int = 50, offset: int = 0) -> Dict:
+        """{total, ids (página), facets: {faceta: {valor: contagem}}}"""
+        snap = self.snapshot()
+        base = snap.text_bits(text) if text else snap.all
+        masks = {facet: snap.lookup(facet, wanted) for facet, wanted in filters.items() if wanted}
+
+        facets = {}
+        for facet in FACETS:
+            others = base
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            counts = {}
+            for value, bits in snap.values[facet].items():
+                count = (bits & others).bit_count()
+                if count:
+                    counts[value] = count
+            facets[facet] = counts
+
+        matched = base
+        for mask in masks.values():
+            matched &= mask
+        return {
+            "total": matched.bit_count(),
+            "ids": [snap.ids[position] for position in self.page(snap, matched, sort, limit, offset)],
+            "facets": facets,
+        }
+
+    def page(self, snap: FacetSnapshot, matched: int, sort: str, limit: int, offset: int) -> List[int]:
+        if sort == "recent":
+            return list(islice(iter_positions(matched, snap.size, offset), limit))
+
+        # Por preço: percorre as faixas em ordem, pulando inteiras as que ficam antes do offset; sem preço por último
+        descending = sort == "price_desc"
+        bands = (snap.labels[::-1] if descending else snap.labels) + [UNPRICED]
+        positions: List[int] = []
+        data = None
+        for band in bands:
+            bits = matched & snap.values["price_band"].get(band, 0)
+            count = bits.bit_count()
+            if offset >= count:
+                offset -= count
+                continue
+            wanted = offset + limit - len(positions)
+            ordered = snap.band_order[band]
+            if count * 8 < len(ordered):
+                # Poucos casamentos na faixa: ordena só eles
+                found = sorted(iter_positions(bits, snap.size), key=snap.prices.__getitem__, reverse=descending)
+            else:
+                # Muitos: percorre a ordem pré-calculada testando o bit de cada posição
+                if data is None:
+                    data = matched.to_bytes((snap.size + 7) // 8, "little")
+                found = []
+                for position in (reversed(ordered) if descending else ordered):
+                    if data[position >> 3] >> (position & 7) & 1:
+                        found.append(position)
+                        if len(found) >= wanted:
+                            break
+            positions.extend(found[offset:wanted])
+            offset = 0
+            if len(positions) >= limit:
+                break
+        return positions
+
+    def close(self):
+        with self._lock:
+            self._version_conn.close()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Outbound request controller for Wurm Online Market Tracker
+Concorrência adaptativa (AIMD) por host, Retry-After, retries com backoff e circuit breaker por fonte
+"""
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import metrics
+from sources.base import instrumented_get
+
+logger = logging.getLogger(__name__)
+
+# Respostas que valem nova tentativa; 429/503 também reduzem a concorrência do host
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}
+
+DEFAULT_HTTP_CONFIG = {
+    "initial_concurrency": 2,
+    "min_concurrency": 1,
+    "max_concurrency": 8,
+    "increase_step": 1.0,      # Aumento aditivo por "janela" (limit respostas boas)
+    "decrease_factor": 0.5,    # Corte multiplicativo em 429/503/timeout/latência alta
+    "latency_target": 3.0,     # Segundos; acima disso o host é tratado como sobrecarregado
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 30.0,       # Também o maior Retry-After aceito antes de desistir
+    "breaker_failures": 5,     # Falhas seguidas que abrem o circuito da fonte
+    "breaker_reset": 300,      # Segundos com o circuito aberto antes de testar de novo
+}
+
+FETCH_RETRIES = metrics.registry.counter("wurm_fetch_retries_total", "Retried outbound fetches by host and reason")
+CIRCUIT_REJECTED = metrics.registry.counter("wurm_circuit_rejected_total",
+                                            "Fetches refused because the source circuit is open")
+
+
+class CircuitOpenError(Exception):
+    """A fonte está estacionada pelo circuit breaker"""
+
+
+class HostLimiter:
+    """Limite de requisições simultâneas de um host, ajustado por AIMD
+
+    Respostas rápidas aumentam o limite aos poucos (increase_step a cada
+    "limit" respostas); 429/503, timeouts e latência acima do alvo cortam o
+    limite pela metade. not_before espaça o início das requisições
+    (delay_between_requests) e segura o host inteiro durante um Retry-After.
+    """
+
+    def __init__(self, host: str, initial: float, minimum: float, maximum: float,
+                 increase_step: float, decrease_factor: float, latency_target: float, min_interval: float):
+        self.host = host
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.min_interval = min_interval
+        self.in_flight = 0
+        self.not_before = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.not_before:
+                    self._cond.wait(self.not_before - now)
+                elif self.in_flight >= max(1, int(self.limit)):
+                    self._cond.wait()
+                else:
+                    self.in_flight += 1
+                    self.not_before = now + self.min_interval
+                    return
+
+    def release(self, latency: Optional[float], overloaded: bool):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded or (latency is not None and latency > self.latency_target):
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + self.increase_step / self.limit)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Segura novas requisições ao host (Retry-After)"""
+        with self._cond:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Fechado -> aberto após N falhas seguidas -> meio-aberto após reset_timeout
+
+    Meio-aberto deixa passar uma única requisição de teste: sucesso fecha o
+    circuito, falha reabre.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def parse_retry_after(response) -> Optional[float]:
+    """Retry-After em segundos (aceita número ou data HTTP)"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestController:
+    """Todas as requisições de saída das fontes passam por aqui"""
+
+    def __init__(self, session, config: Optional[Dict] = None, min_interval: float = 0.0):
+        self.session = session
+        self.config = dict(DEFAULT_HTTP_CONFIG, **(config or {}))
+        self.min_interval = min_interval
+        self._limiters: Dict[str, HostLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, host: str) -> HostLimiter:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                cfg = self.config
+                limiter = self._limiters[host] = HostLimiter(
+                    host, cfg["initial_concurrency"], cfg["min_concurrency"], cfg["max_concurrency"],
+                    cfg["increase_step"], cfg["decrease_factor"], cfg["latency_target"], self.min_interval
+                )
+            return limiter
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name, self.config["breaker_failures"], self.config["breaker_reset"]
+                )
+            return breaker
+
+    def backoff(self, attempt: int) -> float:
+        """Backoff exponencial com jitter completo"""
+        ceiling = min(self.config["backoff_max"], self.config["backoff_base"] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def get(self, url: str, source: Optional[str] = None, session=None, **kwargs):
+        """GET com limite por host, retries e circuit breaker da fonte (ou do host)"""
+        host = urlparse(url).netloc
+        breaker = self.breaker(source or host)
+        if not breaker.allow():
+            CIRCUIT_REJECTED.inc(source=breaker.name)
+            raise CircuitOpenError(f"Circuit open for {breaker.name}, skipping {url}")
+
+        limiter = self.limiter(host)
+        max_retries = self.config["max_retries"]
+        succeeded = False
+        try:
+            for attempt in range(max_retries + 1):
+                limiter.acquire()
+                start = time.monotonic()
+                latency = None
+                overloaded = False
+                try:
+                    response = instrumented_get(session or self.session, url, **kwargs)
+                    latency = time.monotonic() - start
+                except Exception as e:
+                    error_response = getattr(e, "response", None)
+                    status = getattr(error_response, "status_code", None)
+                    # Sem resposta (timeout, conexão recusada) também conta como sobrecarga
+                    overloaded = status in OVERLOAD_STATUSES or (status is None and isinstance(e, OSError))
+                    retryable = status in RETRY_STATUSES or (status is None and isinstance(e, OSError))
+                    if not retryable:
+                        # 404/403 etc.: o host respondeu, então o circuito (e o teste do meio-aberto) fica bem
+                        succeeded = status is not None
+                        raise
+                    if attempt == max_retries:
+                        raise
+
+                    retry_after = parse_retry_after(error_response)
+                    if retry_after is not None and retry_after > self.config["backoff_max"]:
+                        raise
+                    reason = status or type(e).__name__
+                    FETCH_RETRIES.inc(host=host, reason=reason)
+                    if retry_after is not None:
+                        logger.warning(f"{host} asked to retry after {retry_after:.1f}s ({reason})")
+                        limiter.pause(retry_after)
+                    else:
+                        delay = self.backoff(attempt)
+                        logger.warning(f"Retrying {url} in {delay:.2f}s ({reason}, attempt {attempt + 1})")
+                        time.sleep(delay)
+                    continue
+                finally:
+                    limiter.release(latency, overloaded)
+
+                succeeded = True
+                return response
+        finally:
+            # Toda saída resolve o circuito; senão um teste do meio-aberto ficaria pendurado
+            if succeeded:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    def status(self) -> Dict:
+        """Estado atual dos limites e circuitos (para logs e diagnóstico)"""
+        with self._lock:
+            return {
+                "hosts": {host: {"limit": round(l.limit, 2), "in_flight": l.in_flight}
+                          for host, l in self._limiters.items()},
+                "circuits": {name: b.state for name, b in self._breakers.items()},
+            }
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Ingest log for Wurm Online Market Tracker
+Log local append-only e segmentado entre os scrapers e o SQLite, drenado por um committer com checkpoint
+"""
+
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from models import MarketItem
+from serialization import dumps, loads
+from storage import notify_ingest, upsert_items
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho de cada registro: magic, tamanho do payload, crc32 do payload
+RECORD_HEADER = struct.Struct(">4sII")
+RECORD_MAGIC = b"WIL1"
+SEGMENT_PREFIX = "ingest-"
+SEGMENT_SUFFIX = ".log"
+
+# Posição no log: (segmento, offset do próximo registro)
+Position = Tuple[int, int]
+
+DEFAULT_INGEST_LOG_CONFIG = {
+    "enabled": True,
+    "path": "ingest_log",
+    "segment_size_mb": 16,
+    "batch_size": 5000,       # Itens por transação do committer
+    "commit_interval": 1.0,   # Segundos entre drenagens durante o scrape
+    "batch_pause": 0.05,      # Pausa entre lotes, deixando o lock de escrita livre para a API
+    "fsync": False,           # fsync a cada append (mais lento; o padrão sobrevive a crash do processo)
+    "retain_segments": 2,     # Segmentos já aplicados mantidos para replay
+}
+
+LOG_APPENDED = metrics.registry.counter("wurm_ingest_log_appended_total", "Items appended to the ingest log")
+LOG_COMMITTED = metrics.registry.counter("wurm_ingest_log_committed_total", "Items drained from the ingest log")
+
+
+def ensure_ingest_log_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_log_checkpoints (
+            name TEXT PRIMARY KEY,
+            segment INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def encode_item(item: MarketItem) -> bytes:
+    return dumps(asdict(item))
+
+
+def decode_item(payload: bytes) -> MarketItem:
+    return MarketItem(**loads(payload))
+
+
+class IngestLog:
+    """Segmentos ingest-NNNNNN.log com registros [cabeçalho][JSON do item]
+
+    append() é thread-safe (as fontes rodam em paralelo). Um registro
+    incompleto ou com crc errado no fim do último segmento (crash no meio
+    de uma escrita) marca o fim do log e é sobrescrito no próximo append.
+    """
+
+    def __init__(self, root: str, segment_size_mb: int = 16, fsync: bool = False):
+        self.root = root
+        self.segment_size = segment_size_mb * 1024 * 1024
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        segments = self.segments()
+        self._segment_id = segments[-1] if segments else 1
+        self._file = None
+        self._open_segment(self._segment_id)
+
+    def segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.root, f"{SEGMENT_PREFIX}{segment_id:06d}{SEGMENT_SUFFIX}")
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.root)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _open_segment(self, segment_id: int):
+        if self._file:
+            self._file.close()
+        path = self.segment_path(segment_id)
+        end = 0
+        if os.path.exists(path):
+            # Descarta um registro parcial deixado por um crash
+            for end, _ in iter_records(path, 0):
+                pass
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self._file.truncate(end)
+        self._file.seek(end)
+        self._segment_id = segment_id
+
+    def append(self, items: Iterable[MarketItem]) -> int:
+        records = []
+        for item in items:
+            payload = encode_item(item)
+            records.append(RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload)
+        if not records:
+            return 0
+        data = b"".join(records)
+        with self._lock:
+            if self._file.tell() and self._file.tell() + len(data) > self.segment_size:
+                self._open_segment(self._segment_id + 1)
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        LOG_APPENDED.inc(len(records))
+        return len(records)
+
+    def end(self) -> Position:
+        with self._lock:
+            return self._segment_id, self._file.tell()
+
+    def read_from(self, position: Position) -> Iterator[Tuple[Position, MarketItem]]:
+        """(posição depois do registro, item) a partir de uma posição, até o fim atual"""
+        segment_id, offset = position
+        for current in self.segments():
+            if current < segment_id:
+                continue
+            start = offset if current == segment_id else 0
+            for end, payload in iter_records(self.segment_path(current), start):
+                yield (current, end), decode_item(payload)
+
+    def prune(self, position: Position, retain: int = 2):
+        """Apaga segmentos inteiramente aplicados, mantendo os `retain` mais recentes deles"""
+        applied = [segment for segment in self.segments() if segment < position[0]]
+        for segment in applied[:max(0, len(applied) - retain)]:
+            os.remove(self.segment_path(segment))
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def iter_records(path: str, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """(offset do fim do registro, payload) até o fim do arquivo ou o primeiro registro inválido"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            magic, length, crc = RECORD_HEADER.unpack(header)
+            if magic != RECORD_MAGIC:
+                return
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += RECORD_HEADER.size + length
+            yield offset, payload
+
+
+class IngestCommitter:
+    """Drena o log para market_items em lotes limitados
+
+    Cada lote é gravado (upsert + checkpoint) numa única transação, então
+    depois de um crash a drenagem recomeça exatamente do último lote
+    commitado. Listeners de ingestão recebem cada lote depois do commit.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, log: IngestLog, name: str = "main",
+                 batch_size: int = 5000, batch_pause: float = 0.05, retain_segments: int = 2):
+        self.conn = conn
+        self.log = log
+        self.name = name
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.retain_segments = retain_segments
+        self.committed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        ensure_ingest_log_schema(conn)
+
+    def checkpoint(self) -> Position:
+        row = self.conn.execute(
+            "SELECT segment, offset FROM ingest_log_checkpoints WHERE name = ?", (self.name,)
+        ).fetchone()
+        if row is None:
+            segments = self.log.segments()
+            return (segments[0] if segments else 1), 0
+        return row[0], row[1]
+
+    def reset(self, position: Position):
+        """Move o checkpoint (ex.: para reaplicar um segmento retido)"""
+        self.conn.execute('''
+            INSERT INTO ingest_log_checkpoints (name, segment, offset) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET segment = excluded.segment, offset = excluded.offset,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (self.name, *position))
+        self.conn.commit()
+
+    def drain(self, max_batches: Optional[int] = None) -> int:
+        """Aplica o que houver no log a partir do checkpoint; retorna itens aplicados"""
+        applied = batches = 0
+        batch: List[MarketItem] = []
+        position = self.checkpoint()
+        for position, item in self.log.read_from(position):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.flush(batch, position)
+                applied += len(batch)
+                batch = []
+                batches += 1
+                if max_batches is not None and batches >= max_batches:
+                    return applied
+                if self.batch_pause:
+                    time.sleep(self.batch_pause)
+        if batch:
+            self.flush(batch, position)
+            applied += len(batch)
+        self.log.prune(position, self.retain_segments)
+        return applied
+
+    def flush(self, batch: List[MarketItem], position: Position):
+        with metrics.DB_LOCK_WAIT_SECONDS.time():
+            self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            with metrics.DB_UPSERT_SECONDS.time():
+                inserted, updated = upsert_items(self.conn, batch)
+            self.conn.execute('''
+                INSERT INTO ingest_log_checkpoints (name, segment, offset) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET segment = excluded.segment, offset = excluded.offset,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (self.name, *position))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        metrics.DB_ROWS_WRITTEN.inc(inserted, operation="insert")
+        metrics.DB_ROWS_WRITTEN.inc(updated, operation="update")
+        LOG_COMMITTED.inc(len(batch))
+        self.committed += len(batch)
+        notify_ingest(self.conn, batch)
+
+    def start(self, interval: float = 1.0):
+        """Drena em segundo plano enquanto as fontes escrevem no log"""
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.drain()
+                except Exception as e:
+                    logger.error(f"Ingest committer failed: {e}")
+
+        self._thread = threading.Thread(target=run, name=f"ingest-committer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> int:
+        """Para a thread e drena o restante; retorna o total aplicado desde o início"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.drain()
+        return self.committed
+
+    def status(self) -> Dict:
+        segment, offset = self.checkpoint()
+        end_segment, end_offset = self.log.end()
+        return {"checkpoint": [segment, offset], "end": [end_segment, end_offset],
+                "segments": self.log.segments(), "committed": self.committed}
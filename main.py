@@ -4,58 +4,63 @@ Wurm Online Market Data Scraper
 Coleta dados de mercado de múltiplas fontes para o Wurm Online Market Tracker
 """
 
-import requests
-from bs4 import BeautifulSoup
+import argparse
 import json
 import re
 import time
 import sqlite3
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional, Union
+from typing import Any, Callable, List, Dict, Optional, Union
 import logging
 from urllib.parse import urljoin, urlparse
-import discord
-from discord.ext import tasks
-import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import csv
+import multiprocessing
 import os
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+from models import MarketItem
+from sources import build_adapters, get_adapter_class
+from sources.base import RawPage, ensure_checkpoint_table
+from sources.topics import first_post_text
+from serialization import row_encoder
+from archival import MarketArchiver, retired_statuses
+from expiry import ExpiryEngine, ensure_expiry_schema
+import metrics
+import profiling
+from page_archive import PageArchive, ReExtractor
+from columnar import ColumnarExporter
+from static_assets import AssetPipeline
+from replica import ReplicaPublisher, acquire_publisher, release_publisher
+from crawl_diff import SnapshotDiffer, ensure_diff_schema
+from crawl_queue import CrawlQueue, CrawlWorker, default_worker_id, run_worker_process
+from ingest_log import DEFAULT_INGEST_LOG_CONFIG, IngestCommitter, IngestLog, ensure_ingest_log_schema
+from http_controller import RequestController
+from attributes import AttributeExtractor, ensure_attribute_schema, prune_attributes
+from config_service import (DEFAULT_RELOAD_CONFIG, ConfigService, ConfigSnapshot, Matchers, Recategorizer,
+                            categories_changed, validate)
+from storage import (add_ingest_listener, add_retire_listener, ensure_listing_key_schema, notify_ingest,
+                     upsert_items)
+from arbitrage import ArbitrageEngine, ensure_arbitrage_schema, top_spreads
+from sketches import SketchEngine, ensure_sketch_schema, price_quantiles
+from watchlist import WatchlistEngine, deliver_outbox, ensure_watchlist_schema
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('wurm_scraper.log'),
-        logging.StreamHandler()
-    ]
-)
+# requests, bs4, selenium e o cliente do Discord são importados sob demanda,
+# só quando a fonte ou o modo que os usa está habilitado
 logger = logging.getLogger(__name__)
 
-@dataclass
-class MarketItem:
-    """Classe para representar um item do mercado"""
-    name: str
-    category: str
-    price: float
-    cost: Optional[float] = None
-    quality: Optional[int] = None
-    enchantments: Optional[str] = None
-    server: str = "unknown"
-    seller: str = "unknown"
-    location: str = "unknown"
-    quantity: int = 1
-    timestamp: str = ""
-    source: str = "forum"
-    url: str = ""
-    description: str = ""
-    contact: str = ""
-    status: str = "active"  # active, sold, expired
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+def configure_logging(log_file: str = 'wurm_scraper.log', level: int = logging.INFO):
+    """Configura logging em arquivo e console (chamado pelo CLI, não no import)"""
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
 
 def load_config_safe(self, config_file: str) -> Dict:
     """Carrega config com tratamento de erro melhorado"""
@@ -81,17 +86,184 @@ def load_config_safe(self, config_file: str) -> Dict:
 class WurmMarketScraper:
     """Scraper principal para dados de mercado do Wurm Online"""
     
-    def __init__(self, config_file="config.json"):
-        self.config = self.load_config(config_file)
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+    def __init__(self, config_file="config.json", overrides: Optional[Dict] = None):
+        self.config_file = config_file
+        # Config e matchers compilados; overrides em memória (ex.: banco :memory: da reextração) valem em toda versão
+        self.config_service = ConfigService(config_file, self.load_config, overrides)
+        self._recategorizer = None
+        self._session = None
+        self._http = None
+        self._page_archive = None
+        self._ingest_log = None
+        self._lazy_lock = threading.Lock()
         self.db_connection = self.init_database()
         self.selenium_driver = None
         
-    def load_config(self, config_file: str) -> Dict:
-        """Carrega configurações do arquivo JSON"""
+        # Estatísticas de arbitragem atualizadas a cada lote salvo (e a cada anúncio expirado/vendido)
+        arbitrage_config = self.config.get("arbitrage", {})
+        if arbitrage_config.get("enabled", True):
+            arbitrage = ArbitrageEngine(arbitrage_config, self.config.get("servers"))
+            add_ingest_listener("arbitrage", arbitrage.observe)
+            add_retire_listener("arbitrage", arbitrage.retract)
+            
+        # Sketches de quantis de preço (categoria, servidor, item)
+        sketch_config = self.config.get("price_sketches", {})
+        if sketch_config.get("enabled", True):
+            sketches = SketchEngine(sketch_config)
+            add_ingest_listener("price_sketches", sketches.observe)
+            add_retire_listener("price_sketches", sketches.retract)
+            
+        # Regras de alerta avaliadas sobre cada lote salvo
+        watchlist_config = self.config.get("watchlist", {})
+        if watchlist_config.get("enabled", True):
+            add_ingest_listener("watchlist", WatchlistEngine(watchlist_config).observe)
+            
+        # Snapshot somente-leitura para a API, publicado depois dos lotes commitados
+        # (o publicador é do processo: dentro da API, é o dela)
+        replica_config = self.config.get("replica", {})
+        self.replica_publisher = None
+        if replica_config.get("enabled", False) and self.config["database_path"] != ":memory:":
+            self.replica_publisher = acquire_publisher(self.config["database_path"], replica_config)
+            self._replica_baseline = self.db_connection.total_changes  # Migrações do init não contam
+        
+    @property
+    def config(self) -> Dict:
+        """Config em uso (trocado inteiro quando o arquivo é recarregado)"""
+        return self.config_service.config
+        
+    @property
+    def matchers(self) -> Matchers:
+        """Categorias, preços, servidores e atributos compilados da versão atual do config"""
+        return self.config_service.matchers
+        
+    @property
+    def attribute_extractor(self) -> AttributeExtractor:
+        """QL/encantamentos/raridade pelos padrões do config"""
+        return self.matchers.attributes
+        
+    def watch_config(self):
+        """Recarrega o config.json quando ele muda (processos de longa duração: agendador, workers)"""
+        reload_config = dict(DEFAULT_RELOAD_CONFIG, **self.config.get("config_reload", {}))
+        if not reload_config["enabled"]:
+            return
+        self.config_service.subscribe(self._on_config_change)
+        self.config_service.watch(reload_config["poll_interval"])
+        
+    def _on_config_change(self, previous: ConfigSnapshot, current: ConfigSnapshot):
+        reload_config = dict(DEFAULT_RELOAD_CONFIG, **current.config.get("config_reload", {}))
+        if reload_config["recategorize"] and categories_changed(previous, current):
+            self.recategorize(current.matchers, background=True)
+            
+    def recategorize(self, matchers: Optional[Matchers] = None, background: bool = False) -> int:
+        """Reaplica as categorias atuais aos anúncios ativos; em segundo plano, retorna 0 e segue numa thread"""
+        reload_config = dict(DEFAULT_RELOAD_CONFIG, **self.config.get("config_reload", {}))
+        with self._lazy_lock:
+            if self._recategorizer is None:
+                self._recategorizer = Recategorizer(
+                    self.open_connection,
+                    batch_size=reload_config["recategorize_batch"],
+                    pause=reload_config["recategorize_pause"],
+                    on_done=lambda changed: self._refresh_sketches()
+                )
+        if background:
+            self._recategorizer.start(matchers or self.matchers)
+            return 0
+        changed = self._recategorizer.run(matchers or self.matchers)
+        if changed:
+            self.rebuild_sketches()
+        return changed
+        
+    def _refresh_sketches(self):
+        # Sketches por categoria ficam velhos depois de recategorizar (roda na thread da recategorização)
+        if not self.config.get("price_sketches", {}).get("enabled", True):
+            return
+        conn = self.open_connection()
+        try:
+            SketchEngine(self.config.get("price_sketches")).rebuild(conn)
+        finally:
+            conn.close()
+        
+    @property
+    def session(self):
+        """Sessão HTTP, criada (e requests importado) no primeiro uso"""
+        with self._lazy_lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self._session.headers.update({'User-Agent': USER_AGENT})
+        return self._session
+        
+    @property
+    def http(self) -> RequestController:
+        """Controlador das requisições de saída (limites por host, retries, circuit breaker)"""
+        session = self.session
+        with self._lazy_lock:
+            if self._http is None:
+                self._http = RequestController(
+                    session, self.config.get("http"),
+                    min_interval=self.config.get("delay_between_requests", 2)
+                )
+        return self._http
+        
+    @property
+    def page_archive(self) -> Optional[PageArchive]:
+        """Arquivo de páginas brutas (None se desabilitado em config["page_archive"])"""
+        archive_config = self.config.get("page_archive", {})
+        if not archive_config.get("enabled", True):
+            return None
+        with self._lazy_lock:
+            if self._page_archive is None:
+                self._page_archive = PageArchive(
+                    archive_config.get("path", "page_archive"),
+                    segment_size_mb=archive_config.get("segment_size_mb", 64)
+                )
+        return self._page_archive
+        
+    @property
+    def ingest_log(self) -> Optional[IngestLog]:
+        """Log local de ingestão (None se desabilitado em config["ingest_log"])"""
+        log_config = dict(DEFAULT_INGEST_LOG_CONFIG, **self.config.get("ingest_log", {}))
+        if not log_config["enabled"]:
+            return None
+        with self._lazy_lock:
+            if self._ingest_log is None:
+                self._ingest_log = IngestLog(
+                    log_config["path"], segment_size_mb=log_config["segment_size_mb"], fsync=log_config["fsync"]
+                )
+        return self._ingest_log
+        
+    def ingest_committer(self) -> IngestCommitter:
+        """Committer do log com conexão própria (drena numa thread durante o scrape)"""
+        log_config = dict(DEFAULT_INGEST_LOG_CONFIG, **self.config.get("ingest_log", {}))
+        if self.config["database_path"] == ":memory:":
+            conn = self.db_connection
+        else:
+            conn = self.open_connection(check_same_thread=False)
+        return IngestCommitter(
+            conn, self.ingest_log,
+            batch_size=log_config["batch_size"],
+            batch_pause=log_config["batch_pause"],
+            retain_segments=log_config["retain_segments"]
+        )
+        
+    def crawl_queue(self) -> CrawlQueue:
+        """Fila de leases do modo distribuído (no banco de mercado ou num arquivo próprio)"""
+        queue_config = self.config.get("crawl_queue", {})
+        return CrawlQueue(queue_config.get("path") or self.config["database_path"], queue_config)
+        
+    def archive_page(self, raw: RawPage, source: str):
+        """Guarda a página obtida no arquivo (falhas não interrompem o scraping)"""
+        archive = self.page_archive
+        if archive is None:
+            return
+        try:
+            archive.store(raw, source)
+        except Exception as e:
+            logger.error(f"Error archiving page {raw.url}: {e}")
+        
+    @staticmethod
+    def load_config(config_file: str) -> Dict:
+        """Carrega configurações do arquivo JSON (também usado pela API, sem scraper)"""
         default_config = {
             "forum_base_url": "https://forum.wurmonline.com",
             "discord_token": "",  # Token do bot Discord (opcional)
@@ -99,6 +271,19 @@ class WurmMarketScraper:
             "max_pages": 10,
             "delay_between_requests": 2,
             "database_path": "wurm_market.db",
+            "archive": {
+                "database_path": "",  # Vazio = tabelas de arquivo no próprio banco
+                "batch_size": 2000,
+                "min_age_days": 7,
+                "vacuum_pages": 2000
+            },
+            "expiry": {
+                "default_ttl_days": 30,
+                "source_ttl_days": {},  # ex.: {"steam": 14}
+                "category_ttl_days": {},  # ex.: {"food": 7}
+                "batch_size": 500,
+                "pause_ms": 5
+            },
             "categories": {
                 "tools": ["axe", "pickaxe", "hammer", "saw", "knife"],
                 "weapons": ["sword", "spear", "bow", "arrow", "club"],
@@ -108,6 +293,50 @@ class WurmMarketScraper:
                 "misc": ["lamp", "chest", "bed", "table", "chair"]
             },
             "servers": ["Independence", "Pristine", "Celebration", "Xanadu", "Cadence"],
+            "request_timeout": 10,
+            "http": {
+                "initial_concurrency": 2,
+                "max_concurrency": 8,
+                "latency_target": 3.0,
+                "max_retries": 3,
+                "backoff_base": 0.5,
+                "backoff_max": 30.0,
+                "breaker_failures": 5,
+                "breaker_reset": 300
+            },
+            "page_archive": {"enabled": True, "path": "page_archive", "segment_size_mb": 64},
+            "crawl_diff": {"enabled": True, "disappeared_status": "sold", "max_gone_ratio": 0.9, "guard_min_keys": 5},
+            "snapshots": {"enabled": False, "path": "snapshots", "format": "parquet", "compression": "zstd",
+                          "row_group_size": 100000},
+            "replica": {"enabled": False, "path": "replica", "min_interval": 30.0, "keep": 3,
+                        "mmap_size": 268435456},
+            "api": {"compression_min_bytes": 1024, "compression_level": 6, "brotli_quality": 5,
+                    "ingest_batch_size": 5000, "ingest_max_errors": 1000},
+            "facets": {"price_bands": [1, 5, 10, 50, 100, 500], "refresh_interval": 60.0, "dense_token_ratio": 0.02},
+            "static_assets": {"page": "market_tracker.html", "source_dir": "assets", "build_dir": "static_build",
+                              "compress_min_bytes": 256, "max_age": 31536000, "x_sendfile": False},
+            "config_reload": {"enabled": True, "poll_interval": 2.0, "recategorize": True,
+                              "recategorize_batch": 2000, "recategorize_pause": 0.02},
+            "crawl_queue": {"path": "", "lease_seconds": 120, "max_attempts": 3, "poll_interval": 1.0},
+            "ingest_log": {"enabled": True, "path": "ingest_log", "segment_size_mb": 16, "batch_size": 5000,
+                           "commit_interval": 1.0, "batch_pause": 0.05, "fsync": False, "retain_segments": 2},
+            "arbitrage": {"enabled": True, "top_k": 50, "window": 32, "min_listings": 2, "min_price": 0.01},
+            "price_sketches": {"enabled": True, "k": 128, "outlier_factor": 3.0, "min_price": 0.01,
+                               "rebuild_stale_ratio": 0.25},
+            "watchlist": {"enabled": True, "deliver_after_scrape": True, "webhook_timeout": 5, "max_attempts": 5},
+            "metrics": {"enabled": True, "persist_per_run": True},
+            "profiling": {
+                "output_dir": "profiles",
+                "sample_interval_ms": 5,
+                "api_enabled": False,  # Aceita ?profile=cpu|wall nas rotas da API
+                "slow_query_ms": None,  # Ex.: 50 para registrar consultas acima de 50 ms
+                "slow_query_file": "slow_queries.log"
+            },
+            "sources": {
+                "forum": {"enabled": True, "sections": ["selling"]},
+                "steam": {"enabled": True, "max_topic_pages": 500},
+                "discord": {"enabled": False, "channel_ids": [], "initial_pages": 1}
+            },
             "price_patterns": [
                 r"(\d+\.?\d*)\s*s(?:ilver)?",  # Prata
                 r"(\d+\.?\d*)\s*c(?:opper)?",  # Cobre
@@ -127,9 +356,21 @@ class WurmMarketScraper:
         
         return default_config
         
+    def open_connection(self, **kwargs) -> sqlite3.Connection:
+        """Nova conexão com o banco (com o log de consultas lentas do config)"""
+        profiling_config = self.config.get("profiling", {})
+        return profiling.connect(
+            self.config["database_path"],
+            slow_query_ms=profiling_config.get("slow_query_ms"),
+            slow_query_file=profiling_config.get("slow_query_file", ""),
+            **kwargs
+        )
+        
     def init_database(self) -> sqlite3.Connection:
         """Inicializa o banco de dados SQLite"""
-        conn = sqlite3.connect(self.config["database_path"])
+        conn = self.open_connection()
+        # WAL: leitores da API não esperam pelos lotes de escrita
+        conn.execute("PRAGMA journal_mode = WAL")
         
         # Criar tabelas
         conn.execute('''
@@ -152,7 +393,9 @@ class WurmMarketScraper:
                 contact TEXT,
                 status TEXT DEFAULT 'active',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_epoch INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                listing_key INTEGER
             )
         ''')
         
@@ -168,6 +411,42 @@ class WurmMarketScraper:
             )
         ''')
         
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scrape_id INTEGER,
+                metrics TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Coluna updated_epoch e índice (status, updated_epoch) para expiração e arquivo
+        ensure_expiry_schema(conn)
+        
+        # Chave int64 do anúncio e índice único parcial usado pelo upsert
+        ensure_listing_key_schema(conn)
+        
+        # QL, raridade e encantamentos tipados, com índice de faixa
+        ensure_attribute_schema(conn)
+        
+        # Marcas d'água das fontes incrementais (ex.: Discord)
+        ensure_checkpoint_table(conn)
+        
+        # Estatísticas por (item, servidor) e ranking de arbitragem
+        ensure_arbitrage_schema(conn, self.config)
+        
+        # Sketches KLL de preço e quantis pré-calculados
+        ensure_sketch_schema(conn)
+        
+        # Regras de alerta e outbox
+        ensure_watchlist_schema(conn)
+        
+        # Checkpoints do committer do log de ingestão
+        ensure_ingest_log_schema(conn)
+        
+        # Conjuntos de chaves por URL (diff entre execuções) e scrape_history.details
+        ensure_diff_schema(conn)
+        
         conn.commit()
         return conn
         
@@ -175,6 +454,9 @@ class WurmMarketScraper:
         """Selenium simplificado"""
         if self.selenium_driver is None:
             try:
+                from selenium import webdriver
+                from selenium.webdriver.chrome.options import Options
+                
                 options = Options()
                 options.add_argument('--headless')
                 options.add_argument('--no-sandbox')
@@ -195,77 +477,27 @@ class WurmMarketScraper:
             
     def extract_price(self, text: str) -> Optional[float]:
         """Extrai preço do texto usando regex"""
-        text = text.lower()
-        
-        # Busca por padrões de preço
-        for pattern in self.config["price_patterns"]:
-            match = re.search(pattern, text)
-            if match:
-                price = float(match.group(1))
-                
-                # Converte para prata se necessário
-                if "c" in pattern or "copper" in pattern:
-                    price = price / 100  # 100 cobre = 1 prata
-                elif "iron" in pattern:
-                    price = price * 20   # 1 ferro = 20 prata (aproximado)
-                    
-                return price
-        
-        return None
+        return self.matchers.price(text)
         
     def categorize_item(self, item_name: str) -> str:
         """Categoriza o item baseado no nome"""
-        item_lower = item_name.lower()
+        return self.matchers.categorize(item_name)
         
-        for category, keywords in self.config["categories"].items():
-            for keyword in keywords:
-                if keyword in item_lower:
-                    return category
+    def source_options(self, name: str) -> Dict:
+        """Opções da fonte em config["sources"]"""
+        return self.config.get("sources", {}).get(name, {})
         
-        return "misc"
+    def source_adapter(self, name: str):
+        """Instancia uma fonte pelo nome (importa o módulo dela sob demanda)"""
+        return get_adapter_class(name)(self, self.source_options(name))
         
     def scrape_forum_trading_posts(self) -> List[MarketItem]:
         """Versão simplificada - só posts recentes"""
-        items = []
-        
         try:
-            url = f"{self.config['forum_base_url']}/index.php?/forum/9-selling/"
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            posts = soup.find_all('div', class_='ipsDataItem')[:10]  # Só 10 posts
-            
-            for post in posts:
-                try:
-                    title_elem = post.find('a')
-                    if title_elem and self.is_trading_post(title_elem.text):
-                        # Extração básica só do título
-                        extracted = self.extract_items_from_text(title_elem.text)
-                        for item_data in extracted:
-                            item = MarketItem(
-                                name=item_data['name'],
-                                category=self.categorize_item(item_data['name']),
-                                price=item_data.get('price', 0.0),
-                                server=item_data.get('server', 'unknown'),
-                                seller='forum_user',
-                                timestamp=datetime.now().isoformat(),
-                                source="forum",
-                                url=url,
-                                status="active"
-                            )
-                            items.append(item)
-                            
-                    time.sleep(1)  # Rate limiting
-                    
-                except Exception as e:
-                    logger.error(f"Erro no post: {e}")
-                    continue
-                    
+            return list(self.source_adapter("forum").items())
         except Exception as e:
             logger.error(f"Erro no forum: {e}")
-            
-        return items
+            return []
         
     def parse_forum_post(self, post_element, base_url: str) -> List[MarketItem]:
         """Analisa um post do fórum para extrair itens"""
@@ -307,6 +539,7 @@ class WurmMarketScraper:
                     price=item_data.get('price', 0.0),
                     quality=item_data.get('quality'),
                     enchantments=item_data.get('enchantments'),
+                    rarity=item_data.get('rarity'),
                     server=item_data.get('server', 'unknown'),
                     seller=author,
                     location=item_data.get('location', 'unknown'),
@@ -338,15 +571,11 @@ class WurmMarketScraper:
     def get_post_content(self, post_url: str) -> Optional[str]:
         """Obtém o conteúdo completo de um post"""
         try:
-            response = self.session.get(post_url)
+            response = self.http.get(post_url, source="forum", timeout=self.config.get("request_timeout", 10))
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Encontra o conteúdo do post
-            content_elem = soup.find('div', class_=['ipsType_richText', 'ipsContained'])
-            if content_elem:
-                return content_elem.get_text(separator=' ', strip=True)
+            # Parser de eventos: para no fim do primeiro post, sem montar a árvore da página
+            return first_post_text(response.content, post_url, ["ipsType_richText", "ipsContained"])
                 
         except Exception as e:
             logger.error(f"Error getting post content from {post_url}: {e}")
@@ -355,6 +584,12 @@ class WurmMarketScraper:
         
     def extract_items_from_text(self, text: str, title: str = "") -> List[Dict]:
         """Extrai itens e preços do texto"""
+        with metrics.EXTRACT_SECONDS.time():
+            return self._extract_items(text)
+        
+    def _extract_items(self, text: str) -> List[Dict]:
+        # Uma versão dos matchers do início ao fim, mesmo que o config seja trocado no meio
+        matchers = self.matchers
         items = []
         lines = text.split('\n')
         
@@ -364,15 +599,19 @@ class WurmMarketScraper:
                 continue
                 
             # Busca por padrões de itens com preços
-            item_matches = re.findall(
-                r'([A-Za-z\s]+(?:axe|sword|hammer|rope|brick|armor|helmet|shield|bow|arrow|knife|saw|pickaxe|spear|club|meal|bread|wine|beer|lamp|chest|bed|table|chair))\s*[:-]?\s*(\d+\.?\d*)\s*([sc]|silver|copper|iron)?',
-                line, re.IGNORECASE
-            )
+            item_matches = list(matchers.item_pattern.finditer(line))
             
-            for match in item_matches:
-                item_name = match[0].strip()
-                price_value = float(match[1])
-                currency = match[2].lower() if match[2] else 's'
+            # Entre dois itens, o texto até o último separador (",", ";", "|") é do item anterior
+            bounds = [0]
+            for previous, following in zip(item_matches, item_matches[1:]):
+                gap = line[previous.end():following.start()]
+                separator = max(gap.rfind(','), gap.rfind(';'), gap.rfind('|'))
+                bounds.append(previous.end() + separator + 1 if separator >= 0 else following.start())
+            
+            for index, match in enumerate(item_matches):
+                item_name = match.group(1).strip()
+                price_value = float(match.group(2))
+                currency = match.group(3).lower() if match.group(3) else 's'
                 
                 # Converte preço para prata
                 if currency in ['c', 'copper']:
@@ -380,21 +619,20 @@ class WurmMarketScraper:
                 elif currency == 'iron':
                     price_value = price_value * 20
                     
-                # Extrai qualidade se presente
-                quality_match = re.search(r'ql?\s*(\d+)', line, re.IGNORECASE)
-                quality = int(quality_match.group(1)) if quality_match else None
+                # Atributos só do trecho deste item, não da linha toda
+                segment_start = bounds[index]
+                segment_end = bounds[index + 1] if index + 1 < len(item_matches) else len(line)
+                attributes = matchers.attributes.extract(line[segment_start:segment_end])
                 
                 # Extrai servidor se presente
-                server = 'unknown'
-                for srv in self.config["servers"]:
-                    if srv.lower() in line.lower():
-                        server = srv
-                        break
-                        
+                server = matchers.server(line)
+                
                 items.append({
                     'name': item_name,
                     'price': price_value,
-                    'quality': quality,
+                    'quality': attributes['quality'],
+                    'enchantments': attributes['enchantments'],
+                    'rarity': attributes['rarity'],
                     'server': server,
                     'quantity': 1
                 })
@@ -403,137 +641,67 @@ class WurmMarketScraper:
         
     def scrape_discord_markets(self) -> List[MarketItem]:
         """Scraper para canais de mercado do Discord (requer bot token)"""
-        items = []
-        
         if not self.config.get("discord_token"):
             logger.warning("Discord token not configured, skipping Discord scraping")
-            return items
+            return []
             
-        # Implementação do scraping do Discord seria aqui
-        # Requer configuração de um bot Discord
-        logger.info("Discord scraping not implemented yet")
-        
-        return items
+        return list(self.source_adapter("discord").items())
         
     def scrape_steam_community(self) -> List[MarketItem]:
         """Scraper para discussões do Steam Community"""
-        items = []
-        
         try:
-            # URLs do Steam Community
-            steam_urls = [
-                "https://steamcommunity.com/app/1179680/discussions/",  # Wurm Online
-                "https://steamcommunity.com/app/366220/discussions/"   # Wurm Unlimited
-            ]
-            
-            for url in steam_urls:
-                logger.info(f"Scraping Steam Community: {url}")
-                
-                response = self.session.get(url)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Encontra tópicos de discussão
-                topics = soup.find_all('div', class_='forum_topic')
-                
-                for topic in topics:
-                    try:
-                        title_elem = topic.find('a', class_='forum_topic_title')
-                        if title_elem and self.is_trading_post(title_elem.get_text()):
-                            # Processa tópico de trading
-                            topic_items = self.process_steam_topic(title_elem.get('href'))
-                            items.extend(topic_items)
-                            
-                        time.sleep(self.config["delay_between_requests"])
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing Steam topic: {e}")
-                        continue
-                        
+            return list(self.source_adapter("steam").items())
         except Exception as e:
             logger.error(f"Error scraping Steam Community: {e}")
-            
-        return items
+            return []
         
     def process_steam_topic(self, topic_url: str) -> List[MarketItem]:
-        """Processa um tópico do Steam para extrair itens"""
-        items = []
-        
+        """Processa um tópico do Steam (todas as páginas) para extrair itens"""
         try:
-            response = self.session.get(topic_url)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extrai posts do tópico
-            posts = soup.find_all('div', class_='forum_post_content')
-            
-            for post in posts:
-                text_content = post.get_text(separator=' ', strip=True)
-                extracted_items = self.extract_items_from_text(text_content)
-                
-                for item_data in extracted_items:
-                    item = MarketItem(
-                        name=item_data['name'],
-                        category=self.categorize_item(item_data['name']),
-                        price=item_data.get('price', 0.0),
-                        quality=item_data.get('quality'),
-                        server=item_data.get('server', 'unknown'),
-                        seller="steam_user",
-                        timestamp=datetime.now().isoformat(),
-                        source="steam",
-                        url=topic_url,
-                        status="active"
-                    )
-                    items.append(item)
-                    
+            return list(self.source_adapter("steam").topic_items(topic_url))
         except Exception as e:
             logger.error(f"Error processing Steam topic {topic_url}: {e}")
-            
-        return items
+            return []
         
     def save_items_to_database(self, items: List[MarketItem]):
         """Salva itens no banco de dados"""
-        cursor = self.db_connection.cursor()
+        with metrics.DB_UPSERT_SECONDS.time():
+            inserted, updated = self._save_items(items)
+        metrics.DB_ROWS_WRITTEN.inc(inserted, operation="insert")
+        metrics.DB_ROWS_WRITTEN.inc(updated, operation="update")
+        notify_ingest(self.db_connection, items)
+        logger.info(f"Saved {len(items)} items to database")
         
-        for item in items:
-            try:
-                # Verifica se item já existe
-                cursor.execute('''
-                    SELECT id FROM market_items 
-                    WHERE name = ? AND seller = ? AND url = ? AND status = 'active'
-                ''', (item.name, item.seller, item.url))
-                
-                if cursor.fetchone():
-                    # Atualiza item existente
-                    cursor.execute('''
-                        UPDATE market_items SET
-                            price = ?, quality = ?, quantity = ?, 
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE name = ? AND seller = ? AND url = ? AND status = 'active'
-                    ''', (item.price, item.quality, item.quantity, 
-                          item.name, item.seller, item.url))
-                else:
-                    # Insere novo item
-                    cursor.execute('''
-                        INSERT INTO market_items (
-                            name, category, price, cost, quality, enchantments,
-                            server, seller, location, quantity, timestamp, source,
-                            url, description, contact, status
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        item.name, item.category, item.price, item.cost,
-                        item.quality, item.enchantments, item.server, item.seller,
-                        item.location, item.quantity, item.timestamp, item.source,
-                        item.url, item.description, item.contact, item.status
-                    ))
+    def begin_write(self):
+        """Abre transação com BEGIN IMMEDIATE e registra quanto esperou pelo lock"""
+        if self.db_connection.in_transaction:
+            return
+        with metrics.DB_LOCK_WAIT_SECONDS.time():
+            self.db_connection.execute("BEGIN IMMEDIATE")
+        
+    def _save_items(self, items: List[MarketItem]):
+        # Pega o lock de escrita já no início, medindo a espera
+        self.begin_write()
+        
+        try:
+            # Lote inteiro num único executemany (INSERT ... ON CONFLICT DO UPDATE)
+            inserted, updated = upsert_items(self.db_connection, items)
+        except sqlite3.Error as e:
+            # Um item ruim não derruba o lote: refaz item a item, registrando as falhas
+            logger.warning(f"Batch upsert failed ({e}), retrying item by item")
+            self.db_connection.rollback()
+            self.begin_write()
+            inserted = updated = 0
+            for item in items:
+                try:
+                    i, u = upsert_items(self.db_connection, [item])
+                    inserted += i
+                    updated += u
+                except sqlite3.Error as item_error:
+                    logger.error(f"Error saving item {item.name}: {item_error}")
                     
-            except Exception as e:
-                logger.error(f"Error saving item {item.name}: {e}")
-                
         self.db_connection.commit()
-        logger.info(f"Saved {len(items)} items to database")
+        return inserted, updated
         
     def export_to_json(self, filename: str = None) -> str:
         """Exporta dados para JSON"""
@@ -546,74 +714,190 @@ class WurmMarketScraper:
             ORDER BY updated_at DESC
         ''')
         
-        items = []
         columns = [description[0] for description in cursor.description]
+        count = 0
         
-        for row in cursor.fetchall():
-            item_dict = dict(zip(columns, row))
-            items.append(item_dict)
-            
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(items, f, indent=2, ensure_ascii=False)
+        # Escreve fragmentos compactos em streaming, sem montar a lista inteira
+        with open(filename, 'wb') as f:
+            f.write(b'[')
+            for row in cursor:
+                if count:
+                    f.write(b',')
+                f.write(row_encoder.encode_row(dict(zip(columns, row))))
+                count += 1
+            f.write(b']')
             
-        logger.info(f"Exported {len(items)} items to {filename}")
+        logger.info(f"Exported {count} items to {filename}")
         return filename
         
-    def run_full_scrape(self):
-        """Executa scraping completo de todas as fontes"""
+    def collect_source(self, name: str, adapter, sink: Callable[[List[MarketItem]], Any],
+                       chunk_size: int = 500) -> int:
+        """Consome o stream de uma fonte em blocos entregues a sink (executado em thread própria)"""
+        logger.info(f"Scraping {name}...")
+        count = 0
+        chunk: List[MarketItem] = []
+        try:
+            for item in adapter.items():
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    sink(chunk)
+                    count += len(chunk)
+                    chunk = []
+        except Exception as e:
+            logger.error(f"Error scraping {name}: {e}")
+        if chunk:
+            sink(chunk)
+            count += len(chunk)
+        logger.info(f"Found {count} items from {name}")
+        return count
+        
+    def run_full_scrape(self) -> int:
+        """Executa scraping completo de todas as fontes; retorna o total de itens encontrados"""
         logger.info("Starting full market data scrape")
         
-        all_items = []
+        adapters = build_adapters(self)
+        metrics_before = metrics.registry.snapshot()
+        log = self.ingest_log
+        
+        if log is not None:
+            # Fontes escrevem no log; o committer drena em lotes enquanto o scrape roda
+            committer = self.ingest_committer()
+            recovered = committer.drain()
+            if recovered:
+                logger.info(f"Recovered {recovered} items left in the ingest log by a previous run")
+            if committer.conn is not self.db_connection:
+                committer.start(self.config.get("ingest_log", {}).get("commit_interval", 1.0))
+            sink = log.append
+        else:
+            pending: List[MarketItem] = []
+            sink = pending.extend
         
-        # Scrape fórum oficial
-        logger.info("Scraping official forum...")
-        forum_items = self.scrape_forum_trading_posts()
-        all_items.extend(forum_items)
-        logger.info(f"Found {len(forum_items)} items from forum")
+        # Fontes rodam em paralelo; cada uma produz seu próprio stream de itens
+        total_items = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(adapters))) as executor:
+                futures = {
+                    name: executor.submit(self.collect_source, name, adapter, sink)
+                    for name, adapter in adapters.items()
+                }
+                for name, future in futures.items():
+                    total_items += future.result()
+        finally:
+            if log is not None:
+                committer.stop()
+                if committer.conn is not self.db_connection:
+                    committer.conn.close()
         
-        # Scrape Steam Community
-        logger.info("Scraping Steam Community...")
-        steam_items = self.scrape_steam_community()
-        all_items.extend(steam_items)
-        logger.info(f"Found {len(steam_items)} items from Steam")
+        # Sem log: salva tudo de uma vez no fim
+        if log is None and pending:
+            self.save_items_to_database(pending)
         
-        # Scrape Discord (se configurado)
-        if self.config.get("discord_token"):
-            logger.info("Scraping Discord...")
-            discord_items = self.scrape_discord_markets()
-            all_items.extend(discord_items)
-            logger.info(f"Found {len(discord_items)} items from Discord")
+        # Diff com a execução anterior: anúncios que sumiram das páginas relidas saem do conjunto ativo
+        diff_summary = self.diff_crawls(adapters)
         
-        # Salva no banco de dados
-        if all_items:
-            self.save_items_to_database(all_items)
+        # Checkpoints só depois que os itens estão salvos
+        for adapter in adapters.values():
+            adapter.checkpoint()
         
         # Registra histórico de scraping
         cursor = self.db_connection.cursor()
         cursor.execute('''
-            INSERT INTO scrape_history (source, url, items_found, status)
-            VALUES (?, ?, ?, ?)
-        ''', ("full_scrape", "multiple", len(all_items), "completed"))
+            INSERT INTO scrape_history (source, url, items_found, status, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ("full_scrape", "multiple", total_items, "completed", json.dumps({"diff": diff_summary})))
+        scrape_id = cursor.lastrowid
+        
+        # Métricas desta execução (diferença de snapshots; os contadores continuam monotônicos)
+        if metrics.registry.enabled and self.config.get("metrics", {}).get("persist_per_run", True):
+            run_metrics = metrics.diff_snapshots(metrics_before, metrics.registry.snapshot())
+            cursor.execute('''
+                INSERT INTO scrape_metrics (scrape_id, metrics) VALUES (?, ?)
+            ''', (scrape_id, json.dumps(run_metrics)))
         self.db_connection.commit()
         
-        logger.info(f"Full scrape completed. Total items found: {len(all_items)}")
+        logger.info(f"Full scrape completed. Total items found: {total_items}")
         
-        return all_items
+        if self.config.get("watchlist", {}).get("deliver_after_scrape", True):
+            self.deliver_alerts()
         
-    def cleanup_old_data(self, days_old: int = 30):
-        """Remove dados antigos do banco"""
-        cursor = self.db_connection.cursor()
-        cutoff_date = datetime.now() - timedelta(days=days_old)
+        return total_items
         
-        cursor.execute('''
-            UPDATE market_items SET status = 'expired'
-            WHERE updated_at < ? AND status = 'active'
-        ''', (cutoff_date.isoformat(),))
+    def diff_crawls(self, adapters: Dict) -> Dict[str, Dict]:
+        """Aplica o diff de snapshot das fontes que releem páginas inteiras"""
+        diff_config = self.config.get("crawl_diff", {})
+        if not diff_config.get("enabled", True):
+            return {}
+        differ = SnapshotDiffer(self.db_connection, diff_config)
+        summary = {}
+        for name, adapter in adapters.items():
+            if adapter.snapshot_diff:
+                try:
+                    summary[name] = differ.diff(name, adapter.crawled)
+                except sqlite3.Error as e:
+                    logger.error(f"Snapshot diff failed for {name}: {e}")
+        return summary
+        
+    def cleanup_old_data(self, days_old: Optional[int] = None) -> int:
+        """Marca como expirados os itens sem atualização dentro do TTL"""
+        expiry_config = dict(self.config.get("expiry", {}))
+        if days_old is not None:
+            expiry_config["default_ttl_days"] = days_old
+            
+        results = ExpiryEngine(self.db_connection, expiry_config).run()
+        updated_rows = sum(results.values())
+        
+        logger.info(f"Marked {updated_rows} old items as expired {results}")
         
-        updated_rows = cursor.rowcount
+        # Preços de anúncios retirados não saem de um KLL: reconstrói quando passam do limite
+        sketch_config = self.config.get("price_sketches", {})
+        if sketch_config.get("enabled", True):
+            SketchEngine(sketch_config).maintain(self.db_connection)
+        return updated_rows
+        
+    def archive_retired_data(self) -> int:
+        """Move itens encerrados (expirados, vendidos) para as tabelas mensais de arquivo"""
+        self.db_connection.commit()
+        archiver = MarketArchiver(self.db_connection, self.config.get("archive"), retired_statuses(self.config))
+        archiver.ensure_incremental_vacuum()
+        moved = archiver.archive_retired()
+        prune_attributes(self.db_connection)
+        return moved
+        
+    def export_snapshots(self, force: bool = False) -> Dict[str, Dict[str, int]]:
+        """Snapshots Parquet/Arrow de anúncios ativos e histórico (só partições novas)"""
         self.db_connection.commit()
+        return ColumnarExporter(
+            self.db_connection, self.config.get("snapshots"),
+            archive_path=self.config.get("archive", {}).get("database_path", "")
+        ).export(force)
+        
+    def reextract(self, sources: Optional[List[str]] = None, since: Optional[str] = None,
+                  workers: Optional[int] = None) -> Dict:
+        """Reconstrói market_items reprocessando o arquivo de páginas, sem rede"""
+        archive = self.page_archive
+        if archive is None:
+            raise RuntimeError("page_archive is disabled in config")
+        return ReExtractor(self, archive, workers).rebuild(sources, since)
+        
+    def deliver_alerts(self) -> Dict[str, int]:
+        """Envia os alertas pendentes do outbox para os webhooks das regras"""
+        watchlist_config = self.config.get("watchlist", {})
+        result = deliver_outbox(
+            self.db_connection, self.session,
+            max_attempts=watchlist_config.get("max_attempts", 5),
+            timeout=watchlist_config.get("webhook_timeout", 5)
+        )
+        if result["delivered"] or result["failed"]:
+            logger.info(f"Watchlist alerts: {result}")
+        return result
         
-        logger.info(f"Marked {updated_rows} old items as expired")
+    def rebuild_arbitrage(self) -> int:
+        """Recalcula as estatísticas de arbitragem a partir dos anúncios ativos"""
+        return ArbitrageEngine(self.config.get("arbitrage"), self.config.get("servers")).rebuild(self.db_connection)
+        
+    def rebuild_sketches(self) -> int:
+        """Recalcula os sketches de preço a partir dos anúncios ativos"""
+        return SketchEngine(self.config.get("price_sketches")).rebuild(self.db_connection)
         
     def get_market_stats(self) -> Dict:
         """Retorna estatísticas do mercado"""
@@ -644,44 +928,270 @@ class WurmMarketScraper:
         ''')
         trending_items = cursor.fetchone()[0]
         
+        # p10/p50/p90 por categoria (sketches, sem ordenar a tabela)
+        quantiles = {
+            category: {q: values[q] for q in ('n', 'p10', 'p50', 'p90')}
+            for category, values in price_quantiles(self.db_connection, "category").items()
+        }
+        
         return {
             'total_items': total_items,
             'categories': categories,
             'average_prices': avg_prices,
+            'price_quantiles': quantiles,
             'trending_items': trending_items,
             'last_update': datetime.now().isoformat()
         }
         
     def close(self):
         """Fecha conexões e limpa recursos"""
+        self.config_service.stop()
+        if self.replica_publisher:
+            # Expiração, diff e limpeza escrevem sem passar pelos listeners de ingestão
+            if self.db_connection.total_changes != self._replica_baseline:
+                self.replica_publisher.request()
+            release_publisher(self.replica_publisher)
+            self.replica_publisher = None
         if self.db_connection:
             self.db_connection.close()
+        if self._page_archive:
+            self._page_archive.close()
+        if self._ingest_log:
+            self._ingest_log.close()
         if self.selenium_driver:
             self.selenium_driver.quit()
         logger.info("Scraper closed")
 
-def main():
+def print_stats(stats: Dict):
+    """Mostra estatísticas no console"""
+    print("\n=== Market Statistics ===")
+    print(f"Total active items: {stats['total_items']}")
+    print(f"Trending items (24h): {stats['trending_items']}")
+    print(f"Categories: {stats['categories']}")
+    for category, q in sorted(stats.get('price_quantiles', {}).items()):
+        print(f"  {category}: p10 {q['p10']}s, median {q['p50']}s, p90 {q['p90']}s ({q['n']} prices)")
+
+def cmd_run(scraper: WurmMarketScraper, args):
+    """Pipeline completo: scrape, limpeza, exportação e estatísticas"""
+    scraper.run_full_scrape()
+    scraper.cleanup_old_data()
+    scraper.archive_retired_data()
+    json_file = scraper.export_to_json()
+    if scraper.config.get("snapshots", {}).get("enabled", False):
+        scraper.export_snapshots()
+    print_stats(scraper.get_market_stats())
+    print(f"Data exported to: {json_file}")
+
+def cmd_scrape(scraper: WurmMarketScraper, args):
+    """Só o scraping"""
+    print(f"Scraped {scraper.run_full_scrape()} items")
+
+def cmd_export(scraper: WurmMarketScraper, args):
+    """Exporta itens ativos para JSON"""
+    print(f"Data exported to: {scraper.export_to_json(args.output)}")
+
+def cmd_stats(scraper: WurmMarketScraper, args):
+    """Mostra estatísticas do banco"""
+    if args.rebuild_sketches:
+        print(f"Rebuilt price sketches from {scraper.rebuild_sketches()} active items")
+    stats = scraper.get_market_stats()
+    if args.json:
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+    else:
+        print_stats(stats)
+
+def cmd_config(scraper: WurmMarketScraper, args):
+    """Valida o config.json e, opcionalmente, reaplica as categorias aos anúncios ativos"""
+    try:
+        validate(scraper.load_config(args.config))
+    except ValueError as e:
+        print(f"Invalid config: {e}")
+        return
+    print("Config OK")
+    if args.recategorize:
+        print(f"Recategorized {scraper.recategorize()} active listings")
+
+def cmd_snapshot(scraper: WurmMarketScraper, args):
+    """Exporta os snapshots colunares para análise offline"""
+    summary = scraper.export_snapshots(args.force)
+    for dataset, partitions in summary.items():
+        rows = sum(partitions.values())
+        print(f"{dataset}: {len(partitions)} new partitions, {rows} rows")
+
+def cmd_assets(scraper: WurmMarketScraper, args):
+    """Gera o build do frontend (nomes com hash, .br/.gz) servido pela API"""
+    manifest = AssetPipeline(scraper.config.get("static_assets")).build(force=args.force)
+    for name, entry in sorted(manifest["files"].items()):
+        print(f"{name} -> {entry['file']} ({entry['size']} bytes, {', '.join(entry['encodings']) or 'identity'})")
+
+def cmd_replica(scraper: WurmMarketScraper, args):
+    """Publica agora um snapshot somente-leitura do banco para a API"""
+    publisher = scraper.replica_publisher or ReplicaPublisher(
+        scraper.config["database_path"], scraper.config.get("replica"))
+    pointer = publisher.publish()
+    print(f"Replica generation {pointer['generation']} -> {os.path.join(publisher.directory, pointer['file'])}")
+
+def cmd_cleanup(scraper: WurmMarketScraper, args):
+    """Expira itens antigos e arquiva os encerrados"""
+    expired = scraper.cleanup_old_data(args.days)
+    archived = scraper.archive_retired_data() if not args.no_archive else 0
+    print(f"Expired {expired} items, archived {archived}")
+
+def cmd_reextract(scraper: WurmMarketScraper, args):
+    """Reprocessa o arquivo de páginas e reaplica a expiração"""
+    summary = scraper.reextract(args.sources, args.since, args.workers)
+    expired = scraper.cleanup_old_data()
+    scraper.rebuild_arbitrage()
+    scraper.rebuild_sketches()
+    print(f"Re-extracted {summary['fetches']} pages into {summary['listings']} listings "
+          f"in {summary['seconds']}s ({summary['errors']} errors, {expired} expired)")
+
+def cmd_arbitrage(scraper: WurmMarketScraper, args):
+    """Mostra o ranking de arbitragem entre servidores"""
+    if args.rebuild:
+        print(f"Rebuilt arbitrage stats from {scraper.rebuild_arbitrage()} active items")
+    for row in top_spreads(scraper.db_connection, args.limit):
+        print(f"{row['rank']:>3}. {row['name']}: buy {row['buy_price']:.2f} on {row['buy_server']}, "
+              f"sell ~{row['sell_median']:.2f} on {row['sell_server']} (+{row['ratio']:.0%})")
+
+def cmd_ingest_log(scraper: WurmMarketScraper, args):
+    """Estado do log de ingestão; drena ou reaplica a partir de um segmento retido"""
+    if scraper.ingest_log is None:
+        print("ingest_log is disabled in config")
+        return
+    committer = scraper.ingest_committer()
+    if args.replay_from is not None:
+        committer.reset((args.replay_from, 0))
+    if args.drain or args.replay_from is not None:
+        print(f"Applied {committer.drain()} items from the ingest log")
+    print(json.dumps(committer.status()))
+    if committer.conn is not scraper.db_connection:
+        committer.conn.close()
+
+def cmd_crawl(scraper: WurmMarketScraper, args):
+    """Modo distribuído: coordenador enfileira, workers (locais ou em outros hosts) consomem"""
+    queue = scraper.crawl_queue()
+    try:
+        if args.action in ("enqueue", "run"):
+            seeds = [(name, url, kind) for name, adapter in build_adapters(scraper).items()
+                     for url, kind in adapter.work_seeds()]
+            round_id, queued = queue.start_round(seeds)
+            print(f"Round {round_id}: enqueued {queued} seed URLs")
+        if args.action == "worker":
+            if args.follow:
+                scraper.watch_config()
+            processed = CrawlWorker(scraper, queue, args.worker_id).run(follow=args.follow)
+            print(f"Processed {processed} URLs")
+        elif args.action == "run":
+            processes = [
+                multiprocessing.Process(target=run_worker_process,
+                                        args=(args.config, f"{default_worker_id()}-{n}", False, args.log_file))
+                for n in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        print(json.dumps(queue.status()))
+    finally:
+        queue.close()
+
+def build_parser() -> argparse.ArgumentParser:
+    """Parser do CLI"""
+    parser = argparse.ArgumentParser(description="Wurm Online Market Data Scraper")
+    parser.add_argument("--config", default="config.json", help="Arquivo de configuração")
+    parser.add_argument("--log-file", default="wurm_scraper.log", help="Arquivo de log")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES, default=None,
+                        help="Grava um profile do comando (cprofile: .prof, sample: stacks .folded)")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    subparsers.add_parser("run", help="Scrape, cleanup, export e stats (padrão)")
+    subparsers.add_parser("scrape", help="Executa o scraping de todas as fontes habilitadas")
+    
+    export_parser = subparsers.add_parser("export", help="Exporta itens ativos para JSON")
+    export_parser.add_argument("--output", "-o", default=None)
+    
+    stats_parser = subparsers.add_parser("stats", help="Mostra estatísticas do mercado")
+    stats_parser.add_argument("--json", action="store_true")
+    stats_parser.add_argument("--rebuild-sketches", action="store_true",
+                              help="Recalcula os sketches de preço a partir dos itens ativos")
+    
+    config_parser = subparsers.add_parser("config", help="Valida o config e recategoriza os anúncios")
+    config_parser.add_argument("--recategorize", action="store_true",
+                               help="Reaplica as categorias atuais aos anúncios ativos")
+    
+    subparsers.add_parser("replica", help="Publica um snapshot somente-leitura para a API")
+    
+    assets_parser = subparsers.add_parser("assets", help="Gera o build estático do frontend")
+    assets_parser.add_argument("--force", action="store_true", help="Refaz o build mesmo sem mudanças")
+    
+    snapshot_parser = subparsers.add_parser("snapshot", help="Exporta Parquet/Arrow particionado por data e servidor")
+    snapshot_parser.add_argument("--force", action="store_true", help="Reescreve as partições existentes")
+    
+    cleanup_parser = subparsers.add_parser("cleanup", help="Expira e arquiva itens antigos")
+    cleanup_parser.add_argument("--days", type=int, default=None, help="TTL padrão em dias")
+    cleanup_parser.add_argument("--no-archive", action="store_true")
+    
+    reextract_parser = subparsers.add_parser("reextract", help="Reconstrói market_items a partir do arquivo de páginas")
+    reextract_parser.add_argument("--sources", nargs="*", default=None, help="Fontes a reprocessar (padrão: todas)")
+    reextract_parser.add_argument("--since", default=None, help="Só páginas obtidas a partir desta data ISO")
+    reextract_parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: núcleos)")
+    
+    arbitrage_parser = subparsers.add_parser("arbitrage", help="Maiores diferenças de preço entre servidores")
+    arbitrage_parser.add_argument("--limit", type=int, default=20)
+    arbitrage_parser.add_argument("--rebuild", action="store_true", help="Recalcula a partir dos itens ativos")
+    
+    ingest_log_parser = subparsers.add_parser("ingest-log", help="Estado, drenagem e replay do log de ingestão")
+    ingest_log_parser.add_argument("--drain", action="store_true", help="Aplica o que ficou pendente no log")
+    ingest_log_parser.add_argument("--replay-from", type=int, default=None, metavar="SEGMENT",
+                                   help="Reaplica a partir do início de um segmento retido")
+    
+    crawl_parser = subparsers.add_parser("crawl", help="Scraping distribuído por uma fila de leases")
+    crawl_parser.add_argument("action", choices=["enqueue", "worker", "run", "status"],
+                              help="enqueue: abre uma rodada; worker: consome a fila; run: ambos com N processos locais")
+    crawl_parser.add_argument("--workers", type=int, default=4, help="Processos locais (run)")
+    crawl_parser.add_argument("--worker-id", default=None, help="Identificador do worker (padrão: host:pid)")
+    crawl_parser.add_argument("--follow", action="store_true", help="Worker continua esperando por trabalho novo")
+    return parser
+
+COMMANDS = {
+    None: cmd_run,
+    "run": cmd_run,
+    "scrape": cmd_scrape,
+    "export": cmd_export,
+    "stats": cmd_stats,
+    "config": cmd_config,
+    "snapshot": cmd_snapshot,
+    "assets": cmd_assets,
+    "replica": cmd_replica,
+    "cleanup": cmd_cleanup,
+    "reextract": cmd_reextract,
+    "arbitrage": cmd_arbitrage,
+    "ingest-log": cmd_ingest_log,
+    "crawl": cmd_crawl,
+}
+
+def main(argv: Optional[List[str]] = None):
     """Função principal para executar o scraper"""
-    scraper = WurmMarketScraper()
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_file)
+    scraper = WurmMarketScraper(args.config)
+    metrics.configure(scraper.config.get("metrics", {}).get("enabled", True))
     
     try:
-        # Executa scraping completo
-        items = scraper.run_full_scrape()
-        
-        # Limpa dados antigos
-        scraper.cleanup_old_data(30)
-        
-        # Exporta dados para JSON
-        json_file = scraper.export_to_json()
-        
-        # Mostra estatísticas
-        stats = scraper.get_market_stats()
-        print("\n=== Market Statistics ===")
-        print(f"Total active items: {stats['total_items']}")
-        print(f"Trending items (24h): {stats['trending_items']}")
-        print(f"Categories: {stats['categories']}")
-        print(f"Data exported to: {json_file}")
-        
+        command = COMMANDS[args.command]
+        if args.profile:
+            profiling_config = scraper.config.get("profiling", {})
+            _, profile_file = profiling.profile_call(
+                lambda: command(scraper, args),
+                output_dir=profiling_config.get("output_dir", "profiles"),
+                name=args.command or "run",
+                mode=args.profile,
+                interval=profiling_config.get("sample_interval_ms", 5) / 1000
+            )
+            print(f"Profile written to: {profile_file}")
+        else:
+            command(scraper, args)
     except KeyboardInterrupt:
         logger.info("Scraping interrupted by user")
     except Exception as e:
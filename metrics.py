@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Metrics for Wurm Online Market Tracker
+Contadores e histogramas em memória, exportados no formato texto do Prometheus
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """Contador monotônico com labels"""
+
+    kind = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def render(self) -> Iterable[str]:
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{format_labels(key)} {value:g}"
+
+    def snapshot(self) -> Dict:
+        return {format_labels(key) or "{}": value for key, value in self.values.items()}
+
+
+class Histogram:
+    """Histograma cumulativo (buckets fixos, soma e contagem) com labels"""
+
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label -> [contagens por bucket..., soma, contagem]
+        self.values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = label_key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """Context manager que observa a duração do bloco"""
+        if not self.registry.enabled:
+            return NULL_TIMER
+        return Timer(self, labels)
+
+    def render(self) -> Iterable[str]:
+        for key, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(key, ('le', f'{bound:g}'))} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(key, ('le', '+Inf'))} {state[-1]}"
+            yield f"{self.name}_sum{format_labels(key)} {state[-2]:g}"
+            yield f"{self.name}_count{format_labels(key)} {state[-1]}"
+
+    def snapshot(self) -> Dict:
+        return {
+            format_labels(key) or "{}": {"sum": state[-2], "count": state[-1]}
+            for key, state in self.values.items()
+        }
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class MetricsRegistry:
+    """Conjunto de métricas do processo; desabilitado, toda operação vira no-op"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(self, name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(self, name, help_text, buckets))
+
+    def render(self) -> str:
+        """Formato de exposição texto do Prometheus (0.0.4)"""
+        lines = []
+        with self.lock:
+            for name, metric in sorted(self.metrics.items()):
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """Resumo serializável em JSON (para persistir por execução)"""
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.metrics.items() if metric.values}
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+
+registry = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Scraper
+FETCH_SECONDS = registry.histogram("wurm_fetch_seconds", "Latency of outbound HTTP fetches by host")
+FETCH_BYTES = registry.counter("wurm_fetch_bytes_total", "Bytes downloaded by host")
+FETCH_ERRORS = registry.counter("wurm_fetch_errors_total", "Failed outbound fetches by host and status")
+PARSE_SECONDS = registry.histogram("wurm_parse_seconds", "Time to parse one fetched page by source")
+EXTRACT_SECONDS = registry.histogram("wurm_extract_seconds", "Time spent in extract_items_from_text")
+ITEMS_PER_PAGE = registry.histogram("wurm_items_per_page", "Items extracted per fetched page by source",
+                                    COUNT_BUCKETS)
+ITEMS_SCRAPED = registry.counter("wurm_items_scraped_total", "Items produced by source")
+
+# Banco
+DB_UPSERT_SECONDS = registry.histogram("wurm_db_upsert_seconds", "Duration of save_items_to_database batches")
+DB_LOCK_WAIT_SECONDS = registry.histogram("wurm_db_lock_wait_seconds", "Time waiting for the SQLite write lock")
+DB_ROWS_WRITTEN = registry.counter("wurm_db_rows_written_total", "Rows inserted or updated by operation")
+
+# API
+HTTP_REQUEST_SECONDS = registry.histogram("wurm_http_request_seconds", "API request latency by route")
+
+
+def diff_snapshots(before: Dict, after: Dict) -> Dict:
+    """Diferença entre dois snapshots (o que aconteceu entre eles)"""
+    result = {}
+    for name, series in after.items():
+        previous = before.get(name, {})
+        changed = {}
+        for labels, value in series.items():
+            old = previous.get(labels)
+            if isinstance(value, dict):
+                old = old or {"sum": 0.0, "count": 0}
+                delta = {"sum": value["sum"] - old["sum"], "count": value["count"] - old["count"]}
+                if delta["count"]:
+                    changed[labels] = delta
+            elif value - (old or 0):
+                changed[labels] = value - (old or 0)
+        if changed:
+            result[name] = changed
+    return result
+
+
+def configure(enabled: bool):
+    """Liga ou desliga a coleta no processo"""
+    registry.enabled = enabled
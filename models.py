@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Data models for Wurm Online Market Tracker
+Estruturas compartilhadas entre scraper, fontes e API
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class MarketItem:
+    """Classe para representar um item do mercado"""
+    name: str
+    category: str
+    price: float
+    cost: Optional[float] = None
+    quality: Optional[int] = None
+    enchantments: Optional[str] = None
+    rarity: Optional[str] = None  # rare, supreme, fantastic (só em item_attributes, sem coluna própria)
+    server: str = "unknown"
+    seller: str = "unknown"
+    location: str = "unknown"
+    quantity: int = 1
+    timestamp: str = ""
+    source: str = "forum"
+    url: str = ""
+    description: str = ""
+    contact: str = ""
+    status: str = "active"  # active, sold, expired
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Raw page archive for Wurm Online Market Tracker
+Guarda cada página obtida em segmentos append-only comprimidos, endereçados por conteúdo
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from attributes import write_attributes
+from models import MarketItem
+from sources.base import RawPage, get_adapter_class
+from storage import listing_key
+
+logger = logging.getLogger(__name__)
+
+RECORD_MAGIC = b"WPA1"
+# magic, tamanho comprimido, sha256 do conteúdo original
+RECORD_HEADER = struct.Struct(">4sI32s")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+
+class PageArchive:
+    """Arquivo de páginas brutas
+
+    O conteúdo vai para segmentos segment-NNNNNN.log, um registro
+    [cabeçalho + zlib] por blob distinto; páginas repetidas (mesmo sha256)
+    não são regravadas. O índice SQLite (index.db) liga cada busca
+    (URL, fonte, tipo, horário) ao blob correspondente.
+    """
+
+    def __init__(self, root: str, segment_size_mb: float = 64, compression_level: int = 6):
+        self.root = root
+        self.segment_size = int(segment_size_mb * 1024 * 1024)
+        self.compression_level = compression_level
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.index = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                raw_length INTEGER NOT NULL
+            )
+        ''')
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS fetches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                source TEXT,
+                kind TEXT,
+                fetched_at TEXT,
+                hash TEXT NOT NULL,
+                encoding TEXT DEFAULT 'bytes',
+                meta TEXT
+            )
+        ''')
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_fetches_url ON fetches(url, fetched_at)")
+        self.index.execute("CREATE INDEX IF NOT EXISTS idx_fetches_time ON fetches(fetched_at)")
+        self.index.commit()
+
+        self._segment_id = self._last_segment()
+        self._segment = None
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.root, f"{SEGMENT_PREFIX}{segment_id:06d}{SEGMENT_SUFFIX}")
+
+    def _last_segment(self) -> int:
+        ids = [
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.root)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        ]
+        return max(ids) if ids else 1
+
+    def _writable_segment(self, incoming: int):
+        """Segmento atual para append, rotacionando quando passa do limite"""
+        if self._segment is None:
+            self._segment = open(self._segment_path(self._segment_id), 'ab')
+        if self._segment.tell() and self._segment.tell() + incoming > self.segment_size:
+            self._segment.close()
+            self._segment_id += 1
+            self._segment = open(self._segment_path(self._segment_id), 'ab')
+        return self._segment
+
+    def store(self, raw: RawPage, source: str) -> str:
+        """Arquiva uma página; retorna o hash do conteúdo"""
+        data, encoding = encode_body(raw.body)
+        digest = hashlib.sha256(data).digest()
+        content_hash = digest.hex()
+
+        with self._lock:
+            exists = self.index.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+            if not exists:
+                compressed = zlib.compress(data, self.compression_level)
+                segment = self._writable_segment(RECORD_HEADER.size + len(compressed))
+                offset = segment.tell()
+                segment.write(RECORD_HEADER.pack(RECORD_MAGIC, len(compressed), digest))
+                segment.write(compressed)
+                segment.flush()
+                self.index.execute(
+                    "INSERT INTO blobs (hash, segment, offset, length, raw_length) VALUES (?, ?, ?, ?, ?)",
+                    (content_hash, self._segment_id, offset, len(compressed), len(data))
+                )
+
+            self.index.execute('''
+                INSERT INTO fetches (url, source, kind, fetched_at, hash, encoding, meta)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (raw.url, source, raw.kind, raw.fetched_at, content_hash, encoding,
+                  json.dumps(raw.meta) if raw.meta else None))
+            self.index.commit()
+        return content_hash
+
+    def read_blob(self, content_hash: str) -> bytes:
+        """Conteúdo original de um blob, verificado pelo hash"""
+        row = self.index.execute(
+            "SELECT segment, offset, length FROM blobs WHERE hash = ?", (content_hash,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(content_hash)
+        return read_record(self._segment_path(row[0]), row[1], row[2], content_hash)
+
+    def load(self, fetch_id: int) -> RawPage:
+        """Reconstrói a RawPage de uma busca arquivada"""
+        row = self.index.execute('''
+            SELECT url, kind, fetched_at, hash, encoding, meta FROM fetches WHERE id = ?
+        ''', (fetch_id,)).fetchone()
+        if row is None:
+            raise KeyError(fetch_id)
+        url, kind, fetched_at, content_hash, encoding, meta = row
+        return RawPage(
+            url=url, kind=kind, fetched_at=fetched_at,
+            body=decode_body(self.read_blob(content_hash), encoding),
+            meta=json.loads(meta) if meta else {}
+        )
+
+    def fetches(self, sources: Optional[List[str]] = None, since: Optional[str] = None,
+                url: Optional[str] = None) -> List[Tuple[int, str, str]]:
+        """(id, source, fetched_at) das buscas, em ordem de horário"""
+        query = "SELECT id, source, fetched_at FROM fetches WHERE 1 = 1"
+        params: list = []
+        if sources:
+            query += f" AND source IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        if since:
+            query += " AND fetched_at >= ?"
+            params.append(since)
+        if url:
+            query += " AND url = ?"
+            params.append(url)
+        query += " ORDER BY fetched_at, id"
+        return self.index.execute(query, params).fetchall()
+
+    def stats(self) -> Dict:
+        blobs, stored, raw = self.index.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(raw_length), 0) FROM blobs"
+        ).fetchone()
+        fetches = self.index.execute("SELECT COUNT(*) FROM fetches").fetchone()[0]
+        return {"fetches": fetches, "blobs": blobs, "stored_bytes": stored, "raw_bytes": raw}
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self.index.close()
+
+
+def encode_body(body) -> Tuple[bytes, str]:
+    """Bytes a arquivar e a codificação usada (bytes, text ou json)"""
+    if isinstance(body, bytes):
+        return body, "bytes"
+    if isinstance(body, str):
+        return body.encode('utf-8'), "text"
+    return json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), "json"
+
+
+def decode_body(data: bytes, encoding: str):
+    if encoding == "text":
+        return data.decode('utf-8')
+    if encoding == "json":
+        return json.loads(data)
+    return data
+
+
+def read_record(path: str, offset: int, length: int, content_hash: str) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        magic, compressed_length, digest = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        if magic != RECORD_MAGIC or compressed_length != length or digest.hex() != content_hash:
+            raise ValueError(f"Corrupt archive record at {path}:{offset}")
+        data = zlib.decompress(f.read(compressed_length))
+    if hashlib.sha256(data).hexdigest() != content_hash:
+        raise ValueError(f"Checksum mismatch at {path}:{offset}")
+    return data
+
+
+def iter_segment(path: str) -> Iterator[Tuple[int, str, bytes]]:
+    """Percorre um segmento sequencialmente: (offset, hash, conteúdo)"""
+    with open(path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            magic, length, digest = RECORD_HEADER.unpack(header)
+            if magic != RECORD_MAGIC:
+                raise ValueError(f"Corrupt archive record at {path}:{offset}")
+            yield offset, digest.hex(), zlib.decompress(f.read(length))
+
+
+# Reextração: reprocessa o arquivo com o parser e o extrator atuais, sem rede.
+# Cada processo do pool tem seu próprio scraper (banco em memória) e leitor do arquivo.
+_replay_state = None
+
+
+def _init_replay_worker(config_file: str, archive_root: str):
+    global _replay_state
+    from main import WurmMarketScraper
+
+    scraper = WurmMarketScraper(config_file, overrides={"database_path": ":memory:", "page_archive": {"enabled": False}})
+    _replay_state = (scraper, PageArchive(archive_root), {})
+
+
+def _replay_chunk(fetch_ids: List[int]) -> Tuple[List[Tuple[str, MarketItem]], int]:
+    """Parse de um lote de buscas arquivadas: ([(fetched_at, item)], erros)"""
+    scraper, archive, adapters = _replay_state
+    results = []
+    errors = 0
+    for fetch_id, source in fetch_ids:
+        try:
+            adapter = adapters.get(source)
+            if adapter is None:
+                adapter = adapters[source] = get_adapter_class(source)(scraper, scraper.source_options(source))
+            raw = archive.load(fetch_id)
+            results.extend((raw.fetched_at, item) for item in adapter.parse(raw))
+        except Exception as e:
+            logger.error(f"Error replaying archived fetch {fetch_id} ({source}): {e}")
+            errors += 1
+    return results, errors
+
+
+def to_db_time(fetched_at: str) -> Tuple[str, int]:
+    """ISO local de fetched_at -> (timestamp UTC no formato do SQLite, epoch)"""
+    moment = datetime.fromisoformat(fetched_at)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), int(moment.timestamp())
+
+
+class ReExtractor:
+    """Reconstrói market_items a partir do arquivo de páginas
+
+    Os lotes são processados em paralelo (um processo por núcleo) e chegam
+    em ordem de fetched_at; a busca mais recente de cada anúncio
+    (name, seller, url) vence, e a primeira vira created_at. As linhas das
+    fontes reprocessadas são então substituídas numa única transação.
+    """
+
+    def __init__(self, scraper, archive: PageArchive, workers: Optional[int] = None, chunk_size: int = 64):
+        self.scraper = scraper
+        self.archive = archive
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def replay(self, sources: Optional[List[str]] = None, since: Optional[str] = None) -> Tuple[Dict, Dict]:
+        """Parse paralelo das buscas; retorna ({chave: (primeira, última, item)}, resumo)"""
+        fetches = self.archive.fetches(sources, since)
+        chunks = [
+            [(fetch_id, source) for fetch_id, source, _ in fetches[i:i + self.chunk_size]]
+            for i in range(0, len(fetches), self.chunk_size)
+        ]
+        listings: Dict[Tuple, Tuple[str, str, MarketItem]] = {}
+        summary = {"fetches": len(fetches), "items": 0, "errors": 0, "sources": sorted({f[1] for f in fetches})}
+        if not chunks:
+            return listings, summary
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_replay_worker,
+            initargs=(self.scraper.config_file, self.archive.root)
+        ) as executor:
+            for results, errors in executor.map(_replay_chunk, chunks):
+                summary["errors"] += errors
+                summary["items"] += len(results)
+                for fetched_at, item in results:
+                    key = (item.name, item.seller, item.url)
+                    first = listings[key][0] if key in listings else fetched_at
+                    listings[key] = (first, fetched_at, item)
+        return listings, summary
+
+    def rebuild(self, sources: Optional[List[str]] = None, since: Optional[str] = None) -> Dict:
+        """Substitui as linhas das fontes reprocessadas pelo resultado do replay"""
+        start = time.perf_counter()
+        listings, summary = self.replay(sources, since)
+        replaced = sources or summary["sources"]
+
+        rows = []
+        for first, last, item in listings.values():
+            created_at, _ = to_db_time(first)
+            updated_at, updated_epoch = to_db_time(last)
+            rows.append((
+                item.name, item.category, item.price, item.cost, item.quality, item.enchantments,
+                item.server, item.seller, item.location, item.quantity, item.timestamp, item.source,
+                item.url, item.description, item.contact, 'active', created_at, updated_at, updated_epoch,
+                listing_key(item.name, item.seller, item.url)
+            ))
+
+        conn = self.scraper.db_connection
+        self.scraper.begin_write()
+        try:
+            if replaced:
+                conn.execute(f'''
+                    DELETE FROM item_attributes WHERE listing_key IN (
+                        SELECT listing_key FROM market_items WHERE source IN ({', '.join('?' * len(replaced))})
+                    )
+                ''', replaced)
+                conn.execute(
+                    f"DELETE FROM market_items WHERE source IN ({', '.join('?' * len(replaced))})", replaced
+                )
+            conn.executemany('''
+                INSERT INTO market_items (
+                    name, category, price, cost, quality, enchantments,
+                    server, seller, location, quantity, timestamp, source,
+                    url, description, contact, status, created_at, updated_at, updated_epoch, listing_key
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            write_attributes(conn, ((row[-1], item) for row, (_, _, item) in zip(rows, listings.values())))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        summary.update(listings=len(rows), seconds=round(time.perf_counter() - start, 3))
+        logger.info(f"Re-extracted {summary['fetches']} archived pages into {len(rows)} listings {summary}")
+        return summary
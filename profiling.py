@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Profiling hooks for Wurm Online Market Tracker
+cProfile e profiler por amostragem sob demanda, e log de consultas SQL lentas
+"""
+
+import collections
+import cProfile
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("wurm.slow_query")
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+def profile_output_path(output_dir: str, name: str, mode: str) -> str:
+    """Caminho do arquivo de saída: .prof (pstats) ou .folded (stacks colapsadas)"""
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name).strip("_") or "profile"
+    extension = "prof" if mode == "cprofile" else "folded"
+    return os.path.join(output_dir, f"{safe_name}_{stamp}.{extension}")
+
+
+class SamplingProfiler:
+    """Profiler por amostragem de stacks, em uma thread separada
+
+    Grava no formato "stack colapsada" (frame;frame;frame contagem), lido
+    por flamegraph.pl, inferno, speedscope e similares.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.samples: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                self.samples[self.fold(frame)] += 1
+
+    @staticmethod
+    def fold(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Liga um dos modos de profiling em volta de um trecho de código"""
+
+    def __init__(self, mode: str = "cprofile", interval: float = 0.005, current_thread_only: bool = False):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.current_thread_only = current_thread_only
+        self._impl = None
+
+    def start(self):
+        if self.mode == "cprofile":
+            self._impl = cProfile.Profile()
+            self._impl.enable()
+        else:
+            thread_ids = [threading.get_ident()] if self.current_thread_only else None
+            self._impl = SamplingProfiler(self.interval, thread_ids)
+            self._impl.start()
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._impl.disable()
+        else:
+            self._impl.stop()
+
+    def dump(self, path: str):
+        if self.mode == "cprofile":
+            self._impl.dump_stats(path)
+        else:
+            self._impl.dump(path)
+
+
+def profile_call(func: Callable, output_dir: str = "profiles", name: str = "run",
+                 mode: str = "cprofile", interval: float = 0.005) -> Tuple[object, str]:
+    """Executa func sob o profiler e grava o resultado; retorna (resultado, arquivo)"""
+    profiler = Profiler(mode, interval)
+    path = profile_output_path(output_dir, name, mode)
+    profiler.start()
+    try:
+        result = func()
+    finally:
+        profiler.stop()
+        profiler.dump(path)
+        logger.info(f"Profile ({mode}) written to {path}")
+    return result, path
+
+
+class SlowQueryLog:
+    """Registra SQL, parâmetros, duração e EXPLAIN QUERY PLAN de consultas lentas"""
+
+    def __init__(self, threshold_ms: float = 100.0, log_file: str = ""):
+        self.threshold = threshold_ms / 1000
+        self.log_file = log_file
+        self._lock = threading.Lock()
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, duration: float):
+        plan = explain_query_plan(conn, sql, params)
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "sql": " ".join(sql.split()),
+            "params": params if isinstance(params, (list, tuple, dict)) else None,
+            "plan": plan,
+        }
+        slow_query_logger.warning(
+            f"Slow query ({entry['duration_ms']} ms): {entry['sql']} params={entry['params']} plan={plan}"
+        )
+        if self.log_file:
+            with self._lock, open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params) -> list:
+    """EXPLAIN QUERY PLAN do comando (não executa o comando)"""
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ())
+        return [row[-1] for row in rows.fetchall()]
+    except sqlite3.Error:
+        return []
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor que mede cada execute e avisa o SlowQueryLog da conexão"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.check_slow(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.check_slow(sql, None, time.perf_counter() - start)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Conexão SQLite com log de consultas lentas (use como factory de sqlite3.connect)"""
+
+    slow_query_log: Optional[SlowQueryLog] = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def check_slow(self, sql: str, params, duration: float):
+        log = self.slow_query_log
+        if log is not None and duration >= log.threshold:
+            log.record(self, sql, params, duration)
+
+
+def connect(database: str, slow_query_ms: Optional[float] = None, slow_query_file: str = "",
+            **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect que liga o log de consultas lentas quando slow_query_ms é definido"""
+    if slow_query_ms is None:
+        return sqlite3.connect(database, **kwargs)
+    conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+    conn.slow_query_log = SlowQueryLog(slow_query_ms, slow_query_file)
+    return conn
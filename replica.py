@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Read replica for Wurm Online Market Tracker
+Snapshots somente-leitura do banco (API de backup online do SQLite) para as leituras pesadas da API
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import profiling
+from archival import HISTORY_VIEW, create_history_view, view_exists
+from storage import add_ingest_listener, remove_ingest_listener
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLICA_CONFIG = {
+    "enabled": False,
+    "path": "replica",            # Diretório dos snapshots
+    "min_interval": 30.0,         # Segundos mínimos entre publicações (lotes seguidos viram uma só)
+    "keep": 3,                    # Gerações mantidas; leitores abertos numa apagada seguem pelo descritor
+    "mmap_size": 268435456,       # 256 MiB de mmap por conexão de leitura
+}
+
+POINTER = "CURRENT"
+
+# Um publicador por banco no processo: {caminho absoluto: [publicador, referências]}
+_publishers: Dict[str, list] = {}
+_publishers_lock = threading.Lock()
+
+
+def snapshot_name(generation: int) -> str:
+    return f"market-{generation:08d}.db"
+
+
+def write_pointer(directory: str, pointer: Dict):
+    path = os.path.join(directory, POINTER)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_pointer(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, POINTER), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ReplicaPublisher:
+    """Copia o banco para um arquivo novo por geração e aponta CURRENT para ele
+
+    A cópia é um backup online numa passada só: em WAL a transação de
+    leitura da cópia não bloqueia quem escreve. O arquivo publicado nunca
+    mais muda (por isso os leitores podem abrir com immutable=1); cada
+    publicação é um arquivo novo, trocado pelo os.replace do ponteiro.
+    request() só marca que há dados novos; a thread publica no máximo uma
+    vez a cada min_interval.
+    """
+
+    def __init__(self, db_path: str, config: Optional[Dict] = None):
+        self.db_path = db_path
+        self.config = dict(DEFAULT_REPLICA_CONFIG, **(config or {}))
+        self.directory = self.config["path"]
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._published_at = 0.0
+
+    def publish(self) -> Dict:
+        """Publica uma geração nova agora; retorna o ponteiro gravado"""
+        with self._lock:
+            self._pending.clear()
+            os.makedirs(self.directory, exist_ok=True)
+            current = read_pointer(self.directory) or {"generation": 0}
+            generation = current["generation"] + 1
+            name = snapshot_name(generation)
+            path = os.path.join(self.directory, name)
+            started = time.perf_counter()
+            source = sqlite3.connect(self.db_path, timeout=30)
+            target = sqlite3.connect(path + ".tmp")
+            try:
+                source.backup(target)
+                # Sem WAL na cópia: arquivo único, legível com immutable=1
+                target.execute("PRAGMA journal_mode = DELETE")
+                # A view de histórico não pode ser criada depois, numa conexão somente-leitura
+                if not view_exists(target, HISTORY_VIEW):
+                    create_history_view(target)
+            finally:
+                target.close()
+                source.close()
+            os.replace(path + ".tmp", path)
+            pointer = {"generation": generation, "file": name, "published_at": time.time()}
+            write_pointer(self.directory, pointer)
+            self._published_at = time.monotonic()
+            self.prune(generation)
+        logger.info(f"Replica generation {generation} published in {time.perf_counter() - started:.2f}s")
+        return pointer
+
+    def prune(self, generation: int):
+        keep = {snapshot_name(g) for g in range(generation - self.config["keep"] + 1, generation + 1)}
+        for name in os.listdir(self.directory):
+            if name.startswith("market-") and name.endswith(".db") and name not in keep:
+                os.remove(os.path.join(self.directory, name))
+
+    def request(self):
+        """Há dados novos commitados (chamado pelos listeners de ingestão)"""
+        self._pending.set()
+
+    def ingest_listener(self, conn: sqlite3.Connection, items):
+        self.request()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-publisher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._pending.wait(1.0):
+                continue
+            wait = self.config["min_interval"] - (time.monotonic() - self._published_at)
+            if wait > 0 and self._stop.wait(wait):
+                break
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Replica publish failed: {e}")
+
+    def stop(self, flush: bool = True):
+        """Para a thread; com flush, publica o que ficou pendente (o processo pode estar saindo)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush and self._pending.is_set():
+            self.publish()
+
+
+def acquire_publisher(db_path: str, config: Optional[Dict] = None) -> "ReplicaPublisher":
+    """Publicador compartilhado do banco: o primeiro a pedir (a API, se houver) cria, registra e inicia
+
+    Os seguintes (ex.: scrapers abertos pela API) recebem o mesmo, com o
+    config de quem criou; cada um devolve com release_publisher().
+    """
+    path = os.path.abspath(db_path)
+    with _publishers_lock:
+        entry = _publishers.get(path)
+        if entry is None:
+            publisher = ReplicaPublisher(db_path, config)
+            add_ingest_listener(f"replica:{path}", publisher.ingest_listener)
+            publisher.start()
+            entry = _publishers[path] = [publisher, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_publisher(publisher: "ReplicaPublisher"):
+    """Devolve o publicador; o último a devolver tira o listener e para a thread (publicando o pendente)"""
+    path = os.path.abspath(publisher.db_path)
+    with _publishers_lock:
+        entry = _publishers.get(path)
+        if entry is None or entry[0] is not publisher:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _publishers[path]
+        remove_ingest_listener(f"replica:{path}")
+    publisher.stop()
+
+
+class ReplicaReader:
+    """Abre conexões de leitura na geração mais nova publicada
+
+    O ponteiro é relido só quando o mtime dele muda; cada conexão nova já
+    sai na geração atual, e as abertas terminam na que estavam.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = dict(DEFAULT_REPLICA_CONFIG, **(config or {}))
+        self.directory = self.config["path"]
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._path: Optional[str] = None
+
+    def current_path(self) -> Optional[str]:
+        try:
+            mtime = os.stat(os.path.join(self.directory, POINTER)).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                pointer = read_pointer(self.directory)
+                if pointer is None:
+                    return self._path
+                self._mtime = mtime
+                self._path = os.path.abspath(os.path.join(self.directory, pointer["file"]))
+            return self._path
+
+    def connect(self, slow_query_ms: Optional[float] = None, slow_query_file: str = "",
+                **kwargs) -> Optional[sqlite3.Connection]:
+        """Conexão somente-leitura na geração atual; None se nada foi publicado ainda"""
+        path = self.current_path()
+        if path is None:
+            return None
+        # immutable=1: sem locks nem checagem de mudança (o arquivo publicado nunca é reescrito)
+        conn = profiling.connect(f"file:{quote(path)}?mode=ro&immutable=1", slow_query_ms, slow_query_file,
+                                 uri=True, **kwargs)
+        conn.execute(f"PRAGMA mmap_size = {int(self.config['mmap_size'])}")
+        return conn
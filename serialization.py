@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Serialization layer for Wurm Online Market Tracker
+Codifica linhas do banco em JSON compacto, com cache de fragmentos por linha
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+try:
+    import orjson  # Backend rápido opcional
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+# Colunas de versão, em ordem de preferência (updated_epoch muda a cada upsert que altera a linha)
+VERSION_COLUMNS = ("updated_epoch", "updated_at")
+
+
+def dumps(obj: Any) -> bytes:
+    """Codifica um objeto em JSON compacto (UTF-8, sem indentação)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: bytes) -> Any:
+    """Decodifica JSON (bytes ou str)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_records(columns: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Linhas (tuplas) de uma projeção como array de objetos, numa única chamada ao backend"""
+    return dumps([dict(zip(columns, row)) for row in rows])
+
+
+def encode_compact(columns: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Modo compacto: nomes das colunas uma vez e as linhas como arrays"""
+    return dumps({"columns": list(columns), "rows": [list(row) for row in rows]})
+
+
+def backend_name() -> str:
+    """Nome do backend de JSON em uso"""
+    return "orjson" if orjson is not None else "json"
+
+
+class RowEncoder:
+    """Cache LRU de fragmentos JSON pré-codificados por linha
+
+    A chave é (colunas, id, updated_epoch, status): todo upsert que muda a
+    linha renova updated_epoch, e a expiração (que não mexe no epoch) muda
+    o status. Só essas colunas entram na chave, então um acerto custa
+    três leituras, não uma cópia da linha. Sem updated_epoch na projeção
+    vale updated_at; sem id nem versão, a linha é codificada sem cache.
+    """
+
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._versions: Dict[tuple, Optional[itemgetter]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version_getter(self, columns: tuple, by_name: bool) -> Optional[itemgetter]:
+        """Leitor das colunas de versão desta projeção (calculado uma vez por projeção)"""
+        cache_key = (columns, by_name)
+        if cache_key not in self._versions:
+            version = next((name for name in VERSION_COLUMNS if name in columns), None)
+            getter = None
+            if "id" in columns and version is not None:
+                names = [name for name in ("id", version, "status") if name in columns]
+                # sqlite3.Row por posição é mais barato que por nome
+                getter = itemgetter(*(names if by_name else [columns.index(name) for name in names]))
+            self._versions[cache_key] = getter
+        return self._versions[cache_key]
+
+    def encode_row(self, row, key_extra: Any = None) -> bytes:
+        """Retorna o JSON de uma linha (sqlite3.Row ou dict), usando o cache"""
+        with self._lock:
+            return self._encode_locked(row, tuple(row.keys()), key_extra)
+
+    def _encode_locked(self, row, columns: tuple, key_extra: Any) -> bytes:
+        version = self.version_getter(columns, isinstance(row, dict))
+        if version is None:
+            return dumps(dict(row))
+        key = (columns, version(row), key_extra)
+
+        fragment = self._cache.get(key)
+        if fragment is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+        fragment = dumps(dict(row))
+        self.misses += 1
+        self._cache[key] = fragment
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return fragment
+
+    def encode_rows(self, rows: Iterable, key_extra: Any = None) -> bytes:
+        """Monta um array JSON concatenando os fragmentos das linhas"""
+        rows = list(rows)
+        if not rows:
+            return b'[]'
+        # Todas as linhas de uma consulta têm a mesma projeção
+        columns = tuple(rows[0].keys())
+        with self._lock:
+            return b'[' + b','.join([self._encode_locked(row, columns, key_extra) for row in rows]) + b']'
+
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        """Estatísticas do cache"""
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'backend': backend_name()
+            }
+
+
+# Encoder compartilhado pelo processo (API e exportações)
+row_encoder = RowEncoder()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Price sketches for Wurm Online Market Tracker
+Sketches KLL de quantis por categoria, servidor e item, atualizados na ingestão e lidos em O(1)
+"""
+
+import logging
+import math
+import sqlite3
+import struct
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from arbitrage import item_key
+from models import MarketItem
+from storage import listing_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SKETCH_CONFIG = {
+    "enabled": True,
+    "k": 128,              # Precisão do KLL (erro de rank ~1.7/k)
+    "outlier_factor": 3.0,  # Cerca: p50 ± fator * (p90 - p10)
+    "min_price": 0.01,
+    "rebuild_stale_ratio": 0.25,  # Fração de valores de anúncios mortos/repreçados que dispara a reconstrução
+}
+
+SCOPES = ("category", "server", "item")
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Cabeçalho do blob: k, n, min, max, número de níveis
+SKETCH_HEADER = struct.Struct(">HQddH")
+
+
+class KLLSketch:
+    """Sketch KLL (Karnin, Lang, Liberty): quantis aproximados em memória sublinear
+
+    Cada nível h guarda valores com peso 2**h; quando um nível passa da
+    capacidade, é ordenado e metade dos valores (pares ou ímpares,
+    alternando) sobe para o nível seguinte. Dois sketches se combinam
+    concatenando os níveis e compactando de novo.
+    """
+
+    __slots__ = ("k", "n", "min", "max", "levels", "_flip")
+
+    def __init__(self, k: int = 128):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels: List[List[float]] = [[]]
+        self._flip = False
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, value: float):
+        self.n += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self.capacity(0):
+            self.compress()
+
+    def extend(self, values: List[float]):
+        """Insere vários valores de uma vez, com uma única compactação no fim"""
+        if not values:
+            return
+        self.n += len(values)
+        self.min = min(self.min, min(values))
+        self.max = max(self.max, max(values))
+        self.levels[0].extend(values)
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # Com tamanho ímpar, o último valor fica no nível
+                keep = [items.pop()] if len(items) % 2 else []
+                self._flip = not self._flip
+                self.levels[level + 1].extend(items[int(self._flip)::2])
+                self.levels[level] = keep
+            level += 1
+
+    def merge(self, other: "KLLSketch"):
+        if other.n == 0:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def quantiles(self, fractions: Iterable[float] = QUANTILES) -> List[Optional[float]]:
+        fractions = list(fractions)
+        if self.n == 0:
+            return [None] * len(fractions)
+        if len(self.levels) == 1:
+            # Nada compactado ainda (caso da maioria dos itens): peso 1, quantil direto pelo índice
+            values = sorted(self.levels[0])
+            return [self.min if fraction <= 0 else self.max if fraction >= 1
+                    else values[max(0, math.ceil(fraction * len(values)) - 1)] for fraction in fractions]
+        weighted = sorted(
+            (value, 1 << level) for level, items in enumerate(self.levels) for value in items
+        )
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target, seen = fraction * total, 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def to_bytes(self) -> bytes:
+        """Blob compacto: cabeçalho, tamanhos dos níveis (uint32) e valores (float32)"""
+        sizes = [len(items) for items in self.levels]
+        values = [value for items in self.levels for value in items]
+        return (SKETCH_HEADER.pack(self.k, self.n, self.min, self.max, len(sizes))
+                + struct.pack(f"<{len(sizes)}I{len(values)}f", *sizes, *values))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "KLLSketch":
+        k, n, minimum, maximum, level_count = SKETCH_HEADER.unpack_from(blob)
+        offset = SKETCH_HEADER.size
+        sizes = struct.unpack_from(f"<{level_count}I", blob, offset)
+        values = struct.unpack_from(f"<{sum(sizes)}f", blob, offset + 4 * level_count)
+        sketch = cls(k)
+        sketch.n, sketch.min, sketch.max = n, minimum, maximum
+        sketch.levels, start = [], 0
+        for size in sizes:
+            sketch.levels.append(list(values[start:start + size]))
+            start += size
+        return sketch
+
+
+def ensure_sketch_schema(conn: sqlite3.Connection):
+    fresh = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sketch_listings'").fetchone()
+    # Último preço de cada anúncio ativo já inserido nos sketches (revisitas sem mudança não entram de novo)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sketch_listings (
+            listing_key INTEGER PRIMARY KEY,
+            price REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS price_sketches (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            label TEXT,
+            category TEXT,
+            n INTEGER NOT NULL,
+            min_price REAL,
+            max_price REAL,
+            p10 REAL,
+            p50 REAL,
+            p90 REAL,
+            low_fence REAL,
+            high_fence REAL,
+            outlier INTEGER NOT NULL DEFAULT 0,
+            sketch BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (scope, key)
+        )
+    ''')
+    # Recomendações: itens por mediana, sem varrer market_items
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_sketches_p50 ON price_sketches(scope, outlier, p50)")
+    if fresh and conn.execute("SELECT 1 FROM price_sketches LIMIT 1").fetchone():
+        # Sketches antigos têm cada revisita inserida de novo: descarta e deixa reconstruir
+        conn.execute("DELETE FROM price_sketches")
+        logger.warning("Price sketches reset to per-listing tracking; run 'stats --rebuild-sketches' to refill now")
+    conn.commit()
+
+
+def fences(p10: float, p50: float, p90: float, factor: float) -> Tuple[float, float]:
+    spread = (p90 - p10) * factor
+    return max(0.0, p50 - spread), p50 + spread
+
+
+class SketchEngine:
+    """Listener de ingestão: mescla os preços de cada lote nos sketches persistidos
+
+    Os quantis e as cercas de outlier são calculados na escrita; a leitura
+    é uma busca por chave primária. Itens cuja mediana cai fora das cercas
+    da categoria ficam marcados como outlier (ex.: "1000s" mal extraído).
+
+    Só entram anúncios novos ou com preço mudado (sketch_listings guarda o
+    último preço por listing_key). Um KLL não remove valores: o preço
+    antigo de um anúncio repreçado, expirado ou vendido continua no
+    sketch. stale_ratio() mede essa fração e maintain() reconstrói a
+    partir dos anúncios ativos quando ela passa de rebuild_stale_ratio.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = dict(DEFAULT_SKETCH_CONFIG, **(config or {}))
+
+    def observe(self, conn: sqlite3.Connection, items: Iterable[MarketItem]):
+        min_price = self.config["min_price"]
+        listings: Dict[int, Tuple[MarketItem, float]] = {}
+        for item in items:
+            if item.status == 'active' and item.price and item.price >= min_price:
+                listings[listing_key(item.name, item.seller, item.url)] = (item, float(item.price))
+        if not listings:
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            known = self.load_prices(conn, list(listings))
+            changed = {key: listing for key, listing in listings.items() if known.get(key) != listing[1]}
+            if changed:
+                conn.executemany("INSERT OR REPLACE INTO sketch_listings (listing_key, price) VALUES (?, ?)",
+                                 [(key, price) for key, (_, price) in changed.items()])
+                self.merge(conn, *self.group(changed.values()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def retract(self, conn: sqlite3.Connection, keys: List[int]):
+        """Listener de retirada: o anúncio sai de sketch_listings (o valor fica no sketch até a reconstrução)"""
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            conn.execute(f"DELETE FROM sketch_listings WHERE listing_key IN ({', '.join('?' * len(chunk))})", chunk)
+        conn.commit()
+
+    def load_prices(self, conn: sqlite3.Connection, keys: List[int]) -> Dict[int, float]:
+        prices = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            prices.update(conn.execute(f'''
+                SELECT listing_key, price FROM sketch_listings WHERE listing_key IN ({", ".join("?" * len(chunk))})
+            ''', chunk))
+        return prices
+
+    def group(self, listings: Iterable[Tuple[MarketItem, float]]):
+        """Preços do lote por (escopo, chave) e os rótulos de cada um"""
+        prices: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        labels: Dict[Tuple[str, str], Tuple[str, Optional[str]]] = {}
+        for item, price in listings:
+            category = item.category or ""
+            for scope_key, label in (
+                (("category", category), (category, item.category)),
+                (("server", item.server or ""), (item.server or "", None)),
+                (("item", item_key(item.name)), (item.name, item.category)),
+            ):
+                prices[scope_key].append(price)
+                labels[scope_key] = label
+        return prices, labels
+
+    def load(self, conn: sqlite3.Connection, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], KLLSketch]:
+        by_scope = defaultdict(list)
+        for scope, key in keys:
+            by_scope[scope].append(key)
+        stored = {}
+        for scope, scope_keys in by_scope.items():
+            for start in range(0, len(scope_keys), 500):
+                chunk = scope_keys[start:start + 500]
+                for key, blob in conn.execute(f'''
+                    SELECT key, sketch FROM price_sketches
+                    WHERE scope = ? AND key IN ({", ".join("?" * len(chunk))})
+                ''', [scope, *chunk]):
+                    stored[(scope, key)] = KLLSketch.from_bytes(blob)
+        return stored
+
+    def merge(self, conn: sqlite3.Connection, prices: Dict[Tuple[str, str], List[float]],
+              labels: Dict[Tuple[str, str], Tuple[str, Optional[str]]]):
+        merged = self.load(conn, list(prices))
+        factor = self.config["outlier_factor"]
+        # Os preços do lote entram direto no nível 0 do sketch gravado: uma compactação por chave
+        for scope_key, values in prices.items():
+            sketch = merged.get(scope_key)
+            if sketch is None:
+                sketch = merged[scope_key] = KLLSketch(self.config["k"])
+            sketch.extend(values)
+
+        # Categorias primeiro: as cercas delas decidem o flag de outlier dos itens
+        category_fences = {}
+        rows = []
+        for (scope, key), sketch in sorted(merged.items(), key=lambda pair: SCOPES.index(pair[0][0])):
+            p10, p50, p90 = sketch.quantiles()
+            low, high = fences(p10, p50, p90, factor)
+            outlier = 0
+            label, category = labels[(scope, key)]
+            if scope == "category":
+                category_fences[key] = (low, high)
+            elif scope == "item":
+                bounds = category_fences.get(category or "") or self.stored_fences(conn, category or "")
+                if bounds is not None:
+                    outlier = int(not bounds[0] <= p50 <= bounds[1])
+            rows.append((scope, key, label, category, sketch.n, sketch.min, sketch.max,
+                         p10, p50, p90, low, high, outlier, sketch.to_bytes()))
+
+        conn.executemany('''
+            INSERT OR REPLACE INTO price_sketches (
+                scope, key, label, category, n, min_price, max_price,
+                p10, p50, p90, low_fence, high_fence, outlier, sketch
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+    def stored_fences(self, conn: sqlite3.Connection, category: str) -> Optional[Tuple[float, float]]:
+        return conn.execute(
+            "SELECT low_fence, high_fence FROM price_sketches WHERE scope = 'category' AND key = ?", (category,)
+        ).fetchone()
+
+    def stale_ratio(self, conn: sqlite3.Connection) -> float:
+        """Fração dos valores nos sketches que não é mais o preço de um anúncio ativo"""
+        # Cada valor inserido cai em exatamente um sketch de categoria
+        inserted = conn.execute("SELECT COALESCE(SUM(n), 0) FROM price_sketches WHERE scope = 'category'").fetchone()[0]
+        if not inserted:
+            return 0.0
+        live = conn.execute("SELECT COUNT(*) FROM sketch_listings").fetchone()[0]
+        return max(0.0, 1 - live / inserted)
+
+    def maintain(self, conn: sqlite3.Connection) -> int:
+        """Reconstrói se a fração velha passou do limite; retorna os anúncios usados (0 se não precisou)"""
+        ratio = self.stale_ratio(conn)
+        if ratio <= self.config["rebuild_stale_ratio"]:
+            return 0
+        logger.info(f"Price sketches are {ratio:.0%} stale, rebuilding from active listings")
+        return self.rebuild(conn)
+
+    def rebuild(self, conn: sqlite3.Connection, batch_size: int = 5000) -> int:
+        """Recalcula os sketches a partir dos anúncios ativos"""
+        conn.execute("DELETE FROM price_sketches")
+        conn.execute("DELETE FROM sketch_listings")
+        conn.commit()
+        rows = conn.execute('''
+            SELECT name, category, price, server, seller, url FROM market_items
+            WHERE status = 'active' ORDER BY updated_epoch, id
+        ''').fetchall()
+        for start in range(0, len(rows), batch_size):
+            self.observe(conn, [
+                MarketItem(name=name, category=category, price=price, server=server, seller=seller, url=url)
+                for name, category, price, server, seller, url in rows[start:start + batch_size]
+            ])
+        return len(rows)
+
+
+def price_quantiles(conn: sqlite3.Connection, scope: str, key: Optional[str] = None) -> Dict[str, Dict]:
+    """{chave: {n, p10, p50, p90, low_fence, high_fence, ...}} de um escopo (ou de uma chave)"""
+    query = '''
+        SELECT key, label, category, n, min_price, max_price, p10, p50, p90, low_fence, high_fence, outlier
+        FROM price_sketches WHERE scope = ?
+    '''
+    params: list = [scope]
+    if key is not None:
+        query += " AND key = ?"
+        params.append(item_key(key) if scope == "item" else key)
+    columns = ("label", "category", "n", "min", "max", "p10", "p50", "p90", "low_fence", "high_fence", "outlier")
+    return {
+        row[0]: {
+            column: (round(value, 2) if isinstance(value, float) else value)
+            for column, value in zip(columns, row[1:])
+        }
+        for row in conn.execute(query, params)
+    }
+
+
+def top_items_by_median(conn: sqlite3.Connection, limit: int = 10, min_count: int = 2,
+                        include_outliers: bool = False) -> List[Dict]:
+    """Itens de maior mediana, lidos pelo índice (scope, outlier, p50)"""
+    query = "SELECT label, category, n, p10, p50, p90, outlier, updated_at FROM price_sketches WHERE scope = 'item'"
+    if not include_outliers:
+        query += " AND outlier = 0"
+    query += " AND n >= ? ORDER BY p50 DESC LIMIT ?"
+    columns = ("name", "category", "n", "p10", "p50", "p90", "outlier", "updated_at")
+    return [dict(zip(columns, row)) for row in conn.execute(query, (min_count, limit))]
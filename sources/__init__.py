@@ -0,0 +1,26 @@
+"""
+Source adapters for Wurm Online Market Tracker
+
+Os módulos das fontes (e suas dependências pesadas, como bs4 e requests)
+só são importados quando a fonte é usada.
+"""
+
+from sources.base import (
+    ADAPTER_MODULES,
+    ADAPTERS,
+    RawPage,
+    SourceAdapter,
+    build_adapters,
+    get_adapter_class,
+    register_adapter,
+)
+
+__all__ = [
+    "ADAPTER_MODULES",
+    "ADAPTERS",
+    "RawPage",
+    "SourceAdapter",
+    "build_adapters",
+    "get_adapter_class",
+    "register_adapter",
+]
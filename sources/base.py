@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Source adapter interface
+Cada fonte implementa fetch (páginas brutas), parse (itens) e checkpoint (progresso)
+"""
+
+import importlib
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import metrics
+from models import MarketItem
+from storage import listing_key
+
+logger = logging.getLogger(__name__)
+
+# Registro nome -> classe, preenchido por @register_adapter
+ADAPTERS: Dict[str, type] = {}
+
+# Módulo de cada fonte embutida, importado só quando a fonte é usada
+ADAPTER_MODULES: Dict[str, str] = {
+    "forum": "sources.forum",
+    "steam": "sources.steam",
+    "discord": "sources.discord_channels",
+}
+
+
+def register_adapter(name: str):
+    """Decorator que registra uma classe de fonte sob um nome de config"""
+    def decorator(cls):
+        cls.name = name
+        ADAPTERS[name] = cls
+        return cls
+    return decorator
+
+
+@dataclass
+class RawPage:
+    """Conteúdo bruto obtido de uma fonte, antes do parse"""
+    url: str
+    kind: str
+    body: Any
+    fetched_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class SourceAdapter:
+    """Interface base das fontes de mercado
+
+    Subclasses implementam fetch() e parse(); items() junta os dois em um
+    stream de MarketItem. Checkpoints pendentes só são gravados quando o
+    runner chama checkpoint(), depois que os itens foram salvos.
+    """
+
+    name = "base"
+    # Cada página traz o estado completo dos anúncios daquela URL (permite o diff entre execuções)
+    snapshot_diff = False
+
+    def __init__(self, scraper, options: Optional[Dict] = None):
+        self.scraper = scraper
+        self.options = options or {}
+        self.pending_checkpoints: Dict[str, str] = {}
+        # URL -> listing_keys vistos nesta execução (só com snapshot_diff)
+        self.crawled: Dict[str, Set[int]] = {}
+
+    @property
+    def config(self) -> Dict:
+        return self.scraper.config
+
+    def fetch(self) -> Iterator[RawPage]:
+        """Obtém páginas/mensagens brutas da fonte"""
+        raise NotImplementedError
+
+    def parse(self, raw: RawPage) -> Iterator[MarketItem]:
+        """Converte uma página bruta em itens"""
+        raise NotImplementedError
+
+    def items(self) -> Iterator[MarketItem]:
+        """Stream de itens da fonte (fetch + parse)"""
+        for raw in self.fetch():
+            page_items = self.parse_page(raw)
+            if page_items is not None:
+                yield from page_items
+
+    def parse_page(self, raw: RawPage) -> Optional[List[MarketItem]]:
+        """Arquiva, faz o parse e registra métricas de uma página; None se o parse falhar"""
+        # Página bruta vai para o arquivo antes do parse (permite reextração offline)
+        self.scraper.archive_page(raw, self.name)
+        try:
+            with metrics.PARSE_SECONDS.time(source=self.name):
+                page_items = list(self.parse(raw))
+        except Exception as e:
+            logger.error(f"Error parsing {self.name} page {raw.url}: {e}")
+            return None
+        # Página retomada: os itens dos posts já lidos não são emitidos de novo, mas fazem parte do
+        # snapshot (resumed_items); sem eles, a página lida em parte não entra no diff
+        if self.snapshot_diff and (not raw.meta.get("skip") or "resumed_items" in raw.meta):
+            self.record_keys(raw.url, page_items + raw.meta.get("resumed_items", []))
+        metrics.ITEMS_PER_PAGE.observe(len(page_items), source=self.name)
+        metrics.ITEMS_SCRAPED.inc(len(page_items), source=self.name)
+        return page_items
+
+    def work_seeds(self) -> List[Tuple[str, str]]:
+        """(url, kind) iniciais para o modo distribuído; vazio = fonte não divisível em URLs"""
+        return []
+
+    def process(self, url: str, kind: str) -> Tuple[Optional[RawPage], List[Tuple[str, str]]]:
+        """Uma unidade de trabalho do modo distribuído: (página para parse, novas URLs a enfileirar)"""
+        response = self.get(url)
+        response.raise_for_status()
+        return RawPage(url=url, kind=kind, body=response.content), []
+
+    def record_keys(self, page_url: str, page_items: List[MarketItem]):
+        """Registra a página como rastreada (mesmo vazia) e as chaves dos seus itens"""
+        self.crawled.setdefault(page_url, set())
+        for item in page_items:
+            self.crawled.setdefault(item.url or page_url, set()).add(listing_key(item.name, item.seller, item.url))
+
+    def load_checkpoint(self, key: str) -> Optional[str]:
+        """Lê o último checkpoint gravado para a chave"""
+        return load_checkpoint(self.scraper.db_connection, self.name, key)
+
+    def set_checkpoint(self, key: str, value: str):
+        """Registra um checkpoint pendente (gravado em checkpoint())"""
+        self.pending_checkpoints[key] = value
+
+    def checkpoint(self):
+        """Grava os checkpoints pendentes"""
+        if not self.pending_checkpoints:
+            return
+        conn = self.scraper.db_connection
+        for key, value in self.pending_checkpoints.items():
+            save_checkpoint(conn, self.name, key, value)
+        conn.commit()
+        self.pending_checkpoints.clear()
+
+    def get(self, url: str, **kwargs):
+        """GET com timeout padrão pelo controlador de requisições do scraper"""
+        kwargs.setdefault("timeout", self.config.get("request_timeout", 10))
+        return self.scraper.http.get(url, source=self.name, **kwargs)
+
+    def get_many(self, urls: List[str], **kwargs) -> Iterator[Tuple[str, Any, Optional[Exception]]]:
+        """GETs simultâneos, na ordem de urls: (url, resposta, erro)
+
+        O paralelismo real é decidido pelo controlador (limite AIMD do host);
+        aqui só há threads suficientes para não ser o gargalo.
+        """
+        def fetch_one(url):
+            try:
+                return url, self.get(url, **kwargs), None
+            except Exception as e:
+                return url, None, e
+
+        if not urls:
+            return
+        workers = min(len(urls), self.scraper.http.config["max_concurrency"])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(fetch_one, urls)
+
+
+def instrumented_get(session, url: str, **kwargs):
+    """session.get com latência, bytes e erros registrados por host"""
+    host = urlparse(url).netloc
+    try:
+        with metrics.FETCH_SECONDS.time(host=host):
+            response = session.get(url, **kwargs)
+            response.raise_for_status()
+    except Exception as e:
+        status = getattr(getattr(e, "response", None), "status_code", None) or type(e).__name__
+        metrics.FETCH_ERRORS.inc(host=host, status=status)
+        raise
+    metrics.FETCH_BYTES.inc(len(response.content), host=host)
+    return response
+
+
+def ensure_checkpoint_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS source_checkpoints (
+            source TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, key)
+        )
+    ''')
+
+
+def load_checkpoint(conn: sqlite3.Connection, source: str, key: str) -> Optional[str]:
+    row = conn.execute(
+        "SELECT value FROM source_checkpoints WHERE source = ? AND key = ?", (source, key)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_checkpoints(conn: sqlite3.Connection, source: str, prefix: str) -> Dict[str, str]:
+    """Checkpoints da fonte cujas chaves começam com prefix, indexados pelo resto da chave"""
+    rows = conn.execute(
+        "SELECT key, value FROM source_checkpoints WHERE source = ? AND key >= ? AND key < ?",
+        (source, prefix, prefix + "\uffff")
+    ).fetchall()
+    return {key[len(prefix):]: value for key, value in rows}
+
+
+def save_checkpoint(conn: sqlite3.Connection, source: str, key: str, value: str):
+    conn.execute('''
+        INSERT INTO source_checkpoints (source, key, value) VALUES (?, ?, ?)
+        ON CONFLICT(source, key) DO UPDATE SET
+            value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    ''', (source, key, value))
+
+
+def get_adapter_class(name: str) -> type:
+    """Classe registrada para a fonte, importando o módulo dela se preciso"""
+    if name not in ADAPTERS and name in ADAPTER_MODULES:
+        importlib.import_module(ADAPTER_MODULES[name])
+    if name not in ADAPTERS:
+        raise KeyError(f"Unknown source adapter: {name}")
+    return ADAPTERS[name]
+
+
+def build_adapters(scraper) -> Dict[str, SourceAdapter]:
+    """Instancia as fontes habilitadas em config["sources"]"""
+    adapters = {}
+    for name, options in scraper.config.get("sources", {}).items():
+        if not options.get("enabled", True):
+            continue
+        try:
+            cls = get_adapter_class(options.get("adapter", name))
+        except (KeyError, ImportError) as e:
+            logger.warning(f"Source {name} unavailable: {e}")
+            continue
+        adapters[name] = cls(scraper, options)
+    return adapters
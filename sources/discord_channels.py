@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Discord source adapter
+Lê o histórico dos canais de mercado pela API REST, a partir de uma marca d'água de message ID
+"""
+
+import json
+import logging
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+from models import MarketItem
+from sources.base import RawPage, SourceAdapter, register_adapter
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API_BASE = "https://discord.com/api/v10"
+PAGE_LIMIT = 100  # Máximo de mensagens por chamada de histórico
+
+# transport(channel_id, params) -> lista de mensagens (formato da API do Discord)
+Transport = Callable[[str, Dict], List[Dict]]
+
+
+@register_adapter("discord")
+class DiscordAdapter(SourceAdapter):
+    """Consome o histórico dos canais incrementalmente
+
+    Cada canal guarda como checkpoint o maior message ID já processado; a
+    próxima execução pede apenas mensagens posteriores (after=), em páginas
+    de 100. Sem checkpoint, lê só as últimas initial_pages páginas.
+    """
+
+    def __init__(self, scraper, options: Optional[Dict] = None, transport: Optional[Transport] = None):
+        super().__init__(scraper, options)
+        self.transport = transport or self.http_transport
+        self._session = None
+        # Lidas na thread do runner: a conexão SQLite não pode ser usada nas threads das fontes
+        self.watermarks = {channel: self.load_checkpoint(channel) for channel in self.channel_ids}
+
+    @property
+    def channel_ids(self) -> List[str]:
+        return [str(channel) for channel in self.options.get("channel_ids", [])]
+
+    def http_transport(self, channel_id: str, params: Dict) -> List[Dict]:
+        """Chamada real a GET /channels/{id}/messages"""
+        if self._session is None:
+            token = self.options.get("token") or self.config.get("discord_token", "")
+            self._session = requests.Session()
+            self._session.headers.update({"Authorization": f"Bot {token}"})
+
+        api_base = self.options.get("api_base", DISCORD_API_BASE).rstrip("/")
+        url = f"{api_base}/channels/{channel_id}/messages"
+        # 429 do Discord vem com Retry-After; o controlador espera e tenta de novo
+        response = self.scraper.http.get(
+            url, source=self.name, session=self._session,
+            params=params, timeout=self.config.get("request_timeout", 10)
+        )
+        return response.json()
+
+    def fetch(self) -> Iterator[RawPage]:
+        for channel_id in self.channel_ids:
+            try:
+                yield from self.fetch_channel(channel_id)
+            except Exception as e:
+                logger.error(f"Error reading Discord channel {channel_id}: {e}")
+
+    def fetch_channel(self, channel_id: str) -> Iterator[RawPage]:
+        watermark = self.watermarks.get(channel_id)
+        if watermark is None:
+            yield from self.fetch_recent(channel_id)
+            return
+
+        while True:
+            messages = self.transport(channel_id, {"after": watermark, "limit": PAGE_LIMIT})
+            if not messages:
+                break
+            watermark = str(max(int(message["id"]) for message in messages))
+            self.set_checkpoint(channel_id, watermark)
+            yield self.page(channel_id, messages)
+            if len(messages) < PAGE_LIMIT:
+                break
+
+    def fetch_recent(self, channel_id: str) -> Iterator[RawPage]:
+        """Primeira leitura de um canal: só as páginas mais recentes"""
+        before = None
+        for _ in range(int(self.options.get("initial_pages", 1))):
+            params = {"limit": PAGE_LIMIT}
+            if before:
+                params["before"] = before
+            messages = self.transport(channel_id, params)
+            if not messages:
+                break
+            ids = [int(message["id"]) for message in messages]
+            if before is None:
+                self.set_checkpoint(channel_id, str(max(ids)))
+            before = str(min(ids))
+            yield self.page(channel_id, messages)
+            if len(messages) < PAGE_LIMIT:
+                break
+
+    def page(self, channel_id: str, messages: List[Dict]) -> RawPage:
+        return RawPage(
+            url=f"discord://channels/{channel_id}",
+            kind="discord_messages",
+            body=messages,
+            meta={"channel_id": channel_id}
+        )
+
+    def parse(self, raw: RawPage) -> Iterator[MarketItem]:
+        channel_id = raw.meta.get("channel_id", "")
+        guild_id = self.options.get("guild_id") or "@me"
+
+        for message in raw.body:
+            content = message.get("content") or ""
+            if not content:
+                continue
+            author = (message.get("author") or {}).get("username", "unknown")
+            url = f"https://discord.com/channels/{guild_id}/{channel_id}/{message['id']}"
+
+            for item_data in self.scraper.extract_items_from_text(content):
+                yield MarketItem(
+                    name=item_data['name'],
+                    category=self.scraper.categorize_item(item_data['name']),
+                    price=item_data.get('price', 0.0),
+                    quality=item_data.get('quality'),
+                    enchantments=item_data.get('enchantments'),
+                    rarity=item_data.get('rarity'),
+                    server=item_data.get('server', 'unknown'),
+                    seller=author,
+                    timestamp=message.get("timestamp", raw.fetched_at),
+                    source="discord",
+                    url=url,
+                    description=content[:200],
+                    contact=f"Discord: {author}",
+                    status="active"
+                )
+
+
+def fixture_transport(path: str) -> Transport:
+    """Transport que responde a partir de um JSON gravado {channel_id: [mensagens]}
+
+    Emula a semântica de after/before/limit da API para testes offline
+    (benchmarks/fixtures/discord_channel.json, usado em run_benchmarks.py).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        channels = json.load(f)
+
+    def transport(channel_id: str, params: Dict) -> List[Dict]:
+        messages = sorted(channels.get(channel_id, []), key=lambda m: int(m["id"]))
+        limit = int(params.get("limit", PAGE_LIMIT))
+        if "after" in params:
+            after = int(params["after"])
+            selected = [m for m in messages if int(m["id"]) > after][:limit]
+        else:
+            if "before" in params:
+                before = int(params["before"])
+                messages = [m for m in messages if int(m["id"]) < before]
+            selected = messages[-limit:]
+        return list(reversed(selected))  # A API devolve da mais nova para a mais antiga
+
+    return transport
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Forum source adapter
+Lê as listas de tópicos das seções de comércio do fórum oficial
+"""
+
+import logging
+from typing import Iterator, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from models import MarketItem
+from sources.base import RawPage, SourceAdapter, register_adapter
+
+logger = logging.getLogger(__name__)
+
+
+@register_adapter("forum")
+class ForumAdapter(SourceAdapter):
+    """Extrai itens dos títulos dos tópicos nas seções do fórum"""
+
+    # A listagem da seção não é snapshot: tópicos saem da página pela paginação, não por venda
+    snapshot_diff = False
+
+    def section_urls(self):
+        sections = self.config.get("forum_sections", {})
+        names = self.options.get("sections", ["selling"])
+        base = self.config["forum_base_url"]
+        for name in names:
+            path = sections.get(name, "/index.php?/forum/9-selling/" if name == "selling" else None)
+            if path:
+                yield f"{base}{path}"
+
+    def work_seeds(self) -> List[Tuple[str, str]]:
+        return [(url, "forum_listing") for url in self.section_urls()]
+
+    def fetch(self) -> Iterator[RawPage]:
+        # Espaçamento entre requisições fica por conta do controlador HTTP
+        for url, response, error in self.get_many(list(self.section_urls())):
+            if error:
+                logger.error(f"Error scraping forum section {url}: {error}")
+                continue
+            yield RawPage(url=url, kind="forum_listing", body=response.content)
+
+    def parse(self, raw: RawPage) -> Iterator[MarketItem]:
+        soup = BeautifulSoup(raw.body, 'html.parser')
+        limit = self.options.get("posts_per_page", 10)
+        posts = soup.find_all('div', class_='ipsDataItem')[:limit]
+
+        for post in posts:
+            title_elem = post.find('a')
+            if not title_elem or not self.scraper.is_trading_post(title_elem.text):
+                continue
+            # Extração básica só do título
+            for item_data in self.scraper.extract_items_from_text(title_elem.text):
+                yield MarketItem(
+                    name=item_data['name'],
+                    category=self.scraper.categorize_item(item_data['name']),
+                    price=item_data.get('price', 0.0),
+                    quality=item_data.get('quality'),
+                    enchantments=item_data.get('enchantments'),
+                    rarity=item_data.get('rarity'),
+                    server=item_data.get('server', 'unknown'),
+                    seller='forum_user',
+                    timestamp=raw.fetched_at,
+                    source="forum",
+                    url=raw.url,
+                    status="active"
+                )
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Steam Community source adapter
+Segue tópicos de comércio das discussões do Steam e extrai os posts
+"""
+
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from models import MarketItem
+from http_controller import CircuitOpenError
+from sources.base import RawPage, SourceAdapter, load_checkpoints, register_adapter
+from sources.topics import TopicReader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEAM_URLS = [
+    "https://steamcommunity.com/app/1179680/discussions/",  # Wurm Online
+    "https://steamcommunity.com/app/366220/discussions/"   # Wurm Unlimited
+]
+
+
+@register_adapter("steam")
+class SteamAdapter(SourceAdapter):
+    """Lê a lista de discussões e cada tópico de trading"""
+
+    # Cada página de tópico relida inteira é um snapshot: o que sumiu dela foi vendido ou retirado
+    snapshot_diff = True
+
+    def __init__(self, scraper, options=None):
+        super().__init__(scraper, options)
+        self.reader = TopicReader(
+            self,
+            post_classes=self.options.get("post_classes", ["forum_post_content"]),
+            next_classes=self.options.get("next_classes", []),
+            max_pages=self.options.get("max_topic_pages", 500),
+            kind="steam_topic"
+        )
+        # Onde cada tópico parou na execução anterior (página e último post lido)
+        self.topic_positions = load_checkpoints(scraper.db_connection, self.name, "topic:")
+
+    def listing_urls(self) -> List[str]:
+        return self.options.get("urls") or self.config.get("steam_urls") or DEFAULT_STEAM_URLS
+
+    def topic_links(self, listing_html: bytes) -> List[str]:
+        """Links dos tópicos que parecem ser de trading"""
+        soup = BeautifulSoup(listing_html, 'html.parser')
+        links = []
+        for topic in soup.find_all('div', class_='forum_topic'):
+            title_elem = topic.find('a', class_='forum_topic_title')
+            if title_elem and title_elem.get('href') and self.scraper.is_trading_post(title_elem.get_text()):
+                links.append(title_elem.get('href'))
+        return links
+
+    def fetch(self) -> Iterator[RawPage]:
+        for url in self.listing_urls():
+            logger.info(f"Scraping Steam Community: {url}")
+            try:
+                listing = self.get(url)
+            except CircuitOpenError as e:
+                logger.warning(str(e))
+                return
+            except Exception as e:
+                logger.error(f"Error scraping Steam Community {url}: {e}")
+                continue
+
+            links = self.topic_links(listing.content)
+            # Tópicos novos: 1ª página em paralelo, limitada pelo controlador HTTP do host
+            fresh = [topic_url for topic_url in links if topic_url not in self.topic_positions]
+            for topic_url, response, error in self.get_many(fresh):
+                if error:
+                    logger.error(f"Error processing Steam topic {topic_url}: {error}")
+                    continue
+                yield from self.topic_pages(topic_url, response.content)
+            # Tópicos já vistos recomeçam da página e do post onde pararam
+            for topic_url in links:
+                if topic_url in self.topic_positions:
+                    yield from self.topic_pages(topic_url)
+
+    def topic_pages(self, topic_url: str, first: Optional[bytes] = None) -> Iterator[RawPage]:
+        """Páginas do tópico, buscadas só quando a anterior já foi processada"""
+        try:
+            yield from self.reader.pages(topic_url, self.topic_positions, first)
+        except Exception as e:
+            logger.error(f"Error following Steam topic {topic_url}: {e}")
+
+    def topic_items(self, topic_url: str) -> Iterator[MarketItem]:
+        """Itens de todas as páginas de um tópico, do início"""
+        for raw in self.reader.pages(topic_url):
+            yield from self.parse(raw)
+
+    def work_seeds(self) -> List[Tuple[str, str]]:
+        return [(url, "steam_listing") for url in self.listing_urls()]
+
+    def process(self, url: str, kind: str) -> Tuple[Optional[RawPage], List[Tuple[str, str]]]:
+        if kind == "steam_topic":
+            # Cada página é um trabalho; a seguinte entra na fila
+            raw, _ = super().process(url, kind)
+            for _ in self.reader.read(raw):
+                pass
+            next_url = raw.meta.pop("next_url")
+            return raw, [(next_url, "steam_topic")] if next_url else []
+        if kind != "steam_listing":
+            return super().process(url, kind)
+        # Listagem não tem itens: vira um trabalho por tópico de trading
+        response = self.get(url)
+        response.raise_for_status()
+        return None, [(topic_url, "steam_topic") for topic_url in self.topic_links(response.content)]
+
+    def parse(self, raw: RawPage) -> Iterator[MarketItem]:
+        # Posts em streaming; a página nunca vira árvore
+        skip = raw.meta.get("skip", 0)
+        if not skip:
+            for post in self.reader.read(raw):
+                yield from self.post_items(raw, post)
+            return
+        # Página retomada: relida inteira para o diff; os posts já lidos só vão para o snapshot
+        resumed = raw.meta["resumed_items"] = []
+        for post in self.reader.read(raw, include_skipped=True):
+            if post.ordinal <= skip:
+                resumed.extend(self.post_items(raw, post))
+            else:
+                yield from self.post_items(raw, post)
+
+    def post_items(self, raw: RawPage, post) -> Iterator[MarketItem]:
+        for item_data in self.scraper.extract_items_from_text(post.text):
+            yield MarketItem(
+                name=item_data['name'],
+                category=self.scraper.categorize_item(item_data['name']),
+                price=item_data.get('price', 0.0),
+                quality=item_data.get('quality'),
+                enchantments=item_data.get('enchantments'),
+                rarity=item_data.get('rarity'),
+                server=item_data.get('server', 'unknown'),
+                seller="steam_user",
+                timestamp=raw.fetched_at,
+                source="steam",
+                url=raw.url,
+                status="active"
+            )
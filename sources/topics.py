@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Streaming topic reader
+Lê tópicos de várias páginas post a post com um parser de eventos (sem árvore), seguindo a paginação
+"""
+
+import codecs
+import json
+import logging
+from collections import deque
+from html.parser import HTMLParser
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urljoin
+
+from sources.base import RawPage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16384
+RECENT_PAGES = 16
+# Conteúdo que nunca é texto de post
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class Post(NamedTuple):
+    page_url: str
+    page: int
+    ordinal: int  # Posição do post na página, a partir de 1
+    text: str
+
+
+class PostParser(HTMLParser):
+    """Parser de eventos: junta o texto de cada post e guarda o link da próxima página
+
+    Um post é o elemento cuja classe está em post_classes; o texto dele é
+    montado enquanto o elemento está aberto e descartado assim que o post
+    é entregue, então a memória não depende do tamanho da página.
+    """
+
+    def __init__(self, base_url: str, post_classes: Sequence[str], next_classes: Sequence[str] = ()):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.post_classes = set(post_classes)
+        self.next_classes = set(next_classes)
+        self.posts: deque = deque()
+        self.next_url: Optional[str] = None
+        self._post_tag: Optional[str] = None
+        self._post_depth = 0
+        self._skip_depth = 0
+        self._next_tag: Optional[str] = None
+        self._next_depth = 0
+        self._text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        self.check_next(tag, attrs, classes)
+        if tag in VOID_TAGS:
+            return
+        if self._post_tag is None:
+            if classes & self.post_classes:
+                self._post_tag, self._post_depth = tag, 1
+            return
+        if tag == self._post_tag:
+            self._post_depth += 1
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        attrs = dict(attrs)
+        self.check_next(tag, attrs, set((attrs.get("class") or "").split()))
+
+    def check_next(self, tag, attrs, classes):
+        """rel="next" (a ou link), um <a> com classe de próxima página ou um <a> dentro de um elemento com ela"""
+        if self.next_url is not None:
+            return
+        href = attrs.get("href")
+        if tag in ("a", "link") and href and "next" in (attrs.get("rel") or "").split():
+            self.next_url = urljoin(self.base_url, href)
+        elif tag == "a" and href and (classes & self.next_classes or self._next_tag is not None):
+            self.next_url = urljoin(self.base_url, href)
+        elif self._next_tag is None and classes & self.next_classes and tag not in VOID_TAGS:
+            self._next_tag, self._next_depth = tag, 1
+        elif tag == self._next_tag:
+            self._next_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == self._next_tag:
+            self._next_depth -= 1
+            if not self._next_depth:
+                self._next_tag = None
+        if self._post_tag is None:
+            return
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        if tag == self._post_tag:
+            self._post_depth -= 1
+            if not self._post_depth:
+                # Mesmo formato de get_text(separator=' ', strip=True)
+                self.posts.append(" ".join(self._text))
+                self._post_tag, self._text, self._skip_depth = None, [], 0
+
+    def handle_data(self, data):
+        if self._post_tag is not None and not self._skip_depth:
+            data = data.strip()
+            if data:
+                self._text.append(data)
+
+
+class TopicReader:
+    """Segue a paginação de um tópico sob demanda, uma página de cada vez
+
+    pages() só busca a próxima página quando a anterior foi consumida, e
+    read() entrega os posts conforme o HTML é alimentado ao parser; nada
+    do tópico fica em memória além da página atual. A posição (página e
+    último post lido) vira checkpoint "topic:<url>" do adaptador, e a
+    próxima execução recomeça dela, pulando os posts já processados.
+    """
+
+    def __init__(self, adapter, post_classes: Sequence[str], next_classes: Sequence[str] = (),
+                 max_pages: int = 0, kind: str = "topic"):
+        self.adapter = adapter
+        self.post_classes = post_classes
+        self.next_classes = next_classes
+        self.max_pages = max_pages
+        self.kind = kind
+
+    def parser(self, page_url: str) -> PostParser:
+        return PostParser(page_url, self.post_classes, self.next_classes)
+
+    def resume_point(self, topic_url: str, positions: dict) -> Tuple[str, int, int]:
+        """(url da página, número da página, posts já lidos nela) salvo para o tópico"""
+        saved = positions.get(topic_url)
+        if saved:
+            try:
+                position = json.loads(saved)
+                return position["url"], int(position["page"]), int(position["post"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Ignoring invalid checkpoint for topic {topic_url}: {saved!r}")
+        return topic_url, 1, 0
+
+    def pages(self, topic_url: str, positions: Optional[dict] = None,
+              first: Optional[bytes] = None) -> Iterator[RawPage]:
+        """Páginas do tópico a partir do ponto salvo; `first` reaproveita a 1ª página já baixada"""
+        page_url, page, skip = self.resume_point(topic_url, positions or {})
+        # Detecta "próxima" apontando para trás só nas últimas páginas (memória constante); max_pages limita o resto
+        recent = deque(maxlen=RECENT_PAGES)
+        while page_url and page_url not in recent and (not self.max_pages or page <= self.max_pages):
+            recent.append(page_url)
+            if first is not None and page_url == topic_url:
+                body, first = first, None
+            else:
+                response = self.adapter.get(page_url)
+                response.raise_for_status()
+                body = response.content
+            raw = RawPage(url=page_url, kind=self.kind, body=body,
+                          meta={"topic": topic_url, "page": page, "skip": skip})
+            yield raw
+            if "next_url" not in raw.meta:
+                # Ninguém leu a página (parse falhou ou foi pulado): só o link da próxima
+                for _ in self.read(raw):
+                    pass
+            page_url, page, skip = raw.meta["next_url"], page + 1, 0
+
+    def read(self, raw: RawPage, include_skipped: bool = False) -> Iterator[Post]:
+        """Posts da página em streaming, pulando os `skip` primeiros; grava o checkpoint no fim
+
+        include_skipped entrega também os já lidos (ordinal <= skip), para quem
+        precisa da página inteira, como o diff de snapshot.
+        """
+        parser = self.parser(raw.url)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        body = raw.body if isinstance(raw.body, bytes) else raw.body.encode("utf-8")
+        skip = raw.meta.get("skip", 0)
+        page = raw.meta.get("page", 1)
+        ordinal = 0
+        for start in range(0, len(body) + CHUNK_SIZE, CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            final = start + CHUNK_SIZE >= len(body)
+            parser.feed(decoder.decode(chunk, final=final))
+            if final:
+                parser.close()
+            while parser.posts:
+                ordinal += 1
+                text = parser.posts.popleft()
+                if ordinal > skip or include_skipped:
+                    yield Post(raw.url, page, ordinal, text)
+            if final:
+                break
+        raw.meta["next_url"] = parser.next_url
+        topic = raw.meta.get("topic")
+        if topic:
+            self.adapter.set_checkpoint(f"topic:{topic}", json.dumps(
+                {"url": raw.url, "page": page, "post": ordinal}))
+
+    def posts(self, topic_url: str, positions: Optional[dict] = None) -> Iterator[Post]:
+        """Todos os posts do tópico, página por página"""
+        for raw in self.pages(topic_url, positions):
+            yield from self.read(raw)
+
+
+def first_post_text(body: bytes, page_url: str, post_classes: Sequence[str]) -> Optional[str]:
+    """Texto do primeiro post da página; o parse para assim que ele fecha"""
+    reader = TopicReader(None, post_classes)
+    for post in reader.read(RawPage(url=page_url, kind="post", body=body)):
+        return post.text
+    return None
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Static assets for Wurm Online Market Tracker
+Build do frontend: separa CSS/JS do HTML, nomes com hash do conteúdo, versões .br/.gz pré-comprimidas
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # .br opcional; sem ele só .gz
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Caminhos relativos do config são do diretório do projeto, não do diretório de trabalho
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_STATIC_CONFIG = {
+    "page": "market_tracker.html",   # Página servida em /
+    "source_dir": "assets",          # Único diretório de onde saem arquivos extras (imagens, fontes...)
+    "build_dir": "static_build",
+    "compress_min_bytes": 256,
+    "max_age": 31536000,             # Assets com hash: um ano, immutable
+    "x_sendfile": False,             # Deixa o envio do arquivo para o servidor na frente (X-Sendfile)
+}
+
+ASSET_URL_PREFIX = "/assets/"
+MANIFEST = "manifest.json"
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".txt", ".map")
+# Extensões pré-comprimidas, na ordem de preferência
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+INLINE_STYLE_RE = re.compile(r"<style>(.*?)</style>", re.DOTALL)
+INLINE_SCRIPT_RE = re.compile(r"<script>(.*?)</script>", re.DOTALL)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def precompress(data: bytes) -> Dict[str, bytes]:
+    """Versões comprimidas no nível máximo (feito uma vez no build, não por requisição)"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def resolve(path: str) -> str:
+    return os.path.join(BASE_DIR, path) if path and not os.path.isabs(path) else path
+
+
+def write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetPipeline:
+    """Gera build_dir a partir da página e de source_dir
+
+    O CSS e o JS inline da página viram app.<hash>.css/js; arquivos de
+    source_dir ganham o hash no nome e as referências "assets/<nome>" do
+    HTML são reescritas. manifest.json lista o que pode ser servido: nada
+    fora dele sai pela API. Um build com as mesmas fontes não reescreve nada.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = dict(DEFAULT_STATIC_CONFIG, **(config or {}))
+        for key in ("page", "source_dir", "build_dir"):
+            self.config[key] = resolve(self.config[key])
+        self.build_dir = self.config["build_dir"]
+
+    def sources(self) -> List[Tuple[str, str]]:
+        """(nome lógico, caminho) de cada arquivo de source_dir, sem subdiretórios nem ocultos"""
+        source_dir = self.config["source_dir"]
+        if not source_dir or not os.path.isdir(source_dir):
+            return []
+        return [(name, os.path.join(source_dir, name)) for name in sorted(os.listdir(source_dir))
+                if not name.startswith(".") and os.path.isfile(os.path.join(source_dir, name))]
+
+    def source_digest(self) -> str:
+        digest = hashlib.sha256()
+        for name, path in [("", self.config["page"])] + self.sources():
+            with open(path, "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read() + b"\0")
+        digest.update(str(self.config["compress_min_bytes"]).encode())
+        digest.update(b"br" if brotli is not None else b"")
+        return digest.hexdigest()
+
+    def read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, manifest: Optional[Dict], digest: str) -> bool:
+        return bool(manifest) and manifest.get("source_digest") == digest and all(
+            os.path.exists(os.path.join(self.build_dir, entry["file"])) for entry in manifest["files"].values())
+
+    def build(self, force: bool = False) -> Dict:
+        """Gera (se as fontes mudaram) e retorna o manifesto"""
+        digest = self.source_digest()
+        previous = self.read_manifest()
+        if not force and self.is_current(previous, digest):
+            return previous
+        os.makedirs(self.build_dir, exist_ok=True)
+
+        outputs: Dict[str, bytes] = {}
+        for name, path in self.sources():
+            with open(path, "rb") as f:
+                outputs[name] = f.read()
+        with open(self.config["page"], encoding="utf-8") as f:
+            html = f.read()
+
+        # CSS/JS inline viram arquivos próprios: o HTML revalida barato, o resto fica em cache
+        style = INLINE_STYLE_RE.search(html)
+        if style:
+            outputs["app.css"] = style.group(1).strip().encode("utf-8") + b"\n"
+            html = html[:style.start()] + '<link rel="stylesheet" href="assets/app.css">' + html[style.end():]
+        script = INLINE_SCRIPT_RE.search(html)
+        if script:
+            outputs["app.js"] = script.group(1).strip().encode("utf-8") + b"\n"
+            html = html[:script.start()] + '<script src="assets/app.js"></script>' + html[script.end():]
+
+        files = {name: hashed_name(name, data) for name, data in outputs.items()}
+        for name, target in sorted(files.items(), key=lambda item: len(item[0]), reverse=True):
+            html = re.sub(r'(["\'])/?assets/' + re.escape(name) + r'\1', rf'\g<1>{ASSET_URL_PREFIX}{target}\g<1>', html)
+        outputs["index.html"] = html.encode("utf-8")
+        files["index.html"] = hashed_name("index.html", outputs["index.html"])
+
+        manifest = {"source_digest": digest, "files": {}}
+        for name, data in outputs.items():
+            target = files[name]
+            encodings = []
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and len(data) >= self.config["compress_min_bytes"]:
+                for encoding, body in precompress(data).items():
+                    write_atomic(os.path.join(self.build_dir, target + dict(ENCODINGS)[encoding]), body)
+                    encodings.append(encoding)
+            write_atomic(os.path.join(self.build_dir, target), data)
+            manifest["files"][name] = {"file": target, "size": len(data), "encodings": encodings}
+        write_atomic(os.path.join(self.build_dir, MANIFEST),
+                     json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        self.prune(manifest, previous)
+        logger.info(f"Static assets built in {self.build_dir}: {len(outputs)} files")
+        return manifest
+
+    def prune(self, manifest: Dict, previous: Optional[Dict]):
+        """Apaga saídas antigas, mantendo o build anterior (páginas já abertas ainda pedem os assets dele)"""
+        keep = {MANIFEST}
+        for build in (manifest, previous or {"files": {}}):
+            for entry in build["files"].values():
+                keep.add(entry["file"])
+                keep.update(entry["file"] + ext for _, ext in ENCODINGS)
+        for name in os.listdir(self.build_dir):
+            if name not in keep:
+                os.remove(os.path.join(self.build_dir, name))
+
+
+class StaticAssets:
+    """Resolve requisições do frontend para arquivos do build, só pelo manifesto
+
+    Nomes vindos da URL nunca viram caminho: só os nomes com hash do
+    manifesto são servidos. Os arquivos saem por send_file (sendfile/
+    wsgi.file_wrapper, ou X-Sendfile com x_sendfile), já comprimidos.
+
+    O manifesto é carregado na primeira requisição (o build de
+    `main.py assets` é reaproveitado; só se as fontes mudaram ele é
+    refeito). Se o build falhar, o erro vai para o log e / serve a página
+    original, sem derrubar a API.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.pipeline = AssetPipeline(config)
+        self.config = self.pipeline.config
+        self.root = os.path.abspath(self.pipeline.build_dir)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.index: Optional[Dict] = None
+        self.assets: Dict[str, Dict] = {}
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                manifest = self.pipeline.build()
+            except OSError as e:
+                manifest = self.pipeline.read_manifest()
+                logger.error(f"Static asset build failed ({e}); "
+                             f"{'using the previous build' if manifest else 'serving the raw page'}")
+            if manifest:
+                self.index = manifest["files"]["index.html"]
+                self.assets = {entry["file"]: entry for name, entry in manifest["files"].items()
+                               if name != "index.html"}
+
+    def send(self, entry: Dict, accepted, cache_control: str):
+        from flask import send_file
+
+        filename, encoding = entry["file"], None
+        for candidate, ext in ENCODINGS:
+            if candidate in entry["encodings"] and accepted[candidate]:
+                filename, encoding = entry["file"] + ext, candidate
+                break
+        mimetype = mimetypes.guess_type(entry["file"])[0] or "application/octet-stream"
+        # ETag forte pelo nome com hash (+ codificação): 304 na revalidação, sem ler o arquivo
+        response = send_file(os.path.join(self.root, filename), mimetype=mimetype,
+                             etag=f"{os.path.splitext(entry['file'])[0]}-{encoding or 'identity'}",
+                             conditional=True, max_age=None)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if entry["encodings"]:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+    def page(self, accepted):
+        """index.html: sempre revalidado (é ele que aponta para os nomes com hash); None se não há página"""
+        self.load()
+        if self.index is not None:
+            return self.send(self.index, accepted, "no-cache")
+        if not os.path.isfile(self.config["page"]):
+            return None
+        from flask import send_file
+
+        response = send_file(self.config["page"], mimetype="text/html", conditional=True, max_age=None)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def asset(self, name: str, accepted):
+        self.load()
+        entry = self.assets.get(name)
+        if entry is None:
+            return None
+        return self.send(entry, accepted, f"public, max-age={self.config['max_age']}, immutable")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Storage layer for Wurm Online Market Tracker
+Caminho único de upsert de market_items, usado pelo scraper, pela API e pela ingestão em lote
+"""
+
+import hashlib
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from attributes import write_attributes
+from expiry import EPOCH_NOW_SQL
+from models import MarketItem
+
+logger = logging.getLogger(__name__)
+
+# Chamados com (conexão, itens) depois de cada lote gravado (e commitado), por nome
+IngestListener = Callable[[sqlite3.Connection, List[MarketItem]], None]
+ingest_listeners: Dict[str, IngestListener] = {}
+
+# Chamados com (conexão, listing_keys) quando anúncios ativos saem do conjunto ativo (expiração, diff)
+RetireListener = Callable[[sqlite3.Connection, List[int]], None]
+retire_listeners: Dict[str, RetireListener] = {}
+
+ITEM_COLUMNS = (
+    "name", "category", "price", "cost", "quality", "enchantments",
+    "server", "seller", "location", "quantity", "timestamp", "source",
+    "url", "description", "contact", "status",
+)
+
+# O índice único parcial só cobre anúncios ativos: vendidos/expirados podem repetir a chave
+UPSERT_SQL = f'''
+    INSERT INTO market_items ({", ".join(ITEM_COLUMNS)}, listing_key, updated_epoch)
+    VALUES ({", ".join("?" * len(ITEM_COLUMNS))}, ?, {EPOCH_NOW_SQL})
+    ON CONFLICT(listing_key) WHERE status = 'active' DO UPDATE SET
+        price = excluded.price,
+        quality = excluded.quality,
+        enchantments = COALESCE(excluded.enchantments, enchantments),
+        quantity = excluded.quantity,
+        updated_at = CURRENT_TIMESTAMP,
+        updated_epoch = excluded.updated_epoch
+'''
+
+
+def listing_key(name: Optional[str], seller: Optional[str], url: Optional[str]) -> int:
+    """Identidade do anúncio (name, seller, url) como int64 (blake2b de 8 bytes)"""
+    raw = f"{name or ''}\x1f{seller or ''}\x1f{url or ''}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'big', signed=True)
+
+
+def ensure_listing_key_schema(conn: sqlite3.Connection):
+    """Adiciona e preenche listing_key e cria o índice único parcial dos ativos"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(market_items)")}
+    if "listing_key" not in columns:
+        conn.execute("ALTER TABLE market_items ADD COLUMN listing_key INTEGER")
+
+    if conn.execute("SELECT 1 FROM market_items WHERE listing_key IS NULL LIMIT 1").fetchone():
+        conn.create_function("listing_key", 3, listing_key, deterministic=True)
+        conn.execute("UPDATE market_items SET listing_key = listing_key(name, seller, url) WHERE listing_key IS NULL")
+        # Duplicatas ativas de versões antigas: fica a mais recente
+        conn.execute('''
+            UPDATE market_items SET status = 'expired'
+            WHERE status = 'active' AND id NOT IN (
+                SELECT MAX(id) FROM market_items WHERE status = 'active' GROUP BY listing_key
+            )
+        ''')
+
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_items_listing_active
+        ON market_items(listing_key) WHERE status = 'active'
+    ''')
+    conn.commit()
+
+
+def item_row(item: MarketItem) -> tuple:
+    """Parâmetros de UPSERT_SQL para um item"""
+    return (
+        item.name, item.category, item.price, item.cost, item.quality, item.enchantments,
+        item.server, item.seller, item.location, item.quantity, item.timestamp or datetime.now().isoformat(),
+        item.source, item.url, item.description, item.contact, item.status,
+        listing_key(item.name, item.seller, item.url),
+    )
+
+
+def upsert_items(conn: sqlite3.Connection, items: Iterable[MarketItem]) -> Tuple[int, int]:
+    """Insere ou atualiza itens na transação corrente; retorna (inseridos, atualizados)
+
+    Não faz commit. Inserções são contadas pelos ids novos (o AUTOINCREMENT
+    só cresce), então o resto das linhas afetadas foram atualizações.
+    Os atributos tipados (item_attributes) são regravados no mesmo lote.
+    """
+    items = list(items)
+    rows = [item_row(item) for item in items]
+    if not rows:
+        return 0, 0
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM market_items").fetchone()[0]
+    conn.executemany(UPSERT_SQL, rows)
+    write_attributes(conn, ((row[-1], item) for row, item in zip(rows, items)))
+    inserted = conn.execute("SELECT COUNT(*) FROM market_items WHERE id > ?", (last_id,)).fetchone()[0]
+    return inserted, len(rows) - inserted
+
+
+def notify_ingest(conn: sqlite3.Connection, items: List[MarketItem]):
+    """Avisa os listeners (erros de um listener não afetam a gravação)"""
+    for name, listener in list(ingest_listeners.items()):
+        try:
+            listener(conn, items)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Ingest listener {name} failed: {e}")
+
+
+def add_ingest_listener(name: str, listener: IngestListener):
+    """Registra (ou substitui) o listener com este nome"""
+    ingest_listeners[name] = listener
+
+
+def remove_ingest_listener(name: str):
+    ingest_listeners.pop(name, None)
+
+
+def notify_retire(conn: sqlite3.Connection, keys: List[int]):
+    """Avisa os listeners de que estes anúncios deixaram de estar ativos (já commitado)"""
+    if not keys:
+        return
+    for name, listener in list(retire_listeners.items()):
+        try:
+            listener(conn, keys)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Retire listener {name} failed: {e}")
+
+
+def add_retire_listener(name: str, listener: RetireListener):
+    """Registra (ou substitui) o listener de retirada com este nome"""
+    retire_listeners[name] = listener
+
+
+def remove_retire_listener(name: str):
+    retire_listeners.pop(name, None)
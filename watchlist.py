@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Watchlist for Wurm Online Market Tracker
+Regras de alerta indexadas (índice invertido) e avaliadas na ingestão, com outbox e webhook
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from itertools import combinations
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from attributes import ENCHANT_ALIASES, parse_enchantments
+from models import MarketItem
+from storage import listing_key
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def ensure_watchlist_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS watch_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT,
+            tokens TEXT,
+            category TEXT,
+            server TEXT,
+            ql_min REAL,
+            ql_max REAL,
+            enchantment TEXT,
+            enchant_min INTEGER,
+            max_price REAL,
+            webhook_url TEXT,
+            enabled INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS watch_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER NOT NULL,
+            listing_key INTEGER NOT NULL,
+            item TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            UNIQUE (rule_id, listing_key)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON watch_outbox(delivered_at, id)")
+    # Versão das regras: outros processos recarregam o índice quando ela muda
+    conn.execute("CREATE TABLE IF NOT EXISTS watch_meta (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO watch_meta (key, value) VALUES ('rules_version', 0)")
+    conn.commit()
+
+
+@dataclass
+class WatchRule:
+    id: Optional[int] = None
+    owner: str = ""
+    tokens: str = ""
+    category: Optional[str] = None
+    server: Optional[str] = None
+    ql_min: Optional[float] = None
+    ql_max: Optional[float] = None
+    enchantment: Optional[str] = None
+    enchant_min: Optional[int] = None
+    max_price: Optional[float] = None
+    webhook_url: Optional[str] = None
+    enabled: bool = True
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WatchRule":
+        """Valida os campos vindos da API; levanta ValueError"""
+        def number(field, cast=float):
+            value = data.get(field)
+            if value in (None, ''):
+                return None
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be a number")
+
+        enchantment = (data.get('enchantment') or '').strip().lower() or None
+        if enchantment:
+            enchantment = ENCHANT_ALIASES.get(enchantment, enchantment)
+        rule = cls(
+            owner=str(data.get('owner') or ''),
+            tokens=" ".join(tokenize(data.get('tokens') or data.get('name') or '')),
+            category=data.get('category') or None,
+            server=data.get('server') or None,
+            ql_min=number('ql_min'),
+            ql_max=number('ql_max'),
+            enchantment=enchantment,
+            enchant_min=number('enchant_min', int),
+            max_price=number('max_price'),
+            webhook_url=data.get('webhook_url') or None,
+        )
+        if not any((rule.tokens, rule.category, rule.server, rule.enchantment)):
+            raise ValueError("rule needs at least one of tokens, category, server or enchantment")
+        return rule
+
+    def matches(self, item: MarketItem, item_tokens: Set[str], enchants: Optional[Dict[str, int]]) -> bool:
+        if self.category and item.category != self.category:
+            return False
+        if self.server and (item.server or "").lower() != self.server.lower():
+            return False
+        if self.max_price is not None and not (item.price and 0 < item.price <= self.max_price):
+            return False
+        if self.ql_min is not None or self.ql_max is not None:
+            if item.quality is None:
+                return False
+            if self.ql_min is not None and item.quality < self.ql_min:
+                return False
+            if self.ql_max is not None and item.quality > self.ql_max:
+                return False
+        if self.tokens and not set(self.tokens.split()) <= item_tokens:
+            return False
+        if self.enchantment:
+            if enchants is None:
+                enchants = parse_enchantments(item.enchantments, item.name, item.description)
+            if enchants.get(self.enchantment, -1) < (self.enchant_min or 0):
+                return False
+        return True
+
+
+class RuleIndex:
+    """Índice invertido de regras
+
+    Cada regra fica numa única lista, sob a chave mais seletiva que ela tem:
+    (par de tokens, servidor), (token, servidor), ou (categoria, servidor)
+    para regras sem tokens. Um item só consulta as chaves formadas pelos
+    seus próprios tokens (e pares deles), categoria e servidor, então o
+    custo por item depende do tamanho do nome e do número de acertos, não
+    do número de regras.
+    """
+
+    def __init__(self):
+        self.rules: Dict[int, WatchRule] = {}
+        self.postings: Dict[Tuple, List[int]] = defaultdict(list)
+        self._anchor: Dict[int, Tuple] = {}
+
+    def add(self, rule: WatchRule):
+        if not rule.enabled:
+            return
+        server = rule.server.lower() if rule.server else None
+        if rule.tokens:
+            tokens = sorted(set(rule.tokens.split()))
+            anchors = list(combinations(tokens, 2)) or [(tokens[0],)]
+            anchor = min(anchors, key=lambda a: (len(self.postings.get(("t", a, server), ())), -len("".join(a))))
+            key = ("t", anchor, server)
+        elif rule.category or server:
+            key = ("c", rule.category, server)
+        else:
+            key = ("e", rule.enchantment)
+        self.rules[rule.id] = rule
+        self.postings[key].append(rule.id)
+        self._anchor[rule.id] = key
+
+    def remove(self, rule_id: int):
+        key = self._anchor.pop(rule_id, None)
+        self.rules.pop(rule_id, None)
+        if key is not None:
+            self.postings[key].remove(rule_id)
+
+    def match(self, item: MarketItem) -> List[WatchRule]:
+        tokens = set(tokenize(item.name))
+        server = (item.server or "").lower()
+        ordered = sorted(tokens)
+        anchors = [(t,) for t in ordered] + list(combinations(ordered, 2))
+        keys = {("t", a, s) for a in anchors for s in (server, None)}
+        keys |= {("c", c, s) for c in (item.category, None) for s in (server, None)}
+        candidates = [rule_id for key in keys for rule_id in self.postings.get(key, ())]
+        enchants = None
+        if any(self.postings.get(("e", e)) for e in ENCHANT_ALIASES.values()):
+            enchants = parse_enchantments(item.enchantments, item.name, item.description)
+            candidates += [rule_id for e in enchants for rule_id in self.postings.get(("e", e), ())]
+
+        hits = []
+        for rule_id in candidates:
+            rule = self.rules[rule_id]
+            if rule.enchantment and enchants is None:
+                enchants = parse_enchantments(item.enchantments, item.name, item.description)
+            if rule.matches(item, tokens, enchants):
+                hits.append(rule)
+        return hits
+
+    def __len__(self):
+        return len(self.rules)
+
+
+RULE_COLUMNS = ("id", "owner", "tokens", "category", "server", "ql_min", "ql_max",
+                "enchantment", "enchant_min", "max_price", "webhook_url", "enabled")
+
+
+class WatchlistEngine:
+    """Listener de ingestão: casa itens novos com as regras e grava os alertas no outbox"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or {}
+        self.index = RuleIndex()
+        self.version = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn: sqlite3.Connection):
+        """Recarrega o índice se as regras mudaram (uma consulta por lote)"""
+        version = conn.execute("SELECT value FROM watch_meta WHERE key = 'rules_version'").fetchone()[0]
+        if version == self.version:
+            return
+        index = RuleIndex()
+        for row in conn.execute(f"SELECT {', '.join(RULE_COLUMNS)} FROM watch_rules WHERE enabled = 1"):
+            index.add(WatchRule(**dict(zip(RULE_COLUMNS, row))))
+        with self._lock:
+            self.index, self.version = index, version
+        logger.info(f"Watchlist index loaded with {len(index)} rules")
+
+    def observe(self, conn: sqlite3.Connection, items: Iterable[MarketItem]):
+        self.refresh(conn)
+        index = self.index
+        if not len(index):
+            return
+        alerts = []
+        for item in items:
+            if item.status != 'active':
+                continue
+            for rule in index.match(item):
+                alerts.append((rule.id, listing_key(item.name, item.seller, item.url),
+                               json.dumps(asdict(item), ensure_ascii=False)))
+        if alerts:
+            # Mesmo anúncio não gera dois alertas para a mesma regra
+            conn.executemany('''
+                INSERT OR IGNORE INTO watch_outbox (rule_id, listing_key, item) VALUES (?, ?, ?)
+            ''', alerts)
+            conn.commit()
+
+
+def bump_rules_version(conn: sqlite3.Connection):
+    conn.execute("UPDATE watch_meta SET value = value + 1 WHERE key = 'rules_version'")
+
+
+def add_rule(conn: sqlite3.Connection, rule: WatchRule) -> int:
+    fields = RULE_COLUMNS[1:]
+    cursor = conn.execute(
+        f"INSERT INTO watch_rules ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+        [getattr(rule, field) for field in fields]
+    )
+    bump_rules_version(conn)
+    conn.commit()
+    return cursor.lastrowid
+
+
+def delete_rule(conn: sqlite3.Connection, rule_id: int) -> bool:
+    deleted = conn.execute("DELETE FROM watch_rules WHERE id = ?", (rule_id,)).rowcount
+    bump_rules_version(conn)
+    conn.commit()
+    return bool(deleted)
+
+
+def list_rules(conn: sqlite3.Connection, owner: Optional[str] = None) -> List[Dict]:
+    query = f"SELECT {', '.join(RULE_COLUMNS)} FROM watch_rules"
+    params = []
+    if owner:
+        query += " WHERE owner = ?"
+        params.append(owner)
+    return [dict(zip(RULE_COLUMNS, row)) for row in conn.execute(query + " ORDER BY id", params)]
+
+
+def list_alerts(conn: sqlite3.Connection, rule_id: Optional[int] = None, since_id: int = 0,
+                limit: int = 100, pending_only: bool = False) -> List[Dict]:
+    query = "SELECT id, rule_id, item, created_at, delivered_at, attempts, last_error FROM watch_outbox WHERE id > ?"
+    params: list = [since_id]
+    if rule_id is not None:
+        query += " AND rule_id = ?"
+        params.append(rule_id)
+    if pending_only:
+        query += " AND delivered_at IS NULL"
+    query += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    alerts = []
+    for alert_id, rule, item, created_at, delivered_at, attempts, error in conn.execute(query, params):
+        alerts.append({"id": alert_id, "rule_id": rule, "item": json.loads(item), "created_at": created_at,
+                       "delivered_at": delivered_at, "attempts": attempts, "last_error": error})
+    return alerts
+
+
+def deliver_outbox(conn: sqlite3.Connection, session, limit: int = 200, max_attempts: int = 5,
+                   timeout: float = 5) -> Dict[str, int]:
+    """POST dos alertas pendentes para o webhook de cada regra
+
+    Alertas de regras sem webhook ficam no outbox para consulta em /api/alerts.
+    """
+    pending = conn.execute('''
+        SELECT o.id, o.rule_id, o.item, r.webhook_url FROM watch_outbox o
+        JOIN watch_rules r ON r.id = o.rule_id
+        WHERE o.delivered_at IS NULL AND o.attempts < ? AND r.webhook_url IS NOT NULL
+        ORDER BY o.id LIMIT ?
+    ''', (max_attempts, limit)).fetchall()
+    result = {"delivered": 0, "failed": 0}
+    for alert_id, rule_id, item, url in pending:
+        try:
+            response = session.post(url, json={"alert_id": alert_id, "rule_id": rule_id, "item": json.loads(item)},
+                                    timeout=timeout)
+            response.raise_for_status()
+            conn.execute("UPDATE watch_outbox SET delivered_at = CURRENT_TIMESTAMP, attempts = attempts + 1 "
+                         "WHERE id = ?", (alert_id,))
+            result["delivered"] += 1
+        except Exception as e:
+            conn.execute("UPDATE watch_outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                         (str(e)[:500], alert_id))
+            result["failed"] += 1
+        conn.commit()
+    return result
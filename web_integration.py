@@ -5,27 +5,248 @@ Web Integration Script for Wurm Online Market Tracker
 Conecta o scraper com a aplicação web HTML
 """
 
+import gzip
 import json
+import logging
 import sqlite3
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
+from serialization import dumps, encode_compact, encode_records, row_encoder
+from archival import open_history
+from columnar import active_listings_table, encode_table
+from bulk_ingest import PARSERS, BulkIngester, iter_lines, validate_row
+from storage import add_ingest_listener, notify_ingest, upsert_items
+from attributes import attribute_filters, ensure_attribute_schema
+from facets import FACETS, FacetIndex
+from static_assets import StaticAssets
+from replica import ReplicaReader, acquire_publisher, release_publisher
+from arbitrage import ArbitrageEngine, ensure_arbitrage_schema, top_spreads
+from sketches import SketchEngine, ensure_sketch_schema, price_quantiles, top_items_by_median
+from watchlist import (WatchlistEngine, WatchRule, add_rule, delete_rule, deliver_outbox,
+                       ensure_watchlist_schema, list_alerts, list_rules)
+import metrics
+import profiling
 import threading
 import schedule
 import time
 import os
 from pathlib import Path
+from typing import Dict
+
+try:
+    import brotli  # Content-Encoding br opcional
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Colunas de market_items aceitas em fields= e sort=
+ITEM_COLUMNS = [
+    'id', 'name', 'category', 'price', 'cost', 'quality', 'enchantments', 'server', 'seller', 'location',
+    'quantity', 'timestamp', 'source', 'url', 'description', 'contact', 'status', 'created_at',
+    'updated_at', 'updated_epoch', 'listing_key'
+]
+
+SORT_ALIASES = {'updated_at': 'updated_epoch'}
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv', 'text/css',
+                          'application/javascript', 'text/javascript')
+
+def requested_fields():
+    """Colunas de ?fields=a,b,c (None = todas)"""
+    fields = request.args.get('fields', '')
+    return [field.strip() for field in fields.split(',') if field.strip()] or None
+
+def requested_values(name):
+    """Valores de um filtro multi-valor: ?server=a,b ou ?server=a&server=b ('all' = sem filtro)"""
+    values = [value.strip() for raw in request.args.getlist(name) for value in raw.split(',') if value.strip()]
+    return [value for value in values if value.lower() != 'all']
 
 class WurmMarketAPI:
-    def __init__(self, db_path="wurm_market.db"):
+    def __init__(self, db_path="wurm_market.db", archive_path="", metrics_enabled=True,
+                 profiling_enabled=False, profile_dir="profiles", slow_query_ms=None,
+                 slow_query_file="", ingest_batch_size=5000, ingest_max_errors=1000,
+                 arbitrage_config=None, watchlist_config=None, sketch_config=None,
+                 compression_min_bytes=1024, compression_level=6, brotli_quality=5, facet_config=None,
+                 static_config=None, replica_config=None):
         self.db_path = db_path
-        self.app = Flask(__name__)
+        self.replica_config = replica_config or {}
+        # Leituras pesadas vão para o snapshot mais novo da réplica, quando habilitada
+        self.replica = ReplicaReader(self.replica_config) if self.replica_config.get("enabled") else None
+        self.replica_publisher = None
+        self._replica_failing = False  # Loga a queda para o banco principal uma vez, não a cada requisição
+        self.facet_config = facet_config or {}
+        self._facet_index = None
+        self._facet_lock = threading.Lock()
+        self.compression_min_bytes = compression_min_bytes
+        self.compression_level = compression_level
+        self.brotli_quality = brotli_quality
+        self.arbitrage_config = arbitrage_config or {}
+        self.watchlist_config = watchlist_config or {}
+        self.sketch_config = sketch_config or {}
+        self.ingest_batch_size = ingest_batch_size
+        self.ingest_max_errors = ingest_max_errors
+        self.archive_path = archive_path
+        self.profiling_enabled = profiling_enabled
+        self.profile_dir = profile_dir
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_file = slow_query_file
+        # Sem a pasta static padrão do Flask: o frontend sai só do build de static_assets
+        self.app = Flask(__name__, static_folder=None)
         CORS(self.app)
+        self.static_assets = StaticAssets(static_config)
+        self.app.config['USE_X_SENDFILE'] = self.static_assets.config['x_sendfile']
+        metrics.configure(metrics_enabled)
+        self.setup_ingest_listeners()
+        self.setup_instrumentation()
+        self.setup_compression()
         self.setup_routes()
         
+    @classmethod
+    def from_config(cls, config: Dict) -> "WurmMarketAPI":
+        """API montada a partir do config.json, com as mesmas seções que o scraper usa"""
+        api_config = config.get("api", {})
+        profiling_config = config.get("profiling", {})
+        return cls(
+            db_path=config.get("database_path", "wurm_market.db"),
+            archive_path=config.get("archive", {}).get("database_path", ""),
+            metrics_enabled=config.get("metrics", {}).get("enabled", True),
+            profiling_enabled=profiling_config.get("api_enabled", False),
+            profile_dir=profiling_config.get("output_dir", "profiles"),
+            slow_query_ms=profiling_config.get("slow_query_ms"),
+            slow_query_file=profiling_config.get("slow_query_file", ""),
+            ingest_batch_size=api_config.get("ingest_batch_size", 5000),
+            ingest_max_errors=api_config.get("ingest_max_errors", 1000),
+            arbitrage_config=config.get("arbitrage"),
+            watchlist_config=config.get("watchlist"),
+            sketch_config=config.get("price_sketches"),
+            compression_min_bytes=api_config.get("compression_min_bytes", 1024),
+            compression_level=api_config.get("compression_level", 6),
+            brotli_quality=api_config.get("brotli_quality", 5),
+            facet_config=config.get("facets"),
+            static_config=config.get("static_assets"),
+            replica_config=config.get("replica"),
+        )
+        
+    def setup_ingest_listeners(self):
+        """Itens gravados pela API também alimentam arbitragem, sketches de preço e watchlist"""
+        conn = sqlite3.connect(self.db_path)
+        ensure_attribute_schema(conn)
+        ensure_arbitrage_schema(conn)
+        ensure_sketch_schema(conn)
+        ensure_watchlist_schema(conn)
+        conn.close()
+        if self.arbitrage_config.get("enabled", True):
+            add_ingest_listener("arbitrage", ArbitrageEngine(self.arbitrage_config).observe)
+        if self.sketch_config.get("enabled", True):
+            add_ingest_listener("price_sketches", SketchEngine(self.sketch_config).observe)
+        if self.watchlist_config.get("enabled", True):
+            add_ingest_listener("watchlist", WatchlistEngine(self.watchlist_config).observe)
+        if self.replica is not None:
+            # /api/add-item e /api/bulk-ingest também publicam gerações novas; scrapers
+            # abertos neste processo reutilizam este publicador
+            self.replica_publisher = acquire_publisher(self.db_path, self.replica_config)
+        
+    def setup_instrumentation(self):
+        """Histograma de latência por rota"""
+        
+        @self.app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+            
+            # Profile de uma requisição: ?_profile=cprofile|sample ou header X-Profile
+            mode = request.args.get('_profile') or request.headers.get('X-Profile')
+            if self.profiling_enabled and mode:
+                mode = mode if mode in profiling.PROFILE_MODES else 'cprofile'
+                g.profiler = profiling.Profiler(mode, current_thread_only=True)
+                g.profiler.start()
+                
+        @self.app.after_request
+        def stop_profiler(response):
+            profiler = g.pop('profiler', None)
+            if profiler is not None:
+                profiler.stop()
+                name = request.url_rule.rule if request.url_rule else request.path
+                path = profiling.profile_output_path(self.profile_dir, name, profiler.mode)
+                profiler.dump(path)
+                response.headers['X-Profile-Output'] = path
+            return response
+            
+        @self.app.after_request
+        def record_latency(response):
+            start = g.pop('request_start', None)
+            if start is not None and metrics.registry.enabled:
+                route = request.url_rule.rule if request.url_rule else 'unmatched'
+                metrics.HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    route=route, method=request.method, status=response.status_code
+                )
+            return response
+        
+    def setup_compression(self):
+        """Comprime respostas de texto/JSON com br (se brotli estiver instalado) ou gzip, conforme Accept-Encoding"""
+        
+        @self.app.after_request
+        def compress_response(response):
+            if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+                    or 'Content-Encoding' in response.headers
+                    or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+                return response
+            response.vary.add('Accept-Encoding')
+            accepted = request.accept_encodings
+            encoding = None
+            if brotli is not None and accepted['br']:
+                encoding = 'br'
+            elif accepted['gzip']:
+                encoding = 'gzip'
+            data = response.get_data()
+            if encoding is None or len(data) < self.compression_min_bytes:
+                return response
+            if encoding == 'br':
+                # Qualidade 11 (padrão do brotli) é lenta demais por requisição
+                data = brotli.compress(data, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(data, compresslevel=self.compression_level)
+            response.set_data(data)
+            response.headers['Content-Encoding'] = encoding
+            return response
+            
+    @staticmethod
+    def json_response(body: bytes, status: int = 200) -> Response:
+        """Resposta JSON a partir de bytes já codificados"""
+        return Response(body, status=status, mimetype='application/json')
+        
+    @property
+    def facet_index(self) -> FacetIndex:
+        """Índice de facetas, montado na primeira busca"""
+        with self._facet_lock:
+            if self._facet_index is None:
+                self._facet_index = FacetIndex(self.db_path, self.facet_config)
+        return self._facet_index
+        
     def get_db_connection(self):
         """Retorna conexão com o banco de dados"""
-        conn = sqlite3.connect(self.db_path)
+        conn = profiling.connect(self.db_path, self.slow_query_ms, self.slow_query_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+        
+    def get_read_connection(self):
+        """Conexão para consultas só de leitura: snapshot da réplica (immutable, mmap) ou o banco principal"""
+        conn = None
+        if self.replica is not None:
+            try:
+                conn = self.replica.connect(self.slow_query_ms, self.slow_query_file)
+            except sqlite3.Error as e:
+                if not self._replica_failing:
+                    logger.warning(f"Replica unavailable, reading from the primary database: {e}")
+                self._replica_failing = True
+            else:
+                if self._replica_failing:
+                    logger.info("Replica available again")
+                self._replica_failing = False
+        if conn is None:
+            return self.get_db_connection()
         conn.row_factory = sqlite3.Row
         return conn
         
@@ -34,19 +255,34 @@ class WurmMarketAPI:
         
         @self.app.route('/api/items', methods=['GET'])
         def get_items():
-            """Retorna lista de itens do mercado"""
-            conn = self.get_db_connection()
+            """Retorna lista de itens do mercado
+
+            fields=name,price,... projeta só essas colunas no SELECT;
+            format=compact responde {"columns": [...], "rows": [[...], ...]}
+            """
+            columns = requested_fields()
+            payload_format = request.args.get('format', 'objects')
+            sort_by = request.args.get('sort', 'updated_at')
+            order = request.args.get('order', 'DESC').upper()
+            
+            # Colunas, ordenação e direção vão interpoladas no SQL: só nomes conhecidos
+            unknown = [column for column in (columns or []) + [sort_by] if column not in ITEM_COLUMNS]
+            if unknown:
+                return jsonify({'error': f"unknown field(s): {', '.join(unknown)}", 'fields': ITEM_COLUMNS}), 400
+            if order not in ('ASC', 'DESC') or payload_format not in ('objects', 'compact'):
+                return jsonify({'error': 'order must be ASC or DESC, format objects or compact'}), 400
+            
+            conn = self.get_read_connection()
             
             # Parâmetros de filtro
             server = request.args.get('server', 'all')
             category = request.args.get('category', 'all')
             limit = int(request.args.get('limit', 100))
             search = request.args.get('search', '')
-            sort_by = request.args.get('sort', 'updated_at')
-            order = request.args.get('order', 'DESC')
             
             # Construir query
-            query = "SELECT * FROM market_items WHERE status = 'active'"
+            projection = ", ".join(columns or ITEM_COLUMNS)
+            query = f"SELECT {projection} FROM market_items WHERE status = 'active'"
             params = []
             
             if server != 'all':
@@ -61,19 +297,88 @@ class WurmMarketAPI:
                 query += " AND (name LIKE ? OR description LIKE ?)"
                 params.extend([f'%{search}%', f'%{search}%'])
                 
-            query += f" ORDER BY {sort_by} {order} LIMIT ?"
+            # Filtros por atributo (faixas em item_attributes): ql_min, ql_max, enchant, power_min, rarity, rarity_min
+            clauses, attribute_params = attribute_filters(
+                ql_min=request.args.get('ql_min', type=float),
+                ql_max=request.args.get('ql_max', type=float),
+                enchant=request.args.get('enchant'),
+                power_min=request.args.get('power_min', type=float),
+                rarity=request.args.get('rarity'),
+                rarity_min=request.args.get('rarity_min', type=int)
+            )
+            query += clauses
+            params.extend(attribute_params)
+                
+            # updated_at e updated_epoch são gravados juntos; o epoch tem índice (status, updated_epoch)
+            query += f" ORDER BY {SORT_ALIASES.get(sort_by, sort_by)} {order} LIMIT ?"
             params.append(limit)
             
-            cursor = conn.execute(query, params)
-            items = [dict(row) for row in cursor.fetchall()]
+            if columns is None and payload_format == 'objects':
+                # Linha completa: fragmentos em cache por (id, updated_epoch, status)
+                body = row_encoder.encode_rows(conn.execute(query, params).fetchall())
+            else:
+                conn.row_factory = None
+                rows = conn.execute(query, params).fetchall()
+                encode = encode_compact if payload_format == 'compact' else encode_records
+                body = encode(columns or ITEM_COLUMNS, rows)
             conn.close()
             
-            return jsonify(items)
+            return self.json_response(body)
+            
+        @self.app.route('/api/search', methods=['GET'])
+        def faceted_search():
+            """Página de resultados e contagens por servidor, categoria e faixa de preço numa chamada
+
+            Filtros: server, category, price_band (vários valores com vírgula), q (prefixos de palavras do nome);
+            sort=recent|price_asc|price_desc, limit, offset, fields e format como em /api/items
+            """
+            columns = requested_fields()
+            payload_format = request.args.get('format', 'objects')
+            sort = request.args.get('sort', 'recent')
+            unknown = [column for column in (columns or []) if column not in ITEM_COLUMNS]
+            if unknown:
+                return jsonify({'error': f"unknown field(s): {', '.join(unknown)}", 'fields': ITEM_COLUMNS}), 400
+            if sort not in ('recent', 'price_asc', 'price_desc') or payload_format not in ('objects', 'compact'):
+                return jsonify({'error': 'sort must be recent, price_asc or price_desc, format objects or compact'}), 400
+            limit = min(max(request.args.get('limit', 50, type=int), 0), 500)
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            
+            started = time.perf_counter()
+            result = self.facet_index.search(
+                {facet: requested_values(facet) for facet in FACETS},
+                text=request.args.get('q', ''), sort=sort, limit=limit, offset=offset
+            )
+            
+            # Linhas da página pelo id, na ordem do índice (anúncios que saíram desde o snapshot somem da página)
+            columns = columns or ITEM_COLUMNS
+            rows = []
+            if result['ids']:
+                conn = self.get_db_connection()
+                conn.row_factory = None
+                selected = columns if 'id' in columns else ['id'] + columns
+                by_id = {row[selected.index('id')]: row for row in conn.execute(
+                    # +status: sem estatísticas o planner trocaria a busca por id pelo índice de status
+                    f"SELECT {', '.join(selected)} FROM market_items "
+                    f"WHERE id IN ({', '.join('?' * len(result['ids']))}) AND +status = 'active'",
+                    result['ids']
+                )}
+                conn.close()
+                strip = 0 if 'id' in columns else 1
+                rows = [by_id[item_id][strip:] for item_id in result['ids'] if item_id in by_id]
+                
+            encode = encode_compact if payload_format == 'compact' else encode_records
+            body = b''.join([
+                b'{"total":', dumps(result['total']),
+                b',"facets":', dumps(result['facets']),
+                b',"took_ms":', dumps(round((time.perf_counter() - started) * 1000, 2)),
+                b',"items":', encode(columns, rows), b'}'
+            ])
+            return self.json_response(body)
             
         @self.app.route('/api/stats', methods=['GET'])
         def get_stats():
             """Retorna estatísticas do mercado"""
-            conn = self.get_db_connection()
+            conn = self.get_read_connection()
             
             # Total de itens ativos
             total_items = conn.execute(
@@ -94,6 +399,12 @@ class WurmMarketAPI:
                 GROUP BY category
             ''').fetchall()
             
+            # p10/p50/p90 e cercas de outlier dos sketches (leitura por chave, sem ordenar preços)
+            category_quantiles = price_quantiles(conn, "category")
+            server_quantiles = price_quantiles(conn, "server")
+            item_name = request.args.get('item')
+            item_quantiles = price_quantiles(conn, "item", item_name) if item_name else {}
+            
             # Itens em alta (últimas 24h)
             hot_items = conn.execute('''
                 SELECT COUNT(*) as count FROM market_items 
@@ -120,67 +431,152 @@ class WurmMarketAPI:
                 'hotItems': hot_items,
                 'totalTrades': total_trades,
                 'categories': {row['category']: row['count'] for row in categories},
-                'avgPrices': {row['category']: round(row['avg_price'], 2) for row in avg_prices}
+                'avgPrices': {row['category']: round(row['avg_price'], 2) for row in avg_prices},
+                'priceQuantiles': category_quantiles,
+                'serverQuantiles': server_quantiles,
+                'itemQuantiles': item_quantiles
             })
             
         @self.app.route('/api/recommendations', methods=['GET'])
         def get_recommendations():
             """Retorna recomendações de produção"""
-            conn = self.get_db_connection()
+            conn = self.get_read_connection()
             
-            # Itens com alta demanda e baixa oferta
-            recommendations = conn.execute('''
-                SELECT name, category, AVG(price) as avg_price, 
-                       COUNT(*) as frequency, MAX(updated_at) as last_seen
-                FROM market_items 
-                WHERE status = 'active' AND price > 0
-                GROUP BY name, category
-                HAVING frequency >= 2
-                ORDER BY avg_price DESC, frequency DESC
-                LIMIT 10
-            ''').fetchall()
+            # Itens de maior mediana pelos sketches (índice scope, outlier, p50); outliers só com ?include_outliers=1
+            recommendations = top_items_by_median(
+                conn, limit=10, min_count=2,
+                include_outliers=request.args.get('include_outliers') in ('1', 'true')
+            )
             
             conn.close()
             
             result = []
             for row in recommendations:
-                estimated_profit = max(5, row['avg_price'] * 0.3)  # Estimativa conservadora
+                estimated_profit = max(5, row['p50'] * 0.3)  # Estimativa conservadora
                 result.append({
                     'name': row['name'],
                     'category': row['category'],
-                    'avgPrice': round(row['avg_price'], 2),
-                    'frequency': row['frequency'],
+                    'avgPrice': round(row['p50'], 2),
+                    'p10': round(row['p10'], 2),
+                    'p50': round(row['p50'], 2),
+                    'p90': round(row['p90'], 2),
+                    'frequency': row['n'],
                     'estimatedProfit': f"{estimated_profit:.0f}-{estimated_profit*1.5:.0f} prata",
-                    'lastSeen': row['last_seen']
+                    'lastSeen': row['updated_at'],
+                    'outlier': bool(row['outlier'])
                 })
                 
             return jsonify(result)
             
+        @self.app.route('/api/arbitrage', methods=['GET'])
+        def get_arbitrage():
+            """Maiores spreads entre servidores (ranking materializado, O(k))"""
+            limit = int(request.args.get('limit', 20))
+            min_ratio = float(request.args.get('min_ratio', 0))
+            server = request.args.get('server') or None
+            
+            conn = self.get_read_connection()
+            rows = top_spreads(conn, limit, server, min_ratio)
+            conn.close()
+            
+            return jsonify(rows)
+            
+        @self.app.route('/api/watchlist', methods=['GET'])
+        def get_watchlist():
+            """Regras de alerta cadastradas (opcionalmente de um owner)"""
+            conn = self.get_db_connection()
+            rules = list_rules(conn, request.args.get('owner'))
+            conn.close()
+            return jsonify(rules)
+            
+        @self.app.route('/api/watchlist', methods=['POST'])
+        def create_watch_rule():
+            """Cadastra uma regra: tokens, category, server, ql_min, ql_max,
+            enchantment, enchant_min, max_price, webhook_url"""
+            try:
+                rule = WatchRule.from_dict(request.json or {})
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+                
+            conn = self.get_db_connection()
+            rule_id = add_rule(conn, rule)
+            conn.close()
+            return jsonify({'success': True, 'id': rule_id}), 201
+            
+        @self.app.route('/api/watchlist/<int:rule_id>', methods=['DELETE'])
+        def remove_watch_rule(rule_id):
+            conn = self.get_db_connection()
+            deleted = delete_rule(conn, rule_id)
+            conn.close()
+            if not deleted:
+                return jsonify({'error': 'Rule not found'}), 404
+            return jsonify({'success': True})
+            
+        @self.app.route('/api/alerts', methods=['GET'])
+        def get_alerts():
+            """Alertas do outbox; since_id permite consumir incrementalmente"""
+            rule_id = request.args.get('rule_id', type=int)
+            since_id = request.args.get('since_id', 0, type=int)
+            limit = request.args.get('limit', 100, type=int)
+            pending = request.args.get('pending') in ('1', 'true')
+            
+            conn = self.get_db_connection()
+            alerts = list_alerts(conn, rule_id, since_id, limit, pending)
+            conn.close()
+            return jsonify(alerts)
+            
+        @self.app.route('/api/alerts/deliver', methods=['POST'])
+        def deliver_alerts():
+            """Envia os alertas pendentes aos webhooks das regras"""
+            import requests
+            
+            conn = self.get_db_connection()
+            try:
+                result = deliver_outbox(
+                    conn, requests.Session(),
+                    max_attempts=self.watchlist_config.get("max_attempts", 5),
+                    timeout=self.watchlist_config.get("webhook_timeout", 5)
+                )
+            finally:
+                conn.close()
+            return jsonify(result)
+            
+        @self.app.route('/api/history', methods=['GET'])
+        def get_history():
+            """Histórico de um item, incluindo anúncios arquivados"""
+            name = request.args.get('name', '')
+            limit = int(request.args.get('limit', 500))
+            if not name:
+                return jsonify({'error': 'Missing name parameter'}), 400
+                
+            conn = self.get_read_connection()
+            view = open_history(conn, self.archive_path)
+            rows = conn.execute(f'''
+                SELECT * FROM {view}
+                WHERE name = ?
+                ORDER BY updated_at DESC LIMIT ?
+            ''', (name, limit)).fetchall()
+            conn.close()
+            
+            return jsonify([dict(row) for row in rows])
+            
         @self.app.route('/api/add-item', methods=['POST'])
         def add_item():
             """Adiciona um novo item manualmente"""
             data = request.json
             
-            required_fields = ['name', 'category', 'price', 'server']
-            if not all(field in data for field in required_fields):
-                return jsonify({'error': 'Missing required fields'}), 400
+            try:
+                item = validate_row(dict(data, source='manual', status='active'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
                 
             conn = self.get_db_connection()
             
             try:
-                conn.execute('''
-                    INSERT INTO market_items (
-                        name, category, price, cost, quality, server, 
-                        seller, source, timestamp, status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    data['name'], data['category'], data['price'], 
-                    data.get('cost', 0), data.get('quality'), data['server'],
-                    data.get('seller', 'manual'), 'manual', 
-                    datetime.now().isoformat(), 'active'
-                ))
-                
+                # Mesmo upsert do scraper: reenviar o mesmo anúncio atualiza em vez de duplicar
+                upsert_items(conn, [item])
                 conn.commit()
+                notify_ingest(conn, [item])
                 conn.close()
                 
                 return jsonify({'success': True, 'message': 'Item added successfully'})
@@ -189,19 +585,62 @@ class WurmMarketAPI:
                 conn.close()
                 return jsonify({'error': str(e)}), 500
                 
+        @self.app.route('/api/bulk-ingest', methods=['POST'])
+        def bulk_ingest():
+            """Ingestão em lote: corpo NDJSON ou CSV (com cabeçalho), lido em streaming
+            
+            Formato pelo Content-Type (application/x-ndjson, text/csv) ou ?format=.
+            Responde com contagens e os erros por linha.
+            """
+            format_type = request.args.get('format')
+            if not format_type:
+                content_type = request.mimetype or ''
+                format_type = 'csv' if 'csv' in content_type else 'ndjson'
+            parser = PARSERS.get(format_type)
+            if parser is None:
+                return jsonify({'error': f'Unsupported format: {format_type}'}), 400
+                
+            conn = self.get_db_connection()
+            try:
+                ingester = BulkIngester(
+                    conn, batch_size=self.ingest_batch_size, max_errors=self.ingest_max_errors,
+                    default_source=request.args.get('source', 'manual')
+                )
+                report = ingester.ingest(parser(iter_lines(request.stream)))
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+            finally:
+                conn.close()
+                
+            status = 200 if report['accepted'] or not report['rejected'] else 422
+            return jsonify(report), status
+            
         @self.app.route('/api/export', methods=['GET'])
         def export_data():
             """Exporta dados em diferentes formatos"""
             format_type = request.args.get('format', 'json')
             
-            conn = self.get_db_connection()
+            if format_type in ('parquet', 'arrow'):
+                # Colunar tipado: pandas lê direto, sem parsear JSON
+                conn = self.get_read_connection()
+                try:
+                    body = encode_table(active_listings_table(conn), format_type)
+                except RuntimeError as e:
+                    return jsonify({'error': str(e)}), 501
+                finally:
+                    conn.close()
+                return Response(body, mimetype='application/vnd.apache.arrow.file' if format_type == 'arrow'
+                                else 'application/vnd.apache.parquet',
+                                headers={'Content-Disposition': f'attachment; filename=wurm_market.{format_type}'})
+                
+            conn = self.get_read_connection()
             items = conn.execute(
                 "SELECT * FROM market_items WHERE status = 'active' ORDER BY updated_at DESC"
             ).fetchall()
             conn.close()
             
             if format_type == 'json':
-                return jsonify([dict(row) for row in items])
+                return self.json_response(row_encoder.encode_rows(items))
             elif format_type == 'csv':
                 # Implementar exportação CSV
                 pass
@@ -230,52 +669,84 @@ class WurmMarketAPI:
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
                 
+        @self.app.route('/metrics', methods=['GET'])
+        def get_metrics():
+            """Métricas no formato texto do Prometheus"""
+            return Response(metrics.registry.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+            
         @self.app.route('/')
         def serve_frontend():
-            """Serve a aplicação web"""
-            return send_from_directory('.', 'index.html')
+            """Serve a aplicação web (HTML revalidado por ETag; CSS/JS com hash no nome)"""
+            response = self.static_assets.page(request.accept_encodings)
+            if response is None:
+                return jsonify({'error': 'Frontend not found'}), 404
+            return response
             
-        @self.app.route('/<path:filename>')
-        def serve_static(filename):
-            """Serve arquivos estáticos"""
-            return send_from_directory('.', filename)
+        @self.app.route('/assets/<name>')
+        def serve_asset(name):
+            """Assets do build, só os listados no manifesto"""
+            response = self.static_assets.asset(name, request.accept_encodings)
+            if response is None:
+                return jsonify({'error': 'Asset not found'}), 404
+            return response
             
     def run(self, host='0.0.0.0', port=5000, debug=False):
         """Inicia o servidor web"""
         self.app.run(host=host, port=port, debug=debug)
+        
+    def close(self):
+        """Devolve o publicador da réplica (o último dono publica o pendente e para a thread)"""
+        if self.replica_publisher is not None:
+            release_publisher(self.replica_publisher)
+            self.replica_publisher = None
 
-def setup_scheduler():
+def setup_scheduler(config_file: str = 'config.json'):
     """Configura agendamento automático de scraping"""
-    def scheduled_scrape():
-        try:
-            from wurm_scraper import WurmMarketScraper
-            scraper = WurmMarketScraper()
-            scraper.run_full_scrape()
-            scraper.cleanup_old_data(30)
-            scraper.close()
-            print(f"Scheduled scrape completed at {datetime.now()}")
-        except Exception as e:
-            print(f"Error in scheduled scrape: {e}")
-    
-    # Agenda scraping a cada 1 hora
-    schedule.every(1).hours.do(scheduled_scrape)
+    from main import WurmMarketScraper
     
     def run_scheduler():
+        # O scraper (e a conexão sqlite dele) nasce e é usado só nesta thread; do lado de
+        # fora fica apenas o watcher, que troca o snapshot do config quando o arquivo muda
+        scraper = WurmMarketScraper(config_file)
+        scraper.watch_config()
+        
+        def scheduled_scrape():
+            try:
+                scraper.run_full_scrape()
+                scraper.cleanup_old_data(30)
+                print(f"Scheduled scrape completed at {datetime.now()}")
+            except Exception as e:
+                print(f"Error in scheduled scrape: {e}")
+        
+        interval = scraper.config.get("scrape_interval", 3600)
+        job = schedule.every(interval).seconds.do(scheduled_scrape)
         while True:
+            # scrape_interval também vale sem reiniciar
+            current = scraper.config.get("scrape_interval", 3600)
+            if current != interval:
+                schedule.cancel_job(job)
+                interval, job = current, schedule.every(current).seconds.do(scheduled_scrape)
             schedule.run_pending()
             time.sleep(60)
     
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+    scheduler_thread = threading.Thread(target=run_scheduler, name="scheduler", daemon=True)
     scheduler_thread.start()
+    return scheduler_thread
 
 if __name__ == '__main__':
-    # Cria API
-    api = WurmMarketAPI()
+    from main import WurmMarketScraper
+    
+    # Cria API a partir do mesmo config.json do scraper
+    config_file = 'config.json'
+    api = WurmMarketAPI.from_config(WurmMarketScraper.load_config(config_file))
     
     # Configura agendamento
-    setup_scheduler()
+    setup_scheduler(config_file)
     
     # Inicia servidor
     print("Starting Wurm Online Market Tracker API...")
     print("Access the web interface at: http://localhost:5000")
-    api.run(debug=True)
+    try:
+        api.run(debug=True)
+    finally:
+        api.close()